@@ -9,7 +9,7 @@ import { FileText, Upload, Plus, Grid, User, LogOut } from "lucide-react";
 import logo from "../assets/logo.png";
 
 const Dashboard = () => {
-  const { user, logout } = useAuth();
+  const { user, logout, dashboard, refreshDashboard } = useAuth();
   const [view, setView] = useState("list");
   const [selectedPrescription, setSelectedPrescription] = useState(null);
   const [refreshKey, setRefreshKey] = useState(0);
@@ -22,6 +22,7 @@ const Dashboard = () => {
   const handleSuccess = () => {
     setView("list");
     setRefreshKey((prev) => prev + 1);
+    refreshDashboard();
   };
   const handleCancel = () => setView("list");
   const handleUploadSuccess = () => setRefreshKey((prev) => prev + 1);
@@ -68,6 +69,23 @@ const Dashboard = () => {
 
       {/* Main Content */}
       <main className="max-w-7xl mx-auto py-8 px-4 sm:px-6 lg:px-8">
+        {/* Counts from the dashboard response */}
+        {view === "list" && dashboard?.counts && (
+          <div className="mb-8 grid grid-cols-2 md:grid-cols-4 gap-4">
+            {Object.entries(dashboard.counts).map(([label, count]) => (
+              <div
+                key={label}
+                className="bg-white rounded-xl shadow p-4 border border-gray-100"
+              >
+                <p className="text-xs text-gray-500 capitalize">
+                  {label.replace(/_/g, " ")}
+                </p>
+                <p className="text-2xl font-bold text-blue-900">{count}</p>
+              </div>
+            ))}
+          </div>
+        )}
+
         {/* Interactive Navigation Cards */}
         {view === "list" && (
           <div className="mb-8 grid grid-cols-1 md:grid-cols-1 gap-6">
@@ -25,9 +25,12 @@ const OCRResults = () => {
   const handleReprocess = async (id) => {
     try {
       toast.loading("Reprocessing...");
-      await ocrAPI.reprocessUpload(id);
+      const response = await ocrAPI.reprocessUpload(id);
       toast.dismiss();
-      toast.success("Reprocessed successfully");
+      // 202: a reprocess of this upload is already running
+      toast.success(
+        response.status === 202 ? "Already reprocessing; check back shortly" : "Reprocessed successfully"
+      );
       fetchUploads();
     } catch (error) {
       toast.dismiss();
@@ -64,7 +64,9 @@ const OCRUpload = ({ onUploadSuccess }) => {
     } catch (error) {
       console.error("Upload error:", error);
       toast.error(
-        error.response?.data?.error || "Failed to upload prescription"
+        error.response?.data?.error ||
+          error.response?.data?.detail ||
+          "Failed to upload prescription"
       );
     } finally {
       setUploading(false);
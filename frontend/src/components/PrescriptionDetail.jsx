@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { prescriptionAPI } from "../services/api";
 import { useAuth } from "../context/AuthContext";
 import toast from "react-hot-toast";
@@ -8,6 +8,20 @@ const PrescriptionDetail = ({ prescription, onBack }) => {
   const [loading, setLoading] = useState(false);
   const { user } = useAuth();
 
+  // List rows leave out items and notes; load the full prescription
+  useEffect(() => {
+    let cancelled = false;
+    prescriptionAPI
+      .getPrescription(prescription.id)
+      .then((response) => {
+        if (!cancelled) setCurrentPrescription(response.data);
+      })
+      .catch(() => toast.error("Failed to load prescription details"));
+    return () => {
+      cancelled = true;
+    };
+  }, [prescription.id]);
+
   const handleIssue = async () => {
     setLoading(true);
     try {
@@ -4,6 +4,7 @@ import toast from "react-hot-toast";
 
 const PrescriptionForm = ({ onSuccess, onCancel }) => {
   const [patients, setPatients] = useState([]);
+  const [patientQuery, setPatientQuery] = useState("");
   const [formData, setFormData] = useState({
     patient_id: "",
     diagnosis: "",
@@ -22,17 +23,25 @@ const PrescriptionForm = ({ onSuccess, onCancel }) => {
   const [loading, setLoading] = useState(false);
 
   useEffect(() => {
-    fetchPatients();
-  }, []);
-
-  const fetchPatients = async () => {
-    try {
-      const response = await prescriptionAPI.getPatients();
-      setPatients(response.data);
-    } catch (error) {
-      toast.error("Failed to fetch patients");
+    if (!patientQuery.trim()) {
+      setPatients([]);
+      return;
     }
-  };
+    // Debounce keystrokes; ignore responses for queries typed over since
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await prescriptionAPI.searchPatients(patientQuery);
+        if (!cancelled) setPatients(response.data);
+      } catch (error) {
+        if (!cancelled) toast.error("Failed to search patients");
+      }
+    }, 200);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [patientQuery]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -145,6 +154,13 @@ const PrescriptionForm = ({ onSuccess, onCancel }) => {
           <label className="block text-sm font-medium text-gray-700">
             Patient
           </label>
+          <input
+            type="text"
+            value={patientQuery}
+            onChange={(e) => setPatientQuery(e.target.value)}
+            placeholder="Search by username, name or phone"
+            className="mt-1 block w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-indigo-500 focus:border-indigo-500"
+          />
           <select
             name="patient_id"
             value={formData.patient_id}
@@ -152,7 +168,9 @@ const PrescriptionForm = ({ onSuccess, onCancel }) => {
             required
             className="mt-1 block w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-indigo-500 focus:border-indigo-500"
           >
-            <option value="">Select Patient</option>
+            <option value="">
+              {patientQuery.trim() ? "Select Patient" : "Type to search patients"}
+            </option>
             {patients.map((patient) => (
               <option key={patient.id} value={patient.id}>
                 {patient.first_name} {patient.last_name} ({patient.username})
@@ -6,11 +6,20 @@ import toast from "react-hot-toast";
 const PrescriptionList = ({ onSelectPrescription, onCreateNew }) => {
   const [prescriptions, setPrescriptions] = useState([]);
   const [loading, setLoading] = useState(true);
-  const { user } = useAuth();
+  const [showAll, setShowAll] = useState(false);
+  const { user, dashboard, refreshDashboard } = useAuth();
 
+  // The landing page lists the dashboard's recent prescriptions; the full list is fetched on demand
   useEffect(() => {
-    fetchPrescriptions();
-  }, []);
+    if (showAll || !dashboard) {
+      fetchPrescriptions();
+    } else {
+      setPrescriptions(dashboard.recent_prescriptions);
+      setLoading(false);
+    }
+  }, [showAll, dashboard]);
+
+  const refresh = () => (showAll ? fetchPrescriptions() : refreshDashboard());
 
   const fetchPrescriptions = async () => {
     try {
@@ -27,7 +36,7 @@ const PrescriptionList = ({ onSelectPrescription, onCreateNew }) => {
     try {
       await prescriptionAPI.issuePrescription(id);
       toast.success("Prescription issued successfully");
-      fetchPrescriptions();
+      refresh();
     } catch {
       toast.error("Failed to issue prescription");
     }
@@ -37,7 +46,7 @@ const PrescriptionList = ({ onSelectPrescription, onCreateNew }) => {
     try {
       await prescriptionAPI.fillPrescription(id);
       toast.success("Prescription filled successfully");
-      fetchPrescriptions();
+      refresh();
     } catch {
       toast.error("Failed to fill prescription");
     }
@@ -149,6 +158,17 @@ const PrescriptionList = ({ onSelectPrescription, onCreateNew }) => {
           </ul>
         </div>
       )}
+
+      {!showAll && dashboard && (
+        <div className="text-center">
+          <button
+            onClick={() => setShowAll(true)}
+            className="text-blue-600 hover:text-blue-800 text-sm font-medium"
+          >
+            Show all prescriptions
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,9 +1,12 @@
 import { createContext, useContext, useState, useEffect } from "react";
-import { authAPI } from "../services/api";
+import { authAPI, dashboardAPI } from "../services/api";
 import toast from "react-hot-toast";
 
 const AuthContext = createContext();
 
+// Rows the landing list shows before "Show all" (the endpoint allows up to 20)
+const DASHBOARD_LIMIT = 20;
+
 export const useAuth = () => {
   const context = useContext(AuthContext);
   if (!context) {
@@ -14,6 +17,7 @@ export const useAuth = () => {
 
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
+  const [dashboard, setDashboard] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -25,10 +29,12 @@ export const AuthProvider = ({ children }) => {
     }
   }, []);
 
+  // Profile, recent prescriptions and counts for the landing page in one request
   const fetchUser = async () => {
     try {
-      const response = await authAPI.getProfile();
-      setUser(response.data);
+      const response = await dashboardAPI.getDashboard(DASHBOARD_LIMIT);
+      setUser(response.data.profile);
+      setDashboard(response.data);
     } catch (error) {
       localStorage.removeItem("access_token");
       localStorage.removeItem("refresh_token");
@@ -37,6 +43,15 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
+  const refreshDashboard = async () => {
+    try {
+      const response = await dashboardAPI.getDashboard(DASHBOARD_LIMIT);
+      setDashboard(response.data);
+    } catch {
+      toast.error("Failed to refresh dashboard");
+    }
+  };
+
   const login = async (credentials) => {
     try {
       const response = await authAPI.login(credentials);
@@ -73,11 +88,14 @@ export const AuthProvider = ({ children }) => {
     localStorage.removeItem("access_token");
     localStorage.removeItem("refresh_token");
     setUser(null);
+    setDashboard(null);
     toast.success("Logged out successfully");
   };
 
   const value = {
     user,
+    dashboard,
+    refreshDashboard,
     loading,
     login,
     register,
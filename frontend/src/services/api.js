@@ -86,6 +86,10 @@ export const prescriptionAPI = {
   // Get patients list (for doctors)
   getPatients: () => api.get("/prescriptions/patients/"),
 
+  // Typeahead search over patients (for doctors)
+  searchPatients: (q, limit = 10) =>
+    api.get("/prescriptions/patients/search/", { params: { q, limit } }),
+
   // Issue prescription (doctors only)
   issuePrescription: (id) => api.post(`/prescriptions/${id}/issue/`),
 
@@ -102,9 +106,15 @@ export const ocrAPI = {
     });
   },
 
-  getUploads: () => api.get("/ocr/upload/"),
+  // The list leaves out large fields by default; the result view needs parsed_data
+  getUploads: () => api.get("/ocr/upload/", { params: { expand: "parsed_data" } }),
   getUpload: (id) => api.get(`/ocr/upload/${id}/`),
   deleteUpload: (id) => api.delete(`/ocr/upload/${id}/`),
   reprocessUpload: (id) => api.post(`/ocr/upload/${id}/reprocess/`),
 };
+
+export const dashboardAPI = {
+  // Profile, recent prescriptions, pending uploads and counts in one call
+  getDashboard: (limit = 5) => api.get("/dashboard/", { params: { limit } }),
+};
 export default api;
@@ -0,0 +1,225 @@
+"""Prescription analytics kept up to date as prescriptions change.
+
+Every prescription contributes a fixed set of counters to its doctor's
+``DoctorStats`` row (one for its status, one to ``ever_issued`` once it has
+been issued, its issue-to-fill time once filled), one ``FillTimeBucket``
+count, and one count per item to the medicine tables. Writers take a
+``snapshot`` before and after a change and ``apply`` the difference as
+``F()`` increments, so concurrent updates never overwrite each other and the
+read endpoints only ever look at a handful of pre-aggregated rows.
+
+``rebuild`` recomputes everything from scratch in batches of doctors, for
+rows written by paths that bypass ``apply`` (raw SQL, ``QuerySet.update``);
+migration ``analytics.0002`` does the same once, with its own frozen copy of
+the counting rules, so prescriptions written before the tables existed
+count too. Archived prescriptions
+(``prescriptions.archive``) still count. Changes made while a batch is being rebuilt
+can be lost, so run it when prescriptions are not being edited.
+"""
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from ocrservice.medicines import normalize_name
+from .models import DoctorMedicineCount, DoctorStats, FillTimeBucket, MedicineCount
+
+HOUR = 3600
+DAY = 24 * HOUR
+# Upper bounds (seconds) of the fill-time buckets; the last bucket is open-ended
+FILL_TIME_BOUNDS = [HOUR, 4 * HOUR, 12 * HOUR, DAY, 2 * DAY, 3 * DAY, 7 * DAY, 14 * DAY, 30 * DAY]
+STATUS_COUNTERS = ('draft', 'issued', 'filled', 'cancelled')
+
+
+def fill_time_bucket(seconds):
+    return bisect_left(FILL_TIME_BOUNDS, seconds)
+
+
+def contribution(status, issued_date, filled_date):
+    """``(counters, fill-time bucket or None)`` one prescription adds to its doctor"""
+    counters = {'total': 1}
+    if status in STATUS_COUNTERS:
+        counters[status] = 1
+    if issued_date is not None or status in ('issued', 'filled'):
+        counters['ever_issued'] = 1
+    bucket = None
+    if status == 'filled' and issued_date is not None and filled_date is not None:
+        seconds = max(0.0, (filled_date - issued_date).total_seconds())
+        counters['timed_fills'] = 1
+        counters['fill_seconds'] = seconds
+        bucket = fill_time_bucket(seconds)
+    return counters, bucket
+
+
+def snapshot(prescription, medicine_names=None, with_items=True):
+    """What ``prescription`` currently contributes, for a later ``apply``.
+
+    Item names are read from ``medicine_names`` when given, otherwise from
+    the database; ``with_items=False`` skips them for changes that cannot
+    touch items (status transitions).
+    """
+    counters, bucket = contribution(prescription.status, prescription.issued_date, prescription.filled_date)
+    medicines = None
+    if with_items:
+        if medicine_names is None:
+            medicine_names = prescription.items.values_list('medicine_name', flat=True)
+        medicines = Counter(name for name in map(normalize_name, medicine_names) if name)
+    return {'doctor_id': prescription.doctor_id, 'counters': counters, 'bucket': bucket, 'medicines': medicines}
+
+
+def _increment(model, lookup, delta):
+    """Add ``delta`` to ``count`` of the row matching ``lookup``, creating it if needed"""
+    if model.objects.filter(**lookup).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # Created concurrently since the update above
+        model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+class Delta:
+    """Accumulated per-doctor changes, written with one increment per row"""
+
+    def __init__(self):
+        self.counters = {}
+        self.buckets = Counter()
+        self.medicines = Counter()
+
+    def add(self, state, sign):
+        doctor_id = state['doctor_id']
+        counters = self.counters.setdefault(doctor_id, Counter())
+        for key, value in state['counters'].items():
+            counters[key] += sign * value
+        if state['bucket'] is not None:
+            self.buckets[doctor_id, state['bucket']] += sign
+        for name, count in (state['medicines'] or {}).items():
+            self.medicines[doctor_id, name] += sign * count
+
+    def save(self):
+        with transaction.atomic():
+            for doctor_id, counters in self.counters.items():
+                changes = {key: F(key) + value for key, value in counters.items() if value}
+                if not changes:
+                    continue
+                # Writing first keeps the transaction from starting as a reader
+                if not DoctorStats.objects.filter(doctor_id=doctor_id).update(**changes):
+                    DoctorStats.objects.get_or_create(doctor_id=doctor_id)
+                    DoctorStats.objects.filter(doctor_id=doctor_id).update(**changes)
+            for (doctor_id, bucket), delta in self.buckets.items():
+                if delta:
+                    _increment(FillTimeBucket, {'doctor_id': doctor_id, 'bucket': bucket}, delta)
+            totals = Counter()
+            for (doctor_id, name), delta in self.medicines.items():
+                if delta:
+                    _increment(DoctorMedicineCount, {'doctor_id': doctor_id, 'name': name}, delta)
+                    totals[name] += delta
+            for name, delta in totals.items():
+                if delta:
+                    _increment(MedicineCount, {'name': name}, delta)
+
+
+def apply(before, after):
+    """Record the change from snapshot ``before`` to ``after`` (either may be None)"""
+    delta = Delta()
+    if before is not None:
+        delta.add(before, -1)
+    if after is not None:
+        delta.add(after, 1)
+    delta.save()
+
+
+def record_created(prescriptions, items_per_prescription):
+    """Count freshly bulk-created prescriptions; ``items_per_prescription`` lines up with them"""
+    delta = Delta()
+    for prescription, items in zip(prescriptions, items_per_prescription):
+        delta.add(snapshot(prescription, [item.medicine_name for item in items]), 1)
+    delta.save()
+
+
+def rebuild(batch_size=500, progress=None):
+    """Recompute every analytics table from prescriptions, a batch of doctors at a time"""
+    from prescriptions.models import ArchivedPrescription, Prescription, PrescriptionItem
+
+
+    prescribing = Prescription.objects.order_by().values('doctor_id')
+    archived = ArchivedPrescription.objects.order_by().values('doctor_id')
+    with transaction.atomic():
+        # Doctors left without prescriptions
+        for model in (DoctorStats, FillTimeBucket, DoctorMedicineCount):
+            model.objects.exclude(doctor_id__in=prescribing).exclude(doctor_id__in=archived).delete()
+    doctor_ids = sorted(set(prescribing.values_list('doctor_id', flat=True).distinct())
+                        | set(archived.values_list('doctor_id', flat=True).distinct()))
+    report = {'doctors': 0, 'prescriptions': 0}
+    for start in range(0, len(doctor_ids), batch_size):
+        batch = doctor_ids[start:start + batch_size]
+        stats = {doctor_id: DoctorStats(doctor_id=doctor_id) for doctor_id in batch}
+        buckets, medicines = Counter(), Counter()
+        columns = ('doctor_id', 'status', 'issued_date', 'filled_date')
+        rows = chain(
+            Prescription.objects.filter(doctor_id__in=batch).values_list(*columns).iterator(chunk_size=5000),
+            ArchivedPrescription.objects.filter(doctor_id__in=batch).values_list(*columns).iterator(chunk_size=5000),
+        )
+        for doctor_id, status, issued_date, filled_date in rows:
+            counters, bucket = contribution(status, issued_date, filled_date)
+            row = stats[doctor_id]
+            for key, value in counters.items():
+                setattr(row, key, getattr(row, key) + value)
+            if bucket is not None:
+                buckets[doctor_id, bucket] += 1
+            report['prescriptions'] += 1
+        items = chain(
+            PrescriptionItem.objects.filter(prescription__doctor_id__in=batch)
+            .values_list('prescription__doctor_id', 'medicine_name').iterator(chunk_size=10000),
+            ((doctor_id, item.get('medicine_name', '')) for doctor_id, data in
+             ArchivedPrescription.objects.filter(doctor_id__in=batch).values_list('doctor_id', 'data')
+             .iterator(chunk_size=5000) for item in data.get('items', [])),
+        )
+        for doctor_id, name in items:
+            name = normalize_name(name)
+            if name:
+                medicines[doctor_id, name] += 1
+
+        with transaction.atomic():
+            DoctorStats.objects.filter(doctor_id__in=batch).delete()
+            FillTimeBucket.objects.filter(doctor_id__in=batch).delete()
+            DoctorMedicineCount.objects.filter(doctor_id__in=batch).delete()
+            DoctorStats.objects.bulk_create(stats.values(), batch_size=1000)
+            FillTimeBucket.objects.bulk_create([
+                FillTimeBucket(doctor_id=doctor_id, bucket=bucket, count=count)
+                for (doctor_id, bucket), count in buckets.items()
+            ], batch_size=1000)
+            DoctorMedicineCount.objects.bulk_create([
+                DoctorMedicineCount(doctor_id=doctor_id, name=name, count=count)
+                for (doctor_id, name), count in medicines.items()
+            ], batch_size=1000)
+        report['doctors'] += len(batch)
+        if progress:
+            progress(report)
+
+    with transaction.atomic():
+        MedicineCount.objects.all().delete()
+        totals = DoctorMedicineCount.objects.values_list('name').annotate(total=Sum('count')).order_by()
+        MedicineCount.objects.bulk_create([MedicineCount(name=name, count=total) for name, total in totals],
+                                          batch_size=1000)
+    return report
+
+
+def fill_time_histogram(counts):
+    """``[{'le_seconds', 'count'}]`` for ``{bucket: count}``; the open last bucket has ``le_seconds`` None"""
+    bounds = FILL_TIME_BOUNDS + [None]
+    return [{'le_seconds': bound, 'count': counts.get(index, 0)} for index, bound in enumerate(bounds)]
+
+
+def fill_time_percentile(histogram, fraction):
+    """Upper bound of the bucket holding the given fraction of fills (None: unbounded or no fills)"""
+    total = sum(bucket['count'] for bucket in histogram)
+    if not total:
+        return None
+    seen = 0
+    for bucket in histogram:
+        seen += bucket['count']
+        if seen >= fraction * total:
+            return bucket['le_seconds']
+    return None
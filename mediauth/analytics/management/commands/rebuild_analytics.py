@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.aggregates import rebuild
+
+
+class Command(BaseCommand):
+    help = ("Recompute the prescription analytics tables from scratch, streaming "
+            "prescriptions and items a batch of doctors at a time.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Doctors per transaction')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{report['doctors']} doctors, {report['prescriptions']} prescriptions")
+
+        started = time.perf_counter()
+        report = rebuild(options['batch_size'], progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt analytics for {report['doctors']} doctors and "
+            f"{report['prescriptions']} prescriptions in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,102 @@
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+import re
+from django.db import migrations
+from django.db.models import Sum
+
+# Frozen copies of analytics.aggregates and ocrservice.medicines as of this migration;
+# later changes to those modules must not change what an old database is backfilled with
+HOUR = 3600
+DAY = 24 * HOUR
+FILL_TIME_BOUNDS = [HOUR, 4 * HOUR, 12 * HOUR, DAY, 2 * DAY, 3 * DAY, 7 * DAY, 14 * DAY, 30 * DAY]
+STATUS_COUNTERS = ('draft', 'issued', 'filled', 'cancelled')
+DOSAGE_FORM_PREFIXES = ('tab', 'tabs', 'tablet', 'cap', 'caps', 'capsule', 'syp', 'syrup', 'inj', 'oint')
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(name):
+    words = NON_WORD.sub(' ', str(name or '').lower()).split()
+    if len(words) > 1 and words[0] in DOSAGE_FORM_PREFIXES:
+        words = words[1:]
+    return ' '.join(words)[:200]
+
+
+def contribution(status, issued_date, filled_date):
+    counters = {'total': 1}
+    if status in STATUS_COUNTERS:
+        counters[status] = 1
+    if issued_date is not None or status in ('issued', 'filled'):
+        counters['ever_issued'] = 1
+    bucket = None
+    if status == 'filled' and issued_date is not None and filled_date is not None:
+        seconds = max(0.0, (filled_date - issued_date).total_seconds())
+        counters['timed_fills'] = 1
+        counters['fill_seconds'] = seconds
+        bucket = bisect_left(FILL_TIME_BOUNDS, seconds)
+    return counters, bucket
+
+
+def backfill(apps, schema_editor):
+    # Prescriptions written before the analytics tables existed would otherwise count as zero
+    # until rebuild_analytics ran: doctor dashboards and the pharmacist queue read these rows
+    Prescription = apps.get_model('prescriptions', 'Prescription')
+    ArchivedPrescription = apps.get_model('prescriptions', 'ArchivedPrescription')
+    PrescriptionItem = apps.get_model('prescriptions', 'PrescriptionItem')
+    DoctorStats = apps.get_model('analytics', 'DoctorStats')
+    FillTimeBucket = apps.get_model('analytics', 'FillTimeBucket')
+    DoctorMedicineCount = apps.get_model('analytics', 'DoctorMedicineCount')
+    MedicineCount = apps.get_model('analytics', 'MedicineCount')
+
+    # Reversing is a no-op, so a re-run may find the rows of the last one
+    for model in (DoctorStats, FillTimeBucket, DoctorMedicineCount, MedicineCount):
+        model.objects.all().delete()
+
+    stats, buckets, medicines = {}, Counter(), Counter()
+    columns = ('doctor_id', 'status', 'issued_date', 'filled_date')
+    rows = chain(
+        Prescription.objects.values_list(*columns).iterator(chunk_size=5000),
+        ArchivedPrescription.objects.values_list(*columns).iterator(chunk_size=5000),
+    )
+    for doctor_id, status, issued_date, filled_date in rows:
+        counters, bucket = contribution(status, issued_date, filled_date)
+        row = stats.setdefault(doctor_id, DoctorStats(doctor_id=doctor_id))
+        for key, value in counters.items():
+            setattr(row, key, getattr(row, key) + value)
+        if bucket is not None:
+            buckets[doctor_id, bucket] += 1
+    items = chain(
+        PrescriptionItem.objects.values_list('prescription__doctor_id', 'medicine_name').iterator(chunk_size=10000),
+        ((doctor_id, item.get('medicine_name', '')) for doctor_id, data in
+         ArchivedPrescription.objects.values_list('doctor_id', 'data').iterator(chunk_size=5000)
+         for item in data.get('items', [])),
+    )
+    for doctor_id, name in items:
+        name = normalize_name(name)
+        if name:
+            medicines[doctor_id, name] += 1
+
+    DoctorStats.objects.bulk_create(stats.values(), batch_size=1000)
+    FillTimeBucket.objects.bulk_create([
+        FillTimeBucket(doctor_id=doctor_id, bucket=bucket, count=count)
+        for (doctor_id, bucket), count in buckets.items()
+    ], batch_size=1000)
+    DoctorMedicineCount.objects.bulk_create([
+        DoctorMedicineCount(doctor_id=doctor_id, name=name, count=count)
+        for (doctor_id, name), count in medicines.items()
+    ], batch_size=1000)
+    totals = DoctorMedicineCount.objects.values_list('name').annotate(total=Sum('count')).order_by()
+    MedicineCount.objects.bulk_create([MedicineCount(name=name, count=total) for name, total in totals],
+                                      batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('prescriptions', '0009_archivedprescription_source_upload'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
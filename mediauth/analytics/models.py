@@ -0,0 +1,60 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+class DoctorStats(models.Model):
+    """Running prescription counters for one doctor (see analytics.aggregates)"""
+    doctor = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='prescription_stats')
+
+    # Prescriptions by current status
+    total = models.IntegerField(default=0)
+    draft = models.IntegerField(default=0)
+    issued = models.IntegerField(default=0)
+    filled = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+
+    # Prescriptions that were ever issued, and issue-to-fill time of the filled ones
+    ever_issued = models.IntegerField(default=0)
+    timed_fills = models.IntegerField(default=0)
+    fill_seconds = models.FloatField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def fill_rate(self):
+        return round(self.filled / self.ever_issued, 4) if self.ever_issued else None
+
+    @property
+    def mean_fill_seconds(self):
+        return round(self.fill_seconds / self.timed_fills, 1) if self.timed_fills else None
+
+    def __str__(self):
+        return f"Stats for {self.doctor_id}"
+
+class FillTimeBucket(models.Model):
+    """Histogram of issue-to-fill times per doctor; bounds in analytics.aggregates"""
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fill_time_buckets')
+    bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['doctor', 'bucket']
+
+class DoctorMedicineCount(models.Model):
+    """How many prescription items a doctor wrote per normalized medicine name"""
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='medicine_counts')
+    name = models.CharField(max_length=200)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['doctor', 'name']
+        indexes = [models.Index(fields=['doctor', '-count'], name='analytics_doctor_top_idx')]
+
+class MedicineCount(models.Model):
+    """Prescription items per normalized medicine name, across all doctors"""
+    name = models.CharField(max_length=200, unique=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-count'], name='analytics_medicine_top_idx')]
@@ -0,0 +1,19 @@
+from rest_framework import serializers
+from .models import DoctorStats, MedicineCount
+
+class DoctorStatsSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='doctor.username', read_only=True)
+    fill_rate = serializers.FloatField(read_only=True)
+    mean_fill_seconds = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = DoctorStats
+        fields = [
+            'doctor', 'username', 'total', 'draft', 'issued', 'filled', 'cancelled',
+            'ever_issued', 'fill_rate', 'timed_fills', 'mean_fill_seconds', 'updated_at'
+        ]
+
+class MedicineCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MedicineCount
+        fields = ['name', 'count']
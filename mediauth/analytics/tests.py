@@ -0,0 +1,151 @@
+import importlib
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from django.apps import apps
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from mediauth.testing import IsolatedTestMixin
+from prescriptions.archive import archive_cutoff, archive_old
+from prescriptions.importer import import_records, read_records
+from prescriptions.models import Prescription
+from prescriptions.views import PrescriptionDetailView
+from users.models import User
+from . import aggregates
+from .models import DoctorMedicineCount, DoctorStats, FillTimeBucket, MedicineCount
+
+STATS_FIELDS = ('doctor_id', 'total', 'draft', 'issued', 'filled', 'cancelled', 'ever_issued', 'timed_fills')
+
+
+def item(name):
+    return {'medicine_name': name, 'dosage': '1 tab', 'frequency': 'Daily', 'duration': '5 days', 'quantity': 5,
+            'instructions': ''}
+
+
+def counts():
+    """Every analytics table, leaving out rows that count nothing"""
+    return {
+        'doctors': sorted(DoctorStats.objects.filter(total__gt=0).values_list(*STATS_FIELDS)),
+        'fill_seconds': sorted(DoctorStats.objects.filter(total__gt=0).values_list('doctor_id', 'fill_seconds')),
+        'buckets': sorted(FillTimeBucket.objects.filter(count__gt=0).values_list('doctor_id', 'bucket', 'count')),
+        'doctor_medicines': sorted(DoctorMedicineCount.objects.filter(count__gt=0)
+                                   .values_list('doctor_id', 'name', 'count')),
+        'medicines': sorted(MedicineCount.objects.filter(count__gt=0).values_list('name', 'count')),
+    }
+
+
+class IncrementalStatsTests(IsolatedTestMixin, APITestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user('doc', user_type='doctor')
+        self.other_doctor = User.objects.create_user('doc2', user_type='doctor')
+        self.patient = User.objects.create_user('pat', user_type='patient')
+        self.pharmacist = User.objects.create_user('pharm', user_type='pharmacist')
+
+    def create(self, doctor, *names):
+        self.client.force_authenticate(doctor)
+        response = self.client.post('/api/prescriptions/', {
+            'patient_id': self.patient.id, 'diagnosis': 'Flu', 'items': [item(name) for name in names],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Prescription.objects.latest('id')
+
+    def act(self, user, method, url, data=None):
+        self.client.force_authenticate(user)
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+
+    def assert_matches_rebuild(self):
+        incremental = counts()
+        aggregates.rebuild(batch_size=1)
+        self.assertEqual(counts(), incremental)
+        return incremental
+
+    def test_api_changes_match_a_rebuild(self):
+        filled = self.create(self.doctor, 'Amoxicillin', 'Tab. Ibuprofen')
+        edited = self.create(self.doctor, 'Amoxicillin')
+        cancelled = self.create(self.doctor, 'Cetirizine')
+        deleted = self.create(self.other_doctor, 'Amoxicillin')
+        self.create(self.other_doctor, 'Paracetamol')
+
+        self.act(self.doctor, 'post', f"/api/prescriptions/{filled.pk}/issue/")
+        self.act(self.pharmacist, 'post', f"/api/prescriptions/{filled.pk}/fill/")
+        self.act(self.doctor, 'patch', f"/api/prescriptions/{edited.pk}/", {'items': [item('Metformin')]})
+        self.act(self.doctor, 'post', f"/api/prescriptions/{cancelled.pk}/issue/")
+        self.act(self.doctor, 'patch', f"/api/prescriptions/{cancelled.pk}/", {'status': 'cancelled'})
+        self.act(self.other_doctor, 'delete', f"/api/prescriptions/{deleted.pk}/")
+
+        stats = self.assert_matches_rebuild()
+        self.assertIn((self.doctor.id, 3, 1, 0, 1, 1, 2, 1), stats['doctors'])
+        self.assertEqual(stats['medicines'], [('amoxicillin', 1), ('cetirizine', 1), ('ibuprofen', 1),
+                                              ('metformin', 1), ('paracetamol', 1)])
+
+        summary = self.act(User.objects.create_user('staff', is_staff=True), 'get', '/api/analytics/summary/').data
+        self.assertEqual((summary['total'], summary['filled'], summary['fill_rate']), (4, 1, 0.5))
+
+    def test_imported_and_archived_prescriptions_still_count(self):
+        long_ago = timezone.now() - timedelta(days=400)
+        records = [
+            {'doctor': 'doc', 'patient': 'pat', 'filled_by': 'pharm', 'diagnosis': 'Flu', 'status': 'filled',
+             'issued_date': (long_ago - timedelta(hours=5)).isoformat(), 'filled_date': long_ago.isoformat(),
+             'items': [item('Amoxicillin')]},
+            {'doctor': 'doc2', 'patient': 'pat', 'diagnosis': 'Cold', 'status': 'draft',
+             'items': [item('Paracetamol'), item('Paracetamol')]},
+        ]
+        source = io.BytesIO(''.join(json.dumps(record) + '\n' for record in records).encode())
+        self.assertEqual(import_records(read_records(source))['imported'], 2)
+        Prescription.objects.filter(status='filled').update(updated_at=long_ago)
+        self.assertEqual(archive_old(archive_cutoff(180))['archived'], 1)
+
+        stats = self.assert_matches_rebuild()
+        self.assertEqual(stats['buckets'], [(self.doctor.id, aggregates.fill_time_bucket(5 * 3600), 1)])
+        self.assertEqual(stats['medicines'], [('amoxicillin', 1), ('paracetamol', 2)])
+
+    def test_backfill_migration_counts_like_apply(self):
+        filled = self.create(self.doctor, 'Amoxicillin', 'Tab. Ibuprofen')
+        self.create(self.other_doctor, 'Amoxicillin')
+        self.act(self.doctor, 'post', f"/api/prescriptions/{filled.pk}/issue/")
+        self.act(self.pharmacist, 'post', f"/api/prescriptions/{filled.pk}/fill/")
+        Prescription.objects.filter(pk=filled.pk).update(updated_at=timezone.now() - timedelta(days=400))
+        self.assertEqual(archive_old(archive_cutoff(180))['archived'], 1)
+        incremental = counts()
+        # Rows a previous run left behind are replaced, not added to
+        DoctorStats.objects.filter(doctor=self.doctor).update(total=99)
+
+        importlib.import_module('analytics.migrations.0002_backfill').backfill(apps, None)
+        self.assertEqual(counts(), incremental)
+
+    def test_rebuild_repairs_counts_written_around_apply(self):
+        prescription = self.create(self.doctor, 'Amoxicillin')
+        # Bypasses apply, so the counters still say draft
+        Prescription.objects.filter(pk=prescription.pk).update(status='cancelled')
+        self.assertEqual(counts()['doctors'], [(self.doctor.id, 1, 1, 0, 0, 0, 0, 0)])
+        aggregates.rebuild()
+        self.assertEqual(counts()['doctors'], [(self.doctor.id, 1, 0, 0, 0, 1, 0, 0)])
+
+    def test_racing_fills_and_deletes_count_once(self):
+        prescription = self.create(self.doctor, 'Amoxicillin')
+        self.act(self.doctor, 'post', f"/api/prescriptions/{prescription.pk}/issue/")
+        # What a second pharmacist read before the first one's fill committed
+        stale = Prescription.objects.get(pk=prescription.pk)
+        self.act(self.pharmacist, 'post', f"/api/prescriptions/{prescription.pk}/fill/")
+        with mock.patch('prescriptions.views.get_object_or_404', return_value=stale):
+            self.assertEqual(self.client.post(f"/api/prescriptions/{prescription.pk}/fill/").status_code, 409)
+        self.assertEqual(self.client.post(f"/api/prescriptions/{prescription.pk}/fill/").status_code, 404)
+        self.assertIn((self.doctor.id, 1, 0, 0, 1, 0, 1, 1), self.assert_matches_rebuild()['doctors'])
+
+        draft = self.create(self.doctor, 'Ibuprofen')
+        stale = Prescription.objects.get(pk=draft.pk)
+        self.act(self.doctor, 'delete', f"/api/prescriptions/{draft.pk}/")
+        with mock.patch.object(PrescriptionDetailView, 'get_object', return_value=stale):
+            self.act(self.doctor, 'delete', f"/api/prescriptions/{draft.pk}/")
+        self.assertIn((self.doctor.id, 1, 0, 0, 1, 0, 1, 1), self.assert_matches_rebuild()['doctors'])
+
+    def test_racing_issue_counts_once(self):
+        prescription = self.create(self.doctor, 'Amoxicillin')
+        stale = Prescription.objects.get(pk=prescription.pk)
+        self.act(self.doctor, 'post', f"/api/prescriptions/{prescription.pk}/issue/")
+        with mock.patch('prescriptions.views.get_object_or_404', return_value=stale):
+            self.assertEqual(self.client.post(f"/api/prescriptions/{prescription.pk}/issue/").status_code, 409)
+        self.assertEqual(self.assert_matches_rebuild()['doctors'], [(self.doctor.id, 1, 0, 1, 0, 0, 1, 0)])
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('summary/', views.summary, name='analytics-summary'),
+    path('doctors/', views.doctor_stats_list, name='analytics-doctors'),
+    path('doctors/<int:doctor_id>/', views.doctor_stats_detail, name='analytics-doctor-detail'),
+    path('medicines/', views.top_medicines, name='analytics-medicines'),
+]
@@ -0,0 +1,102 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from django.shortcuts import get_object_or_404
+from .aggregates import fill_time_histogram, fill_time_percentile
+from .models import DoctorMedicineCount, DoctorStats, FillTimeBucket, MedicineCount
+from .serializers import DoctorStatsSerializer, MedicineCountSerializer
+
+User = get_user_model()
+
+ORDERINGS = ('total', 'issued', 'filled', 'ever_issued', 'timed_fills')
+MAX_LIMIT = 500
+
+def _limit(request, default):
+    try:
+        return max(1, min(int(request.query_params.get('limit', default)), MAX_LIMIT))
+    except ValueError:
+        return None
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def doctor_stats_list(request):
+    """Per-doctor prescription counters, busiest first (staff only)"""
+    if not request.user.is_staff:
+        return Response({'error': 'Only staff can view analytics'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    limit = _limit(request, 50)
+    order = request.query_params.get('order', 'total')
+    if limit is None or order not in ORDERINGS:
+        return Response({'error': f"limit must be an integer and order one of: {', '.join(ORDERINGS)}"},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    rows = DoctorStats.objects.select_related('doctor').order_by(f"-{order}", 'doctor_id')[:limit]
+    return Response(DoctorStatsSerializer(rows, many=True).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def doctor_stats_detail(request, doctor_id):
+    """Counters, fill-time histogram and top medicines for one doctor (staff or the doctor)"""
+    if not request.user.is_staff and request.user.id != doctor_id:
+        return Response({'error': 'Doctors can only view their own analytics'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    limit = _limit(request, 10)
+    if limit is None:
+        return Response({'error': 'limit must be an integer'},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    doctor = get_object_or_404(User, pk=doctor_id, user_type='doctor')
+    stats = DoctorStats.objects.filter(doctor=doctor).first() or DoctorStats(doctor=doctor)
+    histogram = fill_time_histogram(dict(
+        FillTimeBucket.objects.filter(doctor=doctor).values_list('bucket', 'count')
+    ))
+    top = DoctorMedicineCount.objects.filter(doctor=doctor, count__gt=0).order_by('-count', 'name')[:limit]
+
+    data = dict(DoctorStatsSerializer(stats).data)
+    data['fill_time'] = {
+        'histogram': histogram,
+        'p50_le_seconds': fill_time_percentile(histogram, 0.5),
+        'p90_le_seconds': fill_time_percentile(histogram, 0.9),
+    }
+    data['top_medicines'] = [{'name': row.name, 'count': row.count} for row in top]
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def top_medicines(request):
+    """Most prescribed medicines across all doctors"""
+    if not request.user.is_staff and request.user.user_type != 'doctor':
+        return Response({'error': 'Only staff and doctors can view medicine analytics'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    limit = _limit(request, 20)
+    if limit is None:
+        return Response({'error': 'limit must be an integer'},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    rows = MedicineCount.objects.filter(count__gt=0).order_by('-count', 'name')[:limit]
+    return Response(MedicineCountSerializer(rows, many=True).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def summary(request):
+    """Totals over all doctors (staff only)"""
+    if not request.user.is_staff:
+        return Response({'error': 'Only staff can view analytics'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    totals = DoctorStats.objects.aggregate(
+        **{field: Sum(field) for field in ('total', 'draft', 'issued', 'filled', 'cancelled',
+                                           'ever_issued', 'timed_fills', 'fill_seconds')}
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+    fill_seconds = totals.pop('fill_seconds')
+    totals['fill_rate'] = round(totals['filled'] / totals['ever_issued'], 4) if totals['ever_issued'] else None
+    totals['mean_fill_seconds'] = round(fill_seconds / totals['timed_fills'], 1) if totals['timed_fills'] else None
+    totals['doctors'] = DoctorStats.objects.count()
+    return Response(totals)
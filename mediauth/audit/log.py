@@ -0,0 +1,357 @@
+"""Append-only, hash-chained trail of prescription changes.
+
+Writers build an ``event`` from the prescription's state before and after
+a change and ``record`` it. Recording appends one JSON line to this
+process's journal file (fsynced with ``AUDIT_LOG['FSYNC']``) and queues the
+event in memory; a background thread stores queued events with one bulk
+insert once ``BATCH_SIZE`` are waiting, or every ``FLUSH_SECONDS``, and then
+deletes the journal segments they came from. A request pays for a file
+append, not a database write, and an event is never only in memory.
+
+Stored events get a sequence number and the SHA-256 of the previous
+event's hash plus their own content, assigned while holding the
+``AuditChainHead`` row, so changing, removing or reordering stored events
+breaks the chain (``verify_chain``). Segments of processes that died before
+flushing are replayed by ``recover_journals``, which each process runs
+before its first flush and ``flush_audit_log`` runs on demand; events that
+were already stored are recognised by ``event_id`` and skipped.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from itertools import count
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from pathlib import Path
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AuditChainHead, AuditEvent
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = '0' * 64
+# Prescription fields whose changes are recorded, plus a digest of the items
+TRACKED_FIELDS = ('patient_id', 'diagnosis', 'notes', 'status', 'issued_date', 'filled_by_id', 'filled_date')
+HASHED_FIELDS = ('sequence', 'event_id', 'occurred_at', 'action', 'prescription_pk', 'prescription_id',
+                 'actor_id', 'changes')
+# Seconds between attempts while another writer holds the database
+STORE_RETRY_DELAYS = (0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+def _json(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+
+
+def prescription_state(prescription, items=None, with_items=True):
+    """Audited values of ``prescription``; items are read from the database unless given"""
+    from prescriptions.tokens import items_digest
+
+    state = {field: getattr(prescription, field) for field in TRACKED_FIELDS}
+    if with_items:
+        state['items'] = items_digest(prescription.items.all() if items is None else items)
+    # Plain JSON values, as they will be stored
+    return json.loads(_json(state))
+
+
+def changes(before, after):
+    """``{field: [old, new]}`` for the fields that differ; either state may be None"""
+    before, after = before or {}, after or {}
+    return {
+        field: [before.get(field), after.get(field)]
+        for field in sorted(set(before) | set(after)) if before.get(field) != after.get(field)
+    }
+
+
+def event(action, prescription, actor, before=None, after=None):
+    """An event for ``prescription``, to be passed to ``record`` once the change is saved"""
+    return {
+        'event_id': str(uuid.uuid4()),
+        'occurred_at': timezone.now().isoformat(),
+        'action': action,
+        'prescription_pk': prescription.pk,
+        'prescription_id': prescription.prescription_id,
+        'actor_id': actor.pk if actor is not None else None,
+        'changes': changes(before, after),
+    }
+
+
+def event_hash(previous_hash, event):
+    content = _json({field: event[field] for field in HASHED_FIELDS})
+    return hashlib.sha256(f"{previous_hash}{content}".encode()).hexdigest()
+
+
+def stored_event(row):
+    """The event an ``AuditEvent`` row was hashed from"""
+    return {
+        'sequence': row.sequence,
+        'event_id': str(row.event_id),
+        'occurred_at': row.occurred_at.isoformat(),
+        'action': row.action,
+        'prescription_pk': row.prescription_pk,
+        'prescription_id': row.prescription_id,
+        'actor_id': row.actor_id,
+        'changes': row.changes,
+    }
+
+
+def store(events):
+    """Append ``events`` to the chain in one transaction, skipping stored ones; returns how many were new"""
+    if not events:
+        return 0
+    with transaction.atomic():
+        # Writing the head first takes its lock (a row lock, or SQLite's write lock)
+        # before it is read, so concurrent flushes extend the chain one after another
+        AuditChainHead.objects.filter(pk=1).update(sequence=F('sequence'))
+        head = AuditChainHead.objects.get(pk=1)
+        seen = {str(event_id) for event_id in AuditEvent.objects.filter(
+            event_id__in=[event['event_id'] for event in events]).values_list('event_id', flat=True)}
+        sequence, previous, rows = head.sequence, head.hash, []
+        for pending in events:
+            if pending['event_id'] in seen:
+                continue
+            seen.add(pending['event_id'])
+            sequence += 1
+            digest = event_hash(previous, {**pending, 'sequence': sequence})
+            rows.append(AuditEvent(
+                sequence=sequence,
+                event_id=pending['event_id'],
+                occurred_at=parse_datetime(pending['occurred_at']),
+                action=pending['action'],
+                prescription_pk=pending['prescription_pk'],
+                prescription_id=pending['prescription_id'],
+                actor_id=pending['actor_id'],
+                changes=pending['changes'],
+                previous_hash=previous,
+                hash=digest,
+            ))
+            previous = digest
+        AuditEvent.objects.bulk_create(rows, batch_size=1000)
+        AuditChainHead.objects.filter(pk=1).update(sequence=sequence, hash=previous)
+    return len(rows)
+
+
+def store_retrying(events):
+    """``store``, waiting out a database that is locked by other writers"""
+    for delay in STORE_RETRY_DELAYS:
+        try:
+            return store(events)
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            logger.info("Audit store found the database locked; retrying in %ss", delay)
+            time.sleep(delay)
+    return store(events)
+
+
+def read_segment(path):
+    events = []
+    with open(path, 'rb') as handle:
+        for line in handle:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # The last line of a crashed process may be torn; it was never acknowledged
+                logger.warning("Skipping unreadable line in audit journal %s", path)
+    return events
+
+
+def _lock(handle, blocking=True):
+    """Exclusive lock on an open file; False if another process holds it"""
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _segment_order(path):
+    owner, _, number = path.stem.rpartition('-')
+    return owner, int(number) if number.isdigit() else 0
+
+
+def recover_journals(everything=False):
+    """Store events from journal segments of processes that are gone; returns events stored.
+
+    Every process holds a lock on its ``<owner>.lock`` file while it lives,
+    so segments whose owner's lock can be taken were abandoned. Without
+    ``fcntl`` (Windows) liveness cannot be told and nothing is recovered
+    unless ``everything`` is set, which takes every other process's segments
+    and must only be used while nothing else writes audit events.
+    """
+    directory = Path(settings.AUDIT_LOG['JOURNAL_DIR'])
+    if not directory.is_dir():
+        return 0
+    # Owners that exited cleanly leave only their lock file behind
+    owners = {path.stem: [] for path in directory.glob('*.lock')}
+    for path in sorted(directory.glob('*.jsonl'), key=_segment_order):
+        owners.setdefault(path.stem.rpartition('-')[0], []).append(path)
+    stored = 0
+    for owner, segments in owners.items():
+        if owner == buffer.owner:
+            continue
+        lock_path = directory / f"{owner}.lock"
+        with open(lock_path, 'ab') as lock:
+            if not everything and (fcntl is None or not _lock(lock, blocking=False)):
+                continue
+            for path in segments:
+                try:
+                    events = read_segment(path)
+                except FileNotFoundError:
+                    continue  # Recovered by another process meanwhile
+                stored += store_retrying(events)
+                path.unlink(missing_ok=True)
+        lock_path.unlink(missing_ok=True)
+    return stored
+
+
+class AuditBuffer:
+    """Journal plus in-memory queue of events waiting to be stored, one per process"""
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []
+        self._segment = None     # (path, file) being appended to
+        self._sealed = []        # closed segments whose events are in _pending
+        self._numbers = count()
+        # Journal files of this process are named after it and guarded by its lock file
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._owner_locks = {}
+        self._thread = None
+        self._recovered = False
+
+    def _check_fork(self):
+        # A forked worker starts afresh; the parent's events are in the parent's journal
+        if self._pid != os.getpid():
+            # Closing the inherited copies leaves the parent's lock held
+            for handle in [*self._owner_locks.values(), *(self._segment[1:] if self._segment else ())]:
+                handle.close()
+            self.__init__()
+
+    def _open_segment(self):
+        directory = Path(settings.AUDIT_LOG['JOURNAL_DIR'])
+        directory.mkdir(parents=True, exist_ok=True)
+        if directory not in self._owner_locks:
+            lock = open(directory / f"{self.owner}.lock", 'ab')
+            if fcntl is not None:
+                _lock(lock)
+            self._owner_locks[directory] = lock
+        path = directory / f"{self.owner}-{next(self._numbers)}.jsonl"
+        return path, open(path, 'ab', buffering=0)
+
+    def _start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='mediauth-audit', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_logged)
+
+    def record(self, *events):
+        """Journal ``events`` and queue them for storing"""
+        if not events:
+            return
+        self._check_fork()
+        data = b''.join((_json(pending) + '\n').encode() for pending in events)
+        with self._lock:
+            if self._segment is None:
+                self._segment = self._open_segment()
+            handle = self._segment[1]
+            handle.write(data)
+            if settings.AUDIT_LOG['FSYNC']:
+                os.fsync(handle.fileno())
+            self._pending.extend(events)
+            full = len(self._pending) >= settings.AUDIT_LOG['BATCH_SIZE']
+            self._start_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Store everything queued so far; returns how many events were stored"""
+        self._check_fork()
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+                if self._segment is not None:
+                    self._segment[1].close()
+                    self._sealed.append(self._segment[0])
+                    self._segment = None
+                segments, self._sealed = self._sealed, []
+            if not events and not segments:
+                return 0
+            try:
+                if not self._recovered:
+                    recover_journals()
+                    self._recovered = True
+                stored = store_retrying(events)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = events
+                    self._sealed[:0] = segments
+                raise
+            for path in segments:
+                path.unlink(missing_ok=True)
+            return stored
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Storing audit events failed; they stay journaled and are retried")
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUDIT_LOG['FLUSH_SECONDS'])
+            self._wake.clear()
+            self._flush_logged()
+            # Connections are not reused across flushes, so settings changes
+            # (another database under a benchmark) are picked up
+            connection.close()
+
+
+buffer = AuditBuffer()
+
+
+def record(*events):
+    buffer.record(*events)
+
+
+def flush():
+    return buffer.flush()
+
+
+def verify_chain(chunk_size=5000):
+    """Recompute the chain; ``{'events', 'ok', 'broken_at', 'reason'}``"""
+    previous, expected = GENESIS_HASH, 1
+    for row in AuditEvent.objects.order_by('sequence').iterator(chunk_size=chunk_size):
+        reason = None
+        if row.sequence != expected:
+            reason = f"missing sequence {expected}"
+        elif row.previous_hash != previous:
+            reason = 'previous hash does not match'
+        elif event_hash(previous, stored_event(row)) != row.hash:
+            reason = 'content does not match its hash'
+        if reason:
+            return {'events': expected - 1, 'ok': False, 'broken_at': row.sequence, 'reason': reason}
+        previous, expected = row.hash, expected + 1
+    head = AuditChainHead.objects.get(pk=1)
+    if head.sequence != expected - 1 or head.hash != previous:
+        return {'events': expected - 1, 'ok': False, 'broken_at': expected,
+                'reason': f"chain head is at #{head.sequence}; events after #{expected - 1} are missing"}
+    return {'events': expected - 1, 'ok': True, 'broken_at': None, 'reason': None}
@@ -0,0 +1,88 @@
+import time
+from contextlib import nullcontext
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from audit import log as audit_log
+from audit.models import AuditEvent
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from prescriptions.models import Prescription
+
+
+def synchronous_record(*events):
+    """What a naive audit log does: store each event before the response is sent"""
+    audit_log.store(list(events))
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the audit log: latency the issue endpoint pays with no audit log, with "
+            "synchronous inserts and with the buffered journal, plus bulk storing throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Prescriptions issued per mode')
+        parser.add_argument('--events', type=int, default=20000, help='Events stored per batch size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def issue_latency(self, client, pks):
+        samples = []
+        for pk in pks:
+            started = time.perf_counter()
+            response = client.post(f"/api/prescriptions/{pk}/issue/")
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return summarize(samples)
+
+    def store_throughput(self, doctor, total, batch_size):
+        prescription = Prescription.objects.filter(doctor=doctor).first()
+        events = [audit_log.event('updated', prescription, doctor, {'notes': ''}, {'notes': str(index)})
+                  for index in range(total)]
+        started = time.perf_counter()
+        for start in range(0, total, batch_size):
+            audit_log.store(events[start:start + batch_size])
+        elapsed = time.perf_counter() - started
+        return {'batch_size': batch_size, 'events_per_second': round(total / elapsed, 1)}
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        modes = {
+            'no_audit_log': ({}, mock.patch.object(audit_log, 'record', lambda *events: None)),
+            'synchronous_insert': ({}, mock.patch.object(audit_log, 'record', synchronous_record)),
+            'buffered': ({'FSYNC': False}, nullcontext()),
+            'buffered_fsync': ({'FSYNC': True}, nullcontext()),
+        }
+        with isolated_environment():
+            dataset = generate_dataset(doctors=1, patients=50, pharmacists=0,
+                                       prescriptions=iterations * (len(modes) + 1), uploads=0,
+                                       seed=options['seed'])
+            doctor = dataset['doctor'][0]
+            Prescription.objects.update(status='draft', issued_date=None, filled_date=None, filled_by=None)
+            pks = list(Prescription.objects.order_by('pk').values_list('pk', flat=True))
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(doctor).access_token}")
+            self.issue_latency(client, pks[-iterations:][:20])  # warm-up
+
+            endpoints = {}
+            for index, (mode, (overrides, patch)) in enumerate(modes.items()):
+                with override_settings(AUDIT_LOG={**settings.AUDIT_LOG, **overrides}), patch:
+                    endpoints[mode] = self.issue_latency(client, pks[index * iterations:][:iterations])
+                    audit_log.flush()
+
+            throughput = [self.store_throughput(doctor, options['events'], size) for size in (1, 50, 200, 1000)]
+            chain = audit_log.verify_chain()
+            stored = AuditEvent.objects.count()
+
+        write_report({
+            'benchmark': 'audit_log',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('iterations', 'events', 'seed')},
+            'issue_latency_ms': endpoints,
+            'store_throughput': throughput,
+            'chain': {**chain, 'stored': stored},
+        }, options['output'], self.stdout)
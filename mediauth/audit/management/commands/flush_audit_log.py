@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from audit.log import recover_journals
+
+
+class Command(BaseCommand):
+    help = ("Store audit events left in the journal by processes that exited or crashed "
+            "before flushing them. Run after a crash, or periodically.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Also take segments whose owner looks alive (only while the app is stopped)")
+
+    def handle(self, *args, **options):
+        stored = recover_journals(everything=options['all'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} journaled audit events"))
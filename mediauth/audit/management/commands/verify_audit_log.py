@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.log import verify_chain
+
+
+class Command(BaseCommand):
+    help = "Recompute the audit log's hash chain and report the first event that does not match."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        report = verify_chain()
+        elapsed = time.perf_counter() - started
+        if not report['ok']:
+            raise CommandError(
+                f"Audit chain broken at #{report['broken_at']}: {report['reason']} "
+                f"({report['events']} events verified before it)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Verified {report['events']} audit events in {elapsed:.1f}s"))
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:51
+
+from django.db import migrations, models
+
+
+def create_chain_head(apps, schema_editor):
+    apps.get_model('audit', 'AuditChainHead').objects.create(pk=1, sequence=0, hash='0' * 64)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditChainHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.BigIntegerField(default=0)),
+                ('hash', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.BigIntegerField(unique=True)),
+                ('event_id', models.UUIDField(unique=True)),
+                ('occurred_at', models.DateTimeField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('issued', 'Issued'), ('filled', 'Filled'), ('cancelled', 'Cancelled'), ('deleted', 'Deleted'), ('archived', 'Archived'), ('restored', 'Restored')], max_length=20)),
+                ('prescription_pk', models.BigIntegerField(db_index=True)),
+                ('prescription_id', models.CharField(db_index=True, max_length=20)),
+                ('actor_id', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('changes', models.JSONField(default=dict)),
+                ('previous_hash', models.CharField(max_length=64)),
+                ('hash', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(create_chain_head, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+from django.db import models
+
+class AuditEvent(models.Model):
+    """One prescription change, hash-chained to the one before it (see audit.log)"""
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('issued', 'Issued'),
+        ('filled', 'Filled'),
+        ('cancelled', 'Cancelled'),
+        ('deleted', 'Deleted'),
+        ('archived', 'Archived'),
+        ('restored', 'Restored'),
+    ]
+    
+    # Position in the chain, assigned when the event is stored
+    sequence = models.BigIntegerField(unique=True)
+    # Assigned when the event happens, so replaying a journal never stores it twice
+    event_id = models.UUIDField(unique=True)
+    occurred_at = models.DateTimeField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    
+    # Plain values rather than foreign keys: the trail outlives prescriptions and accounts
+    prescription_pk = models.BigIntegerField(db_index=True)
+    prescription_id = models.CharField(max_length=20, db_index=True)
+    actor_id = models.IntegerField(null=True, blank=True, db_index=True)
+    # {field: [old, new]} for the fields that changed
+    changes = models.JSONField(default=dict)
+    
+    previous_hash = models.CharField(max_length=64)
+    hash = models.CharField(max_length=64)
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Audit events are append-only")
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError("Audit events are append-only")
+    
+    def __str__(self):
+        return f"#{self.sequence} {self.prescription_id} {self.action}"
+
+class AuditChainHead(models.Model):
+    """Sequence and hash of the newest stored event; the single row is locked while storing"""
+    sequence = models.BigIntegerField(default=0)
+    hash = models.CharField(max_length=64)
+    
+    def __str__(self):
+        return f"#{self.sequence} {self.hash[:12]}"
@@ -0,0 +1,10 @@
+from rest_framework import serializers
+from .models import AuditEvent
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = [
+            'sequence', 'event_id', 'occurred_at', 'action', 'prescription_pk', 'prescription_id',
+            'actor_id', 'changes', 'previous_hash', 'hash'
+        ]
@@ -0,0 +1,106 @@
+import fcntl
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from django.conf import settings
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from mediauth.testing import IsolatedTestMixin
+from prescriptions.models import Prescription
+from users.models import User
+from . import log as audit_log
+from .models import AuditEvent
+
+
+def events(count, action='updated'):
+    prescription = SimpleNamespace(pk=1, prescription_id='RX1')
+    return [audit_log.event(action, prescription, None, {'notes': ''}, {'notes': f"note {index}"})
+            for index in range(count)]
+
+
+class ChainTests(TestCase):
+    def setUp(self):
+        self.assertEqual(audit_log.store(events(5)), 5)
+
+    def test_stored_events_form_a_verified_chain(self):
+        self.assertEqual(audit_log.verify_chain(chunk_size=2),
+                         {'events': 5, 'ok': True, 'broken_at': None, 'reason': None})
+        self.assertEqual(list(AuditEvent.objects.order_by('sequence').values_list('sequence', flat=True)),
+                         [1, 2, 3, 4, 5])
+
+    def test_storing_an_event_again_is_a_no_op(self):
+        replayed = events(1)
+        audit_log.store(replayed)
+        self.assertEqual(audit_log.store(replayed), 0)
+        self.assertTrue(audit_log.verify_chain()['ok'])
+
+    def test_changed_content_breaks_the_chain(self):
+        AuditEvent.objects.filter(sequence=3).update(changes={'notes': ['', 'forged']})
+        self.assertEqual(audit_log.verify_chain(),
+                         {'events': 2, 'ok': False, 'broken_at': 3, 'reason': 'content does not match its hash'})
+
+    def test_removed_events_break_the_chain(self):
+        AuditEvent.objects.filter(sequence=2).delete()
+        self.assertEqual(audit_log.verify_chain()['reason'], 'missing sequence 2')
+
+    def test_removing_the_newest_events_is_noticed(self):
+        AuditEvent.objects.filter(sequence__gte=4).delete()
+        result = audit_log.verify_chain()
+        self.assertEqual((result['ok'], result['broken_at']), (False, 4))
+
+    def test_events_are_append_only(self):
+        row = AuditEvent.objects.get(sequence=1)
+        with self.assertRaises(ValueError):
+            row.save()
+        with self.assertRaises(ValueError):
+            row.delete()
+
+
+class JournalTests(IsolatedTestMixin, APITestCase):
+    def setUp(self):
+        self.journal = Path(settings.AUDIT_LOG['JOURNAL_DIR'])
+        self.journal.mkdir(parents=True, exist_ok=True)
+
+    def write_segment(self, owner, number, pending, torn=False):
+        path = self.journal / f"{owner}-{number}.jsonl"
+        text = ''.join(json.dumps(event) + '\n' for event in pending)
+        path.write_text(text + ('{"event_id": "torn' if torn else ''))
+        (self.journal / f"{owner}.lock").touch()
+        return path
+
+    def test_segments_of_dead_processes_are_recovered_once(self):
+        first, second = events(3), events(2)
+        paths = [self.write_segment('gone-1', 0, first), self.write_segment('gone-1', 1, second, torn=True)]
+        # The crashed process had already stored one event before dying
+        audit_log.store(first[:1])
+        with self.assertLogs('audit.log', 'WARNING'):
+            self.assertEqual(audit_log.recover_journals(), 4)
+        self.assertEqual(AuditEvent.objects.count(), 5)
+        self.assertTrue(audit_log.verify_chain()['ok'])
+        self.assertFalse(any(path.exists() for path in paths))
+        self.assertFalse((self.journal / 'gone-1.lock').exists())
+
+    def test_segments_of_live_processes_are_left_alone(self):
+        path = self.write_segment('alive-1', 0, events(2))
+        with open(self.journal / 'alive-1.lock', 'ab') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            self.assertEqual(audit_log.recover_journals(), 0)
+            self.assertTrue(path.exists())
+        self.assertEqual(audit_log.recover_journals(), 2)
+
+    def test_requests_journal_events_until_they_are_flushed(self):
+        doctor = User.objects.create_user('doc', user_type='doctor')
+        prescription = Prescription.objects.create(doctor=doctor, patient=User.objects.create_user(
+            'pat', user_type='patient'), diagnosis='Flu')
+        self.client.force_authenticate(doctor)
+        self.client.post(f"/api/prescriptions/{prescription.pk}/issue/")
+        self.assertEqual(audit_log.buffer.pending(), 1)
+        journaled = [event for path in self.journal.glob('*.jsonl') for event in audit_log.read_segment(path)]
+        self.assertEqual([event['action'] for event in journaled], ['issued'])
+        self.assertFalse(AuditEvent.objects.exists())
+
+        audit_log.flush()
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.action, event.prescription_pk, event.actor_id), ('issued', prescription.pk, doctor.id))
+        self.assertEqual(event.changes['status'], ['draft', 'issued'])
+        self.assertEqual(list(self.journal.glob('*.jsonl')), [])
@@ -0,0 +1,38 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .models import AuditEvent
+from .serializers import AuditEventSerializer
+
+MAX_LIMIT = 500
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def event_list(request):
+    """Stored audit events in chain order, filtered by ?prescription= or ?actor= (staff only)"""
+    if not request.user.is_staff:
+        return Response({'error': 'Only staff can view the audit log'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = max(1, min(int(request.query_params.get('limit', 100)), MAX_LIMIT))
+        actor = request.query_params.get('actor')
+        actor = int(actor) if actor else None
+    except ValueError:
+        return Response({'error': 'after, limit and actor must be integers'},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    events = AuditEvent.objects.filter(sequence__gt=after)
+    if request.query_params.get('prescription'):
+        events = events.filter(prescription_id=request.query_params['prescription'])
+    if actor is not None:
+        events = events.filter(actor_id=actor)
+    # Events are stored in batches, so the newest may take a moment to appear
+    rows = list(events.order_by('sequence')[:limit])
+    return Response({
+        'events': AuditEventSerializer(rows, many=True).data,
+        # Pass as ?after= for the next page
+        'next_after': rows[-1].sequence if len(rows) == limit else None,
+    })
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MediauthConfig(AppConfig):
+    """Project-wide hooks that do not belong to a feature app"""
+    name = "mediauth"
+
+    def ready(self):
+        from .database import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='mediauth.configure_connection')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mediauth.settings")
+# Tells app configs this process serves requests (see users.apps.serving)
+os.environ["MEDIAUTH_SERVER"] = "1"
 
 application = get_asgi_application()
@@ -0,0 +1,95 @@
+"""Helpers shared by the benchmark management commands."""
+import json
+import math
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies_ms):
+    """Latency summary (milliseconds) used by every benchmark report"""
+    if not latencies_ms:
+        return {'count': 0}
+    return {
+        'count': len(latencies_ms),
+        'min': round(min(latencies_ms), 3),
+        'mean': round(sum(latencies_ms) / len(latencies_ms), 3),
+        'p50': round(percentile(latencies_ms, 50), 3),
+        'p95': round(percentile(latencies_ms, 95), 3),
+        'p99': round(percentile(latencies_ms, 99), 3),
+        'max': round(max(latencies_ms), 3),
+    }
+
+
+@contextmanager
+def isolated_environment(alias='default'):
+    """Run against a throwaway SQLite database and media directory.
+
+    Benchmarks create users, uploads and files; none of that should touch
+    the development database or MEDIA_ROOT. Audit events are journaled in
+    the work directory and stored before the database goes away. Throttling
+    is off, so repeated requests measure the endpoints rather than the 429s.
+    """
+    from audit import log as audit_log
+
+    # Events from before belong to the real database
+    audit_log.flush()
+    workdir = Path(tempfile.mkdtemp(prefix='mediauth-bench-'))
+    connection = connections[alias]
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    previous_test_name = test_settings.get('NAME')
+    test_settings['NAME'] = str(workdir / 'bench.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(MEDIA_ROOT=str(workdir / 'media'),
+                               AUDIT_LOG={**settings.AUDIT_LOG, 'JOURNAL_DIR': str(workdir / 'audit')},
+                               THROTTLING={**settings.THROTTLING, 'ENABLED': False}):
+            try:
+                yield workdir
+            finally:
+                audit_log.flush()
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        test_settings['NAME'] = previous_test_name
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def write_report(report, output=None, stdout=None):
+    """Write a JSON report to a file, or to stdout when no path is given"""
+    text = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if output:
+        Path(output).write_text(text + '\n')
+    elif stdout is not None:
+        stdout.write(text)
+    return text
+
+
+def describe_environment():
+    """Context stored alongside every report so runs can be compared"""
+    import platform
+    import django
+
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': settings.DATABASES['default']['ENGINE'],
+        'platform': platform.platform(),
+    }
@@ -0,0 +1,101 @@
+"""Everything a role's landing page needs, in one response.
+
+Replaces the profile, prescription list, upload list and patient list
+calls the frontend made after login. Each section is one query: lists use
+the compact representation with the columns and joins worked out by
+``mediauth.sparse.queryset_plan``, and counts come from a single
+conditional aggregate or the pre-aggregated ``analytics`` rows, plus one over the archive for counts that include
+archived prescriptions. Together with authentication a dashboard costs
+three to six queries whatever the data size.
+"""
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from analytics.models import DoctorStats
+from ocrservice.models import PrescriptionUpload
+from ocrservice.serializers import PrescriptionUploadSerializer
+from prescriptions.archive import ARCHIVED_STATUSES
+from prescriptions.models import ArchivedPrescription, Prescription
+from prescriptions.serializers import PrescriptionSerializer
+from prescriptions.views import listed_prescriptions
+from users.serializers import UserSerializer
+from .sparse import queryset_plan
+
+STATUSES = [choice for choice, _ in Prescription.STATUS_CHOICES]
+UPLOAD_STATUSES = [choice for choice, _ in PrescriptionUpload.STATUS_CHOICES]
+
+
+def compact_rows(queryset, serializer_class, context, limit):
+    """First ``limit`` rows serialized without heavy fields, loading only what they show"""
+    serializer = serializer_class(context={**context, 'compact': True})
+    only, select, prefetch = queryset_plan(queryset.model, serializer.fields)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only)
+    return serializer_class(queryset[:limit], many=True, context={**context, 'compact': True}).data
+
+
+def status_counts(queryset, field, values):
+    """``{value: count}`` in one aggregate query"""
+    return queryset.aggregate(**{value: Count('pk', filter=Q(**{field: value})) for value in values})
+
+
+def doctor_counts(user):
+    stats = DoctorStats.objects.filter(doctor=user).first()
+    counts = {status: getattr(stats, status, 0) for status in STATUSES}
+    counts['total'] = stats.total if stats else 0
+    return counts
+
+
+def patient_counts(user):
+    counts = status_counts(Prescription.objects.filter(patient=user), 'status', STATUSES)
+    archived = status_counts(ArchivedPrescription.objects.filter(patient=user), 'status', ARCHIVED_STATUSES)
+    for status, count in archived.items():
+        counts[status] += count
+    return counts
+
+
+def pharmacist_counts(user):
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = Prescription.objects.filter(filled_by=user).aggregate(
+        filled_by_me=Count('pk'),
+        filled_by_me_today=Count('pk', filter=Q(filled_date__gte=today)),
+    )
+    # Archived fills are old, so they only add to the lifetime count
+    counts['filled_by_me'] += ArchivedPrescription.objects.filter(filled_by=user).count()
+    # The queue length is the sum of one analytics row per doctor, not a count over prescriptions
+    counts['awaiting_fill'] = DoctorStats.objects.aggregate(total=Sum('issued'))['total'] or 0
+    return counts
+
+
+def build_dashboard(request, limit):
+    user = request.user
+    context = {'request': request}
+    data = {
+        'profile': UserSerializer(user).data,
+        'recent_prescriptions': compact_rows(
+            listed_prescriptions(user).order_by('-created_at'), PrescriptionSerializer, context, limit),
+    }
+
+    if user.user_type == 'doctor':
+        data['counts'] = doctor_counts(user)
+        # Patients seen most recently, so the common case needs no search
+        patients, seen = [], set()
+        for prescription in data['recent_prescriptions']:
+            patient = prescription.get('patient')
+            if patient and patient['id'] not in seen:
+                seen.add(patient['id'])
+                patients.append(patient)
+        data['recent_patients'] = patients
+    elif user.user_type == 'patient':
+        data['counts'] = patient_counts(user)
+        uploads = PrescriptionUpload.objects.filter(patient=user)
+        data['upload_counts'] = status_counts(uploads, 'status', UPLOAD_STATUSES)
+        data['pending_uploads'] = compact_rows(
+            uploads.filter(status='processing').order_by('-uploaded_at'), PrescriptionUploadSerializer,
+            context, limit)
+    elif user.user_type == 'pharmacist':
+        data['counts'] = pharmacist_counts(user)
+    return data
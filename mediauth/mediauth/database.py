@@ -0,0 +1,64 @@
+"""Per-connection database tuning.
+
+SQLite connections get the pragmas in ``settings.SQLITE_PRAGMAS`` as they
+open. With the defaults, WAL journaling lets readers carry on while a
+writer commits, ``busy_timeout`` makes a blocked writer wait instead of
+failing with "database is locked", ``synchronous=NORMAL`` is durable in
+WAL mode with one fsync per checkpoint instead of per commit, and
+``mmap_size`` serves reads from the page cache without copying. A pragma
+set to None is left at SQLite's default.
+
+Transactions on SQLite start with ``BEGIN IMMEDIATE``
+(``SQLITE_TRANSACTION_MODE``), taking the write lock up front. A deferred
+transaction that reads first and then writes cannot wait for the lock under
+WAL: if another writer (a request, the audit log flusher) committed in
+between, its snapshot is stale and SQLite fails it with "database is locked"
+at once, whatever ``busy_timeout`` says. Django 5.1+ does this itself from
+``OPTIONS['transaction_mode']``.
+
+Server databases are tuned in settings instead: persistent connections
+(``CONN_MAX_AGE``) with health checks, plus a driver-side pool where the
+installed Django supports one.
+"""
+from django.conf import settings
+
+# Applied in this order: journal_mode must come before synchronous takes effect
+PRAGMA_ORDER = ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store')
+
+
+def sqlite_pragmas(pragmas):
+    """``PRAGMA`` statements for the configured values, skipping unset ones"""
+    statements = []
+    for name in PRAGMA_ORDER:
+        value = pragmas.get(name)
+        if value is not None:
+            statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``SQLITE_PRAGMAS`` to new SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    # WAL does not apply to in-memory databases (the test runner's default)
+    if connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragmas(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
+    mode = settings.SQLITE_TRANSACTION_MODE
+    if mode and not hasattr(connection, 'transaction_mode'):
+        # What atomic() runs to open the outermost transaction (Django 4.2)
+        connection._start_transaction_under_autocommit = (
+            lambda: connection.cursor().execute(f"BEGIN {mode}")
+        )
+
+
+def current_pragmas(connection):
+    """Effective values of the tuned pragmas on an open SQLite connection"""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in PRAGMA_ORDER:
+            cursor.execute(f"PRAGMA {name}")
+            values[name] = cursor.fetchone()[0]
+    return values
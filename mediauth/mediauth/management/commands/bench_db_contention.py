@@ -0,0 +1,113 @@
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.database import current_pragmas
+from mediauth.synthetic import generate_dataset
+from ocrservice.fake_model import DEFAULT_RESPONSE
+from ocrservice.models import PrescriptionUpload
+from ocrservice.pipeline import apply_result
+
+# The untuned setup: SQLite's defaults (rollback journal, fsync on every
+# commit, no memory map) with the 5 second lock wait of Python's driver
+BASELINE = {'journal_mode': 'DELETE', 'busy_timeout': 5000, 'synchronous': 'FULL', 'mmap_size': 0,
+            'cache_size': -2000, 'temp_store': 'DEFAULT'}
+
+
+class Command(BaseCommand):
+    help = ("Benchmark SQLite writer/reader contention: OCR result writers and upload-list "
+            "readers running concurrently, with SQLite defaults and with SQLITE_PRAGMAS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--uploads', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def write(self, rng, upload_ids, parsed):
+        upload = PrescriptionUpload.objects.get(pk=rng.choice(upload_ids))
+        apply_result(upload, {'status': 'completed', 'extracted_text': DEFAULT_RESPONSE, 'parsed_data': parsed})
+
+    def read(self, rng, patient_ids):
+        list(PrescriptionUpload.objects.filter(patient_id=rng.choice(patient_ids))
+             .order_by('-uploaded_at').values('id', 'status', 'processed_at')[:20])
+        PrescriptionUpload.objects.filter(status='completed').count()
+
+    def worker(self, kind, seed, deadline, context, results):
+        rng = random.Random(seed)
+        samples, errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if kind == 'writer':
+                        self.write(rng, context['upload_ids'], context['parsed'])
+                    else:
+                        self.read(rng, context['patient_ids'])
+                except OperationalError:
+                    errors += 1  # "database is locked"
+                    continue
+                samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+        results.append((kind, samples, errors))
+
+    def run(self, pragmas, context, options):
+        connections.close_all()
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            effective = current_pragmas(connection)
+            connections.close_all()
+            results = []
+            deadline = time.perf_counter() + options['seconds']
+            threads = [
+                threading.Thread(target=self.worker, args=(kind, options['seed'] + index, deadline, context, results))
+                for index, kind in enumerate(['writer'] * options['writers'] + ['reader'] * options['readers'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        report = {'pragmas': effective}
+        for kind in ('writer', 'reader'):
+            samples = [sample for k, s, _ in results if k == kind for sample in s]
+            report[f"{kind}s"] = {
+                'operations': len(samples),
+                'per_second': round(len(samples) / options['seconds'], 1),
+                'errors': sum(errors for k, _, errors in results if k == kind),
+                'latency_ms': summarize(samples),
+            }
+        return report
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark measures SQLite locking; DB_ENGINE is not SQLite")
+
+        with isolated_environment():
+            dataset = generate_dataset(doctors=1, patients=200, pharmacists=0, prescriptions=0,
+                                       uploads=options['uploads'], seed=options['seed'])
+            context = {
+                'upload_ids': list(PrescriptionUpload.objects.values_list('pk', flat=True)),
+                'patient_ids': [patient.pk for patient in dataset['patient']],
+                'parsed': json.loads(DEFAULT_RESPONSE),
+            }
+            runs = {
+                'sqlite_defaults': self.run(BASELINE, context, options),
+                'tuned': self.run(settings.SQLITE_PRAGMAS or BASELINE, context, options),
+            }
+
+        write_report({
+            'benchmark': 'db_contention',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('writers', 'readers', 'seconds', 'uploads', 'seed')},
+            'runs': runs,
+        }, options['output'], self.stdout)
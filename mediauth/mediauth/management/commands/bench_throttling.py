@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import SYNTHETIC_PASSWORD, generate_dataset
+from mediauth.throttling import CacheBucketStore, LocalBucketStore, get_store
+
+LOGIN = '/api/users/login/'
+
+
+class Command(BaseCommand):
+    help = ("Benchmark throttling: bucket store throughput, and how a login flood from one "
+            "address affects other users' logins on a fixed pool of workers, unthrottled and throttled.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Request-handling threads')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each flood')
+        parser.add_argument('--legit-interval', type=float, default=0.5,
+                            help='Seconds between logins by other users')
+        parser.add_argument('--store-ops', type=int, default=200000)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def store_throughput(self, store, operations):
+        keys = [f"bench:user:{index}" for index in range(10000)]
+        started = time.perf_counter()
+        for index in range(operations):
+            store.take(keys[index % len(keys)], 100, 0.6)
+        elapsed = time.perf_counter() - started
+        return {'operations_per_second': round(operations / elapsed),
+                'us_per_operation': round(elapsed / operations * 1e6, 2)}
+
+    def worker(self, jobs, results):
+        client = APIClient()
+        try:
+            while True:
+                job = jobs.get()
+                if job is None:
+                    return
+                kind, body, address, queued = job
+                response = client.post(LOGIN, body, format='json', REMOTE_ADDR=address)
+                results.append((kind, response.status_code, (time.perf_counter() - queued) * 1000))
+        finally:
+            connection.close()
+
+    def flood(self, victim, users, options):
+        # A bounded queue stands in for a saturated worker pool: new requests wait for a free worker
+        jobs, results = queue.Queue(maxsize=options['workers']), []
+        workers = [threading.Thread(target=self.worker, args=(jobs, results)) for _ in range(options['workers'])]
+        for thread in workers:
+            thread.start()
+        deadline = time.perf_counter() + options['seconds']
+
+        def legitimate():
+            # Different people each time, as at a clinic's shared address
+            for user in users:
+                if time.perf_counter() >= deadline:
+                    return
+                jobs.put(('legitimate', {'username': user.username, 'password': SYNTHETIC_PASSWORD},
+                          '10.0.0.2', time.perf_counter()))
+                time.sleep(options['legit_interval'])
+
+        legit = threading.Thread(target=legitimate)
+        legit.start()
+        while time.perf_counter() < deadline:
+            jobs.put(('attack', {'username': victim.username, 'password': 'guess'}, '10.6.6.6', time.perf_counter()))
+        legit.join()
+        for _ in workers:
+            jobs.put(None)
+        for thread in workers:
+            thread.join()
+
+        report = {}
+        for kind in ('attack', 'legitimate'):
+            rows = [row for row in results if row[0] == kind]
+            report[kind] = {
+                'requests': len(rows),
+                'status_codes': dict(Counter(str(status) for _, status, _ in rows)),
+                'latency_ms': summarize([latency for _, _, latency in rows]),
+            }
+        report['password_checks'] = sum(1 for kind, status, _ in results if status in (200, 401))
+        return report
+
+    def handle(self, *args, **options):
+        stores = {
+            'local': self.store_throughput(LocalBucketStore(), options['store_ops']),
+            'cache': self.store_throughput(CacheBucketStore(), options['store_ops'] // 10),
+        }
+        with isolated_environment():
+            logins = int(options['seconds'] / options['legit_interval']) + 1
+            dataset = generate_dataset(doctors=1, patients=logins, pharmacists=0, prescriptions=0, uploads=0)
+            victim = dataset['doctor'][0]
+            runs = {}
+            for mode, enabled in (('unthrottled', False), ('throttled', True)):
+                with override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': enabled}):
+                    store = get_store()
+                    if hasattr(store, 'clear'):
+                        store.clear()
+                    runs[mode] = self.flood(victim, dataset['patient'], options)
+
+        write_report({
+            'benchmark': 'throttling',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('workers', 'seconds', 'legit_interval', 'store_ops')},
+            'rates': settings.THROTTLING['RATES'],
+            'stores': stores,
+            'login_flood': runs,
+        }, options['output'], self.stdout)
@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mediauth.bench import describe_environment, isolated_environment, write_report
+from mediauth.routing import copy_sqlite_primary
+from mediauth.synthetic import generate_dataset
+from prescriptions.models import Prescription
+
+REPLICA = 'replica_check'
+
+
+class Command(BaseCommand):
+    help = ("Exercise the primary/replica routing against two SQLite databases: which database "
+            "serves each request, and whether users read their own writes while the replica lags.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pin-seconds', type=float, default=1.0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def call(self, client, method, url):
+        """``(status, response data, databases that served queries)``"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(client, method)(url)
+        served = [alias for alias, queries in (('primary', primary), ('replica', replica)) if len(queries)]
+        return response.status_code, response.data, served
+
+    def handle(self, *args, **options):
+        with isolated_environment() as workdir:
+            connections.databases[REPLICA] = dict(connections.databases['default'],
+                                                  NAME=str(workdir / 'replica.sqlite3'))
+            try:
+                with override_settings(READ_REPLICAS={'ALIASES': [REPLICA], 'APPS': ['prescriptions', 'ocrservice'],
+                                                      'PIN_SECONDS': options['pin_seconds']}):
+                    steps = self.run_steps(options['pin_seconds'])
+            finally:
+                connections[REPLICA].close()
+                del connections[REPLICA]
+                del connections.databases[REPLICA]
+
+        failed = [step['step'] for step in steps if not step['ok']]
+        write_report({
+            'benchmark': 'replica_routing',
+            'environment': describe_environment(),
+            'steps': steps,
+            'failed': failed,
+        }, options['output'], self.stdout)
+        if failed:
+            raise CommandError(f"Routing checks failed: {', '.join(failed)}")
+
+    def run_steps(self, pin_seconds):
+        dataset = generate_dataset(doctors=2, patients=20, pharmacists=1, prescriptions=40, uploads=0)
+        doctor, pharmacist = dataset['doctor'][0], dataset['pharmacist'][0]
+        draft = Prescription.objects.filter(doctor=doctor, status='draft').first()
+        detail = f"/api/prescriptions/{draft.pk}/"
+        copy_sqlite_primary(REPLICA)
+        doctor_client, pharmacist_client = self.client(doctor), self.client(pharmacist)
+        steps = []
+
+        def check(step, method, url, client, served, status=None):
+            code, data, used = self.call(client, method, url)
+            # Authentication always reads users from the primary; what matters is whether the replica was used
+            ok = ('replica' in used) == (served == 'replica') and (status is None or (data or {}).get('status') == status)
+            steps.append({'step': step, 'http_status': code, 'served_by': used,
+                          'prescription_status': (data or {}).get('status') if status else None, 'ok': ok})
+
+        check('list reads from the replica', 'get', '/api/prescriptions/', doctor_client, 'replica')
+        check('profile (users app) reads from the primary', 'get', '/api/users/profile/', doctor_client, 'primary')
+        check('issue writes to the primary', 'post', f"{detail}issue/", doctor_client, 'primary', 'issued')
+        check('writer is pinned and reads its own write', 'get', detail, doctor_client, 'primary', 'issued')
+        check('other users read the lagging replica', 'get', detail, pharmacist_client, 'replica', 'draft')
+        time.sleep(pin_seconds + 0.1)
+        check('pin expires', 'get', detail, doctor_client, 'replica', 'draft')
+        copy_sqlite_primary(REPLICA)
+        check('replica caught up', 'get', detail, doctor_client, 'replica', 'issued')
+        return steps
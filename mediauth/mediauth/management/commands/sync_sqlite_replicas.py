@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mediauth.routing import copy_sqlite_primary, replica_aliases
+
+
+class Command(BaseCommand):
+    help = ("Copy the SQLite primary into every configured replica (DB_REPLICAS), standing in "
+            "for replication when trying the read/write routing locally.")
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError("No replicas configured; set DB_REPLICAS")
+        for alias in aliases:
+            started = time.perf_counter()
+            try:
+                copy_sqlite_primary(alias)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"Synced {alias} in {(time.perf_counter() - started) * 1000:.0f} ms"
+            ))
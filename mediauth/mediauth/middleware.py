@@ -0,0 +1,199 @@
+import gzip
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import metrics, routing
+from .profiling import SamplingProfiler
+
+logger = logging.getLogger('mediauth.requests')
+
+
+class QueryTracker:
+    """``execute_wrapper`` hook counting queries and time spent in the database"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class InstrumentationMiddleware:
+    """Record latency, payload sizes and query counts for every request.
+
+    Slow-request profiling is opt-in through ``REQUEST_PROFILING``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.profiling = settings.REQUEST_PROFILING
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        profiler = None
+        if self.profiling['ENABLED'] and random.random() < self.profiling['SAMPLE_RATE']:
+            profiler = SamplingProfiler(threading.get_ident(), self.profiling['INTERVAL_MS'] / 1000).start()
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(tracker))
+                response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        view = self.view_label(request)
+        method = request.method
+        metrics.request_latency.observe(elapsed, view=view, method=method, status=response.status_code)
+        metrics.request_bytes.observe(int(request.META.get('CONTENT_LENGTH') or 0), view=view, method=method)
+        if not response.streaming:
+            metrics.response_bytes.observe(len(response.content), view=view, method=method)
+        metrics.db_queries.observe(tracker.count, view=view)
+        metrics.db_query_time.observe(tracker.duration, view=view)
+
+        if elapsed * 1000 >= self.profiling['THRESHOLD_MS']:
+            metrics.slow_requests.inc(view=view)
+            self.report_slow_request(request, view, elapsed, tracker, profiler)
+        return response
+
+    def view_label(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        return match.view_name or match.route
+
+    def report_slow_request(self, request, view, elapsed, tracker, profiler):
+        logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms",
+            request.method, request.path, view, elapsed * 1000, tracker.count, tracker.duration * 1000,
+        )
+        if not profiler or not profiler.samples:
+            return
+        for fraction, frames in profiler.top(self.profiling['TOP_STACKS']):
+            logger.warning("  %5.1f%%  %s", fraction * 100, ' <- '.join(reversed(frames)))
+        if self.profiling['OUTPUT_DIR']:
+            output_dir = Path(self.profiling['OUTPUT_DIR'])
+            output_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{view.replace('/', '_')}.collapsed"
+            (output_dir / name).write_text(profiler.collapsed())
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header with a non-zero q-value, best first"""
+    encodings = []
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings.append((quality, name.strip().lower()))
+    return [name for _, name in sorted(encodings, key=lambda entry: -entry[0])]
+
+
+class CompressionMiddleware:
+    """Compress large responses with brotli or gzip, whichever the client prefers.
+
+    Brotli is used only when the ``brotli`` package is installed. Sizes and
+    levels come from ``RESPONSE_COMPRESSION``; streaming responses are left
+    alone (the export endpoint compresses its own stream), and so are the
+    ``SKIP_VIEWS`` that answer with JWTs or signed prescription tokens.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = settings.RESPONSE_COMPRESSION
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        self.brotli = brotli
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if (not self.options['ENABLED'] or response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < self.options['MIN_BYTES']
+                or (match is not None and match.view_name in self.options['SKIP_VIEWS'])):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        for encoding in accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            if encoding == 'br' and self.brotli is not None:
+                compressed = self.brotli.compress(response.content, quality=self.options['BROTLI_QUALITY'])
+                break
+            if encoding in ('gzip', '*'):
+                encoding = 'gzip'
+                compressed = gzip.compress(response.content, compresslevel=self.options['GZIP_LEVEL'], mtime=0)
+                break
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body differs byte for byte, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Serve safe requests to the ``READ_REPLICAS['APPS']`` views from a read replica.
+
+    Users are pinned to the primary for a few seconds after a successful
+    write of their own (see ``mediauth.routing``). Streaming responses keep
+    the replica while their body is produced; the alias is reset when the
+    next request starts.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing.read_alias.set(None)
+        response = self.get_response(request)
+        if (request.method not in routing.SAFE_METHODS and response.status_code < 400
+                and routing.replica_aliases()):
+            user_id = routing.request_user_id(request)
+            if user_id is not None:
+                routing.pin_to_primary(user_id)
+        if not response.streaming:
+            routing.read_alias.set(None)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in routing.SAFE_METHODS:
+            return None
+        aliases = routing.replica_aliases()
+        app = getattr(view_func, '__module__', '').split('.')[0]
+        if not aliases or app not in settings.READ_REPLICAS['APPS']:
+            return None
+        if routing.is_pinned(routing.request_user_id(request)):
+            return None
+        routing.read_alias.set(random.choice(aliases))
+        return None
@@ -0,0 +1,55 @@
+"""Low-overhead sampling profiler for slow requests.
+
+A background thread periodically captures the stack of the thread handling
+the request. Nothing is recorded unless the request turns out to be slow,
+so it can stay enabled (at a low sample rate) in production.
+"""
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id, interval=0.005, max_depth=40):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mediauth-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{frame.f_lineno}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, limit=10, depth=5):
+        """Hottest call sites as ``(fraction, innermost frames)`` pairs"""
+        if not self.samples:
+            return []
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[tuple(stack.split(';')[-depth:])] += count
+        return [(count / self.samples, list(frames)) for frames, count in leaves.most_common(limit)]
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph tools"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
@@ -0,0 +1,90 @@
+"""Primary/replica database routing with read-your-writes pinning.
+
+Writes always go to ``default``. ``ReplicaRoutingMiddleware`` marks safe
+(GET/HEAD) requests to the views of ``READ_REPLICAS['APPS']`` as replica
+reads, and ``ReplicaRouter`` then sends every read of that request to one
+of ``READ_REPLICAS['ALIASES']``, except user lookups, which authentication
+depends on. Everything else (management commands, background work, other
+views) reads from the primary.
+
+A user whose own write succeeded is pinned to the primary for
+``READ_REPLICAS['PIN_SECONDS']``, long enough for replication to catch up,
+so they immediately see what they just changed. Pins live in the default
+cache; configure a shared cache (e.g. Redis) when running several
+processes. The user is identified from the JWT without a database query.
+"""
+import contextvars
+import sqlite3
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db-pin:{}'
+
+# Database alias serving reads for the current request, or None for the primary
+read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.READ_REPLICAS['ALIASES'] if alias in settings.DATABASES]
+
+
+class ReplicaRouter:
+    """Reads from the replica chosen for the current request; writes and migrations on the primary"""
+
+    def db_for_read(self, model, **hints):
+        # Authentication looks users up; a lagging replica must not reject a fresh account
+        if model._meta.label == settings.AUTH_USER_MODEL:
+            return None
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.READ_REPLICAS['ALIASES']
+
+
+_jwt = JWTStatelessUserAuthentication()
+
+
+def request_user_id(request):
+    """The caller's user id from a bearer token or the session, without a query"""
+    try:
+        result = _jwt.authenticate(request)
+    except (InvalidToken, TokenError):
+        result = None
+    if result is not None:
+        return str(result[0].id)
+    user_id = request.session.get('_auth_user_id') if hasattr(request, 'session') else None
+    return str(user_id) if user_id is not None else None
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), True, settings.READ_REPLICAS['PIN_SECONDS'])
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def copy_sqlite_primary(alias):
+    """Stand-in for replication when testing locally: snapshot the SQLite primary into ``alias``"""
+    from django.db import connections
+
+    primary, replica = connections['default'], connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError("Only SQLite replicas can be synced by copying the primary")
+    primary.ensure_connection()
+    replica.close()
+    target = sqlite3.connect(str(replica.settings_dict['NAME']))
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os 
+import django
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -26,8 +27,66 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 
 SECRET_KEY = os.getenv("SECRET_KEY")
-print(SECRET_KEY)  # Debug log to verify loading
 GROQ_API_KEY = os.getenv("SECRET_KEY")
+# Override to point the processor at a local fake model server (see ocrservice.fake_model)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+
+# Extraction prompt (see ocrservice.prompts.PROMPTS) and completion budget.
+# The token limit is estimated per image within MIN..MAX; HEADROOM pads it.
+OCR_PROMPT_VERSION = os.getenv("OCR_PROMPT_VERSION", "v3-confidence")
+OCR_JSON_MODE = os.getenv("OCR_JSON_MODE", "") == "1"
+OCR_COMPLETION_TOKENS = {
+    'MIN': 256,
+    'MAX': 2000,
+    'HEADROOM': 1.5,
+}
+
+# Fields below this confidence (or empty) are picked by targeted re-extraction
+OCR_FIELD_CONFIDENCE_THRESHOLD = float(os.getenv("OCR_FIELD_CONFIDENCE_THRESHOLD", "0.6"))
+
+# Image quality gate applied to uploaded photos before any model call
+# (see ocrservice.quality). REJECT_* fail the upload, WARN_* are recorded.
+OCR_QUALITY = {
+    'ENFORCE': os.getenv("OCR_QUALITY_ENFORCE", "1") == "1",
+    'REJECT_MIN_SIDE': 150,
+    'WARN_MIN_SIDE': 600,
+    'REJECT_SHARPNESS': 5.0,
+    'WARN_SHARPNESS': 30.0,
+    'REJECT_DARK': 40.0,
+    'WARN_DARK': 80.0,
+    'REJECT_CONTRAST': 3.0,
+    'WARN_CONTRAST': 8.0,
+}
+
+# Uploads whose perceptual hashes differ by at most this many bits (of 64)
+# are treated as the same paper prescription
+OCR_DUPLICATE_DISTANCE = int(os.getenv("OCR_DUPLICATE_DISTANCE", "6"))
+
+# Multi-page uploads: PDFs are rasterized at OCR_PDF_DPI and up to
+# OCR_PAGE_CONCURRENCY pages are sent to the model at the same time.
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "20"))
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", "150"))
+OCR_PAGE_CONCURRENCY = int(os.getenv("OCR_PAGE_CONCURRENCY", "4"))
+
+# One extraction per upload at a time (see ocrservice.runs). A run older than
+# LEASE_SECONDS is presumed dead and may be taken over; duplicate requests
+# get 202 with the upload while a run is in flight. Idempotency-Key headers
+# are remembered for KEY_TTL_HOURS.
+OCR_RUNS = {
+    'LEASE_SECONDS': int(os.getenv("OCR_RUN_LEASE_SECONDS", "300")),
+    'KEY_TTL_HOURS': 24,
+}
+
+# Per-patient limits on vision-model usage (0 disables a limit)
+OCR_USAGE_BUDGETS = {
+    'CALLS_PER_HOUR': int(os.getenv("OCR_CALLS_PER_HOUR", "20")),
+    'TOKENS_PER_DAY': int(os.getenv("OCR_TOKENS_PER_DAY", "200000")),
+}
+# USD per million tokens, used for cost estimates in usage reports
+OCR_MODEL_PRICING = {
+    'meta-llama/llama-4-scout-17b-16e-instruct': {'prompt': 0.11, 'completion': 0.34},
+}
 
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -51,16 +110,22 @@ INSTALLED_APPS = [
      'users',
     'prescriptions',
     'ocrservice',
+    'analytics',
+    'audit',
+    'mediauth',
     
 ]
 
 MIDDLEWARE = [
+    'mediauth.middleware.InstrumentationMiddleware',
+    'mediauth.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    'mediauth.middleware.ReplicaRoutingMiddleware',
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -72,6 +137,91 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON (falls back to DRF's encoder when orjson is missing)
+    'DEFAULT_RENDERER_CLASSES': [
+        'mediauth.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'mediauth.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Reverse proxies in front of the app. Throttles identify clients by
+    # REMOTE_ADDR unless this many trusted proxies append to X-Forwarded-For;
+    # otherwise a client could pick its own address with that header.
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", "0")),
+}
+
+# Token-bucket throttling of expensive endpoints (see mediauth.throttling).
+# A rate "N/period" allows bursts of N requests, refilled evenly over the
+# period, per user (per client IP for login, registration and refresh).
+# STORE is LocalBucketStore (per process) or CacheBucketStore (the default
+# cache, shared by all processes).
+THROTTLING = {
+    'ENABLED': os.getenv("THROTTLING", "1") == "1",
+    'STORE': os.getenv("THROTTLE_STORE", "mediauth.throttling.LocalBucketStore"),
+    'MAX_KEYS': int(os.getenv("THROTTLE_MAX_KEYS", "100000")),
+    'RATES': {
+        'login': os.getenv("THROTTLE_LOGIN_RATE", "20/min"),
+        'login_username': os.getenv("THROTTLE_LOGIN_USERNAME_RATE", "5/min"),
+        'register': os.getenv("THROTTLE_REGISTER_RATE", "20/hour"),
+        'token_refresh': os.getenv("THROTTLE_TOKEN_REFRESH_RATE", "60/min"),
+        'ocr': os.getenv("THROTTLE_OCR_RATE", "10/min"),
+    },
+}
+
+# Signed prescription tokens (see prescriptions.tokens): lifetime, how often
+# each process pulls new revocations from the database, and how far back each
+# pull re-reads for rows other servers committed late
+PRESCRIPTION_TOKENS = {
+    'MAX_AGE_SECONDS': int(os.getenv("PRESCRIPTION_TOKEN_MAX_AGE_DAYS", "30")) * 86400,
+    'REFRESH_SECONDS': float(os.getenv("PRESCRIPTION_REVOCATION_REFRESH_SECONDS", "5")),
+    'OVERLAP_SECONDS': float(os.getenv("PRESCRIPTION_REVOCATION_OVERLAP_SECONDS", "60")),
+}
+
+# Cold storage for finished prescriptions (see prescriptions.archive): filled
+# and cancelled prescriptions untouched for AFTER_DAYS move to the archive
+# table, BATCH_SIZE per transaction, when archive_prescriptions runs.
+PRESCRIPTION_ARCHIVE = {
+    'AFTER_DAYS': int(os.getenv("PRESCRIPTION_ARCHIVE_AFTER_DAYS", "180")),
+    'BATCH_SIZE': int(os.getenv("PRESCRIPTION_ARCHIVE_BATCH_SIZE", "500")),
+}
+
+# Prescription audit trail (see audit.log): each event is appended to a
+# journal file in JOURNAL_DIR as it happens and bulk-inserted later,
+# BATCH_SIZE at a time and at least every FLUSH_SECONDS. The journal
+# survives process crashes; FSYNC also makes it survive power loss, at the
+# cost of a disk sync per event.
+AUDIT_LOG = {
+    'JOURNAL_DIR': os.getenv("AUDIT_JOURNAL_DIR", str(BASE_DIR / 'audit-journal')),
+    'BATCH_SIZE': int(os.getenv("AUDIT_BATCH_SIZE", "200")),
+    'FLUSH_SECONDS': float(os.getenv("AUDIT_FLUSH_SECONDS", "1")),
+    'FSYNC': os.getenv("AUDIT_JOURNAL_FSYNC", "1") == "1",
+}
+
+# Patient typeahead (see users.search): in-memory prefix index, or the
+# database expression indexes when IN_MEMORY is off. SCAN_LIMIT caps the
+# index entries examined per query.
+PATIENT_SEARCH = {
+    'IN_MEMORY': os.getenv("PATIENT_SEARCH_IN_MEMORY", "True") == "True",
+    # Load the index on a background thread as a server process starts, not on the first search
+    'WARM_ON_START': os.getenv("PATIENT_SEARCH_WARM_ON_START", "True") == "True",
+    'REFRESH_SECONDS': float(os.getenv("PATIENT_SEARCH_REFRESH_SECONDS", "10")),
+    'SCAN_LIMIT': int(os.getenv("PATIENT_SEARCH_SCAN_LIMIT", "5000")),
+    # Changes are re-read this far back, for transactions that commit late
+    'OVERLAP_SECONDS': float(os.getenv("PATIENT_SEARCH_OVERLAP_SECONDS", "60")),
+}
+
+# Responses of at least MIN_BYTES are compressed with brotli (when the
+# brotli package is installed) or gzip, as negotiated by Accept-Encoding.
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.getenv("RESPONSE_COMPRESSION", "1") == "1",
+    'MIN_BYTES': int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")),
+    'GZIP_LEVEL': int(os.getenv("RESPONSE_GZIP_LEVEL", "5")),
+    'BROTLI_QUALITY': int(os.getenv("RESPONSE_BROTLI_QUALITY", "4")),
+    # Views whose responses carry credentials; compressing them next to reflected input invites BREACH
+    'SKIP_VIEWS': ('login', 'token_refresh', 'prescription-token'),
 }
 
 SIMPLE_JWT = {
@@ -79,6 +229,36 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
 }
+# Metrics exposed at /metrics/ in the Prometheus text format. Scrapes need
+# "Authorization: Bearer <METRICS_TOKEN>"; while it is unset only staff
+# (session or JWT) can read them.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Requests slower than THRESHOLD_MS are logged. With ENABLED, a sampled
+# fraction of requests is profiled and the hottest stacks are logged (and
+# written as collapsed stacks to OUTPUT_DIR when set).
+REQUEST_PROFILING = {
+    'ENABLED': os.getenv("REQUEST_PROFILING", "") == "1",
+    'SAMPLE_RATE': float(os.getenv("REQUEST_PROFILING_SAMPLE_RATE", "0.1")),
+    'INTERVAL_MS': 5,
+    'THRESHOLD_MS': int(os.getenv("SLOW_REQUEST_MS", "1000")),
+    'TOP_STACKS': 5,
+    'OUTPUT_DIR': os.getenv("REQUEST_PROFILING_DIR", ""),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'mediauth': {'handlers': ['console'], 'level': os.getenv("MEDIAUTH_LOG_LEVEL", "INFO")},
+        'ocrservice': {'handlers': ['console'], 'level': os.getenv("MEDIAUTH_LOG_LEVEL", "INFO")},
+        'prescriptions': {'handlers': ['console'], 'level': os.getenv("MEDIAUTH_LOG_LEVEL", "INFO")},
+    },
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -113,12 +293,82 @@ WSGI_APPLICATION = "mediauth.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default; DB_ENGINE selects a server database configured from
+# the DB_* variables. Connection tuning lives in mediauth.database.
+DB_ENGINE = os.getenv("DB_ENGINE", "django.db.backends.sqlite3")
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "0")),
+            'OPTIONS': {
+                # Seconds the driver waits on a locked database before raising
+                'timeout': float(os.getenv("SQLITE_TIMEOUT_SECONDS", "20")),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv("DB_NAME", "mediauth"),
+            'USER': os.getenv("DB_USER", ""),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", ""),
+            # Persistent connections, checked before reuse
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
+    # psycopg connection pool (Django 5.1+); CONN_MAX_AGE must then be 0
+    if (DB_ENGINE == 'django.db.backends.postgresql' and os.getenv("DB_POOL_MAX_SIZE")
+            and django.VERSION >= (5, 1)):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE")),
+        }
+
+# Read replicas (mediauth.routing): DB_REPLICAS lists replica database
+# files for SQLite or hosts for a server database, comma separated. Safe
+# requests to the APPS views read from a replica unless the user wrote
+# something in the last PIN_SECONDS.
+READ_REPLICAS = {
+    'ALIASES': [],
+    'APPS': ['prescriptions', 'ocrservice'],
+    'PIN_SECONDS': float(os.getenv("DB_REPLICA_PIN_SECONDS", "5")),
 }
+for index, replica in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(',')), start=1):
+    alias = f"replica{index}"
+    DATABASES[alias] = dict(DATABASES['default'], OPTIONS=dict(DATABASES['default']['OPTIONS']),
+                            TEST={'MIRROR': 'default'})
+    DATABASES[alias]['NAME' if DB_ENGINE == 'django.db.backends.sqlite3' else 'HOST'] = replica.strip()
+    READ_REPLICAS['ALIASES'].append(alias)
+DATABASE_ROUTERS = ['mediauth.routing.ReplicaRouter']
+
+# Applied to every new SQLite connection (mediauth.database); None keeps
+# SQLite's default. SQLITE_TUNING=False restores all defaults.
+if os.getenv("SQLITE_TUNING", "True") == "True":
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "20000")),
+        'synchronous': os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        'cache_size': int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")) * -1,
+        'temp_store': 'MEMORY',
+    }
+    # How transactions begin (mediauth.database); IMMEDIATE takes the write lock first
+    SQLITE_TRANSACTION_MODE = os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE")
+else:
+    SQLITE_PRAGMAS = {}
+    SQLITE_TRANSACTION_MODE = None
+if SQLITE_TRANSACTION_MODE and DB_ENGINE == 'django.db.backends.sqlite3' and django.VERSION >= (5, 1):
+    for database in DATABASES.values():
+        database['OPTIONS']['transaction_mode'] = SQLITE_TRANSACTION_MODE
 AUTH_USER_MODEL = 'users.User'
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite
@@ -0,0 +1,119 @@
+"""Sparse fieldsets for DRF serializers and the querysets behind them.
+
+On GET requests:
+
+* ``?fields=a,b`` keeps only the named top-level fields.
+* List views (``compact_list = True`` on the view) leave out the fields in
+  the serializer's ``Meta.heavy_fields`` (large text, JSON and nested
+  collections) unless they are named in ``?expand=`` or ``?fields=``.
+
+``SparseQuerysetMixin`` then narrows the view's queryset to what the
+remaining fields read: ``.only()`` on plain columns, ``select_related`` for
+nested objects and ``prefetch_related`` for nested lists.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def _names(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def requested_fields(request):
+    """``(fields or None, expand)`` from the query string of a GET request"""
+    if request is None or request.method != 'GET':
+        return None, set()
+    params = request.query_params
+    return (_names(params['fields']) if 'fields' in params else None), _names(params.get('expand'))
+
+
+class SparseFieldsMixin:
+    """Serializer mixin honouring ``?fields=`` / ``?expand=`` on the root serializer"""
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_root():
+            return fields
+        wanted, expand = requested_fields(self.context.get('request'))
+        if wanted is not None:
+            unknown = wanted - set(fields)
+            if unknown:
+                raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+            return {name: field for name, field in fields.items() if name in wanted or field.write_only}
+        if self.context.get('compact'):
+            heavy = set(getattr(self.Meta, 'heavy_fields', ())) - expand
+            return {name: field for name, field in fields.items() if name not in heavy}
+        return fields
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def queryset_plan(model, fields, prefix=''):
+    """``(only, select_related, prefetch_related)`` needed to render ``fields``.
+
+    ``only`` is None when some field reads something that is not a plain
+    column (a property, method or dotted source), in which case every
+    column is loaded.
+    """
+    only, select, prefetch = {f"{prefix}{model._meta.pk.name}"}, set(), set()
+    for field in fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or '.' in field.source:
+            only = None
+            continue
+        model_field = _model_field(model, field.source)
+        if model_field is None:
+            only = None
+            continue
+        path = f"{prefix}{field.source}"
+        if isinstance(field, serializers.ListSerializer):
+            prefetch.add(path)
+        elif isinstance(field, serializers.Serializer):
+            select.add(path)
+            nested_only, nested_select, nested_prefetch = queryset_plan(
+                model_field.related_model, field.fields, f"{path}__")
+            select |= nested_select
+            prefetch |= nested_prefetch
+            if only is not None:
+                only = None if nested_only is None else only | nested_only
+        elif only is not None:
+            only.add(f"{prefix}{model_field.attname}" if model_field.concrete else path)
+            if not model_field.concrete:
+                only = None
+    return only, select, prefetch
+
+
+class SparseQuerysetMixin:
+    """Generic-view mixin: compact list representations and column pruning on GET"""
+
+    compact_list = False
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['compact'] = self.compact_list and self.request.method == 'GET'
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method != 'GET':
+            return queryset
+        only, select, prefetch = queryset_plan(queryset.model, self.get_serializer().fields)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
@@ -0,0 +1,143 @@
+"""Synthetic data generator for load tests and benchmarks.
+
+Everything is written with ``bulk_create`` so large datasets can be built in
+seconds. Only use it against a throwaway database (see
+``mediauth.bench.isolated_environment``).
+"""
+import io
+import json
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from ocrservice.fake_model import DEFAULT_RESPONSE
+from ocrservice.hash_index import chunk_fields
+from ocrservice.medicines import materialize_batch
+from ocrservice.models import PrescriptionUpload
+from prescriptions.models import Prescription, PrescriptionItem
+
+User = get_user_model()
+
+SYNTHETIC_PASSWORD = 'synthetic-pass-123'
+
+MEDICINES = [
+    ('Amoxicillin', '500mg'), ('Paracetamol', '650mg'), ('Azithromycin', '250mg'),
+    ('Metformin', '500mg'), ('Atorvastatin', '10mg'), ('Pantoprazole', '40mg'),
+    ('Cetirizine', '10mg'), ('Ibuprofen', '400mg'), ('Amlodipine', '5mg'),
+    ('Omeprazole', '20mg'), ('Losartan', '50mg'), ('Salbutamol', '100mcg'),
+]
+FREQUENCIES = ['once daily', 'twice daily', '3 times a day', 'at bedtime']
+DIAGNOSES = ['Acute bronchitis', 'Type 2 diabetes', 'Hypertension', 'Gastritis', 'Allergic rhinitis']
+FIRST_NAMES = ['Aarav', 'Diya', 'Kabir', 'Meera', 'Rohan', 'Sara', 'Vivaan', 'Anaya', 'Ishaan', 'Zoya']
+LAST_NAMES = ['Sharma', 'Patel', 'Rao', 'Iyer', 'Khan', 'Das', 'Gupta', 'Nair', 'Singh', 'Menon']
+
+
+def sample_image_file(name='synthetic.jpg'):
+    """Write one small JPEG to storage and return its storage name"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 800), 'white').save(buffer, format='JPEG')
+    return default_storage.save(f"prescription_images/{name}", ContentFile(buffer.getvalue()))
+
+
+def _users(prefix, user_type, count, password, rng):
+    users = []
+    for index in range(count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        phone = f"9{rng.randrange(10**8, 10**9)}"
+        users.append(User(
+            username=f"{prefix}{index:06d}",
+            email=f"{prefix}{index:06d}@example.com",
+            first_name=first_name,
+            last_name=last_name,
+            phone_number=phone,
+            # bulk_create skips User.save, which derives this
+            phone_digits=phone,
+            license_number=f"LIC{index:06d}" if user_type != 'patient' else None,
+            user_type=user_type,
+            password=password,
+        ))
+    User.objects.bulk_create(users, batch_size=1000)
+    return list(User.objects.filter(username__startswith=prefix, user_type=user_type).order_by('id'))
+
+
+def generate_dataset(doctors=5, patients=50, pharmacists=3, prescriptions=200,
+                     items_per_prescription=3, uploads=20, seed=0, prefix='syn'):
+    """Create a reproducible dataset and return the created users by role"""
+    rng = random.Random(seed)
+    password = make_password(SYNTHETIC_PASSWORD)
+    now = timezone.now()
+
+    dataset = {
+        'doctor': _users(f"{prefix}-doc-", 'doctor', doctors, password, rng),
+        'patient': _users(f"{prefix}-pat-", 'patient', patients, password, rng),
+        'pharmacist': _users(f"{prefix}-pha-", 'pharmacist', pharmacists, password, rng),
+    }
+
+    rows = []
+    for index in range(prescriptions):
+        status = rng.choices(['draft', 'issued', 'filled', 'cancelled'], weights=[2, 4, 3, 1])[0]
+        issued = now - timedelta(days=rng.randrange(0, 365)) if status != 'draft' else None
+        rows.append(Prescription(
+            prescription_id=f"RXSYN{seed % 1000:03d}{index:09d}",
+            doctor=rng.choice(dataset['doctor']),
+            patient=rng.choice(dataset['patient']),
+            diagnosis=rng.choice(DIAGNOSES),
+            notes='Synthetic prescription',
+            status=status,
+            issued_date=issued,
+            filled_by=rng.choice(dataset['pharmacist']) if status == 'filled' and dataset['pharmacist'] else None,
+            filled_date=issued + timedelta(hours=rng.randrange(1, 72)) if status == 'filled' else None,
+        ))
+    Prescription.objects.bulk_create(rows, batch_size=1000)
+
+    items = []
+    created = Prescription.objects.filter(prescription_id__startswith=f"RXSYN{seed % 1000:03d}").values_list('id', flat=True)
+    for prescription_id in created.iterator(chunk_size=2000):
+        for _ in range(items_per_prescription):
+            name, dosage = rng.choice(MEDICINES)
+            items.append(PrescriptionItem(
+                prescription_id=prescription_id,
+                medicine_name=name,
+                dosage=dosage,
+                frequency=rng.choice(FREQUENCIES),
+                duration=f"{rng.choice([3, 5, 7, 10, 14])} days",
+                quantity=rng.randrange(5, 60),
+                instructions=rng.choice(['After food', 'Before food', '']),
+            ))
+        if len(items) >= 5000:
+            PrescriptionItem.objects.bulk_create(items)
+            items = []
+    PrescriptionItem.objects.bulk_create(items)
+
+    if uploads:
+        image_name = sample_image_file()
+        parsed = json.loads(DEFAULT_RESPONSE)
+        rows = [
+            PrescriptionUpload(
+                patient=rng.choice(dataset['patient']),
+                image=image_name,
+                original_filename='synthetic.jpg',
+                status='completed',
+                extracted_text=DEFAULT_RESPONSE,
+                parsed_data=parsed,
+                processed_at=now,
+                # Stand-in perceptual hashes: distinct photos, spread over the hash space
+                phash=f"{rng.getrandbits(64):016x}",
+            )
+            for _ in range(uploads)
+        ]
+        # bulk_create skips the pre_save signal that fills these
+        for row in rows:
+            for field, value in chunk_fields(row.phash).items():
+                setattr(row, field, value)
+        created = PrescriptionUpload.objects.bulk_create(rows, batch_size=1000)
+        materialize_batch([(upload.id, upload.patient_id, parsed) for upload in created])
+
+    return dataset
@@ -0,0 +1,39 @@
+"""Setup shared by the apps' test suites.
+
+Views record audit events, and uploads write files. ``IsolatedTestMixin``
+journals events in a temporary directory and stores them at the end of each
+test, on the test's own connection and inside its transaction, so the
+background flusher (which never wakes during a run) cannot write to the
+test database from another thread. Media files go to the same temporary
+directory, and throttling is off unless a test turns it on.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.test.utils import override_settings
+from audit import log as audit_log
+
+
+class IsolatedTestMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = Path(tempfile.mkdtemp(prefix='mediauth-test-'))
+        cls._isolation = override_settings(
+            MEDIA_ROOT=str(cls.workdir / 'media'),
+            AUDIT_LOG={**settings.AUDIT_LOG, 'JOURNAL_DIR': str(cls.workdir / 'audit'), 'FSYNC': False,
+                       'FLUSH_SECONDS': 3600, 'BATCH_SIZE': 10 ** 6},
+            THROTTLING={**settings.THROTTLING, 'ENABLED': False},
+        )
+        cls._isolation.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._isolation.disable()
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+
+    def tearDown(self):
+        audit_log.flush()
+        super().tearDown()
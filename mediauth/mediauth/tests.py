@@ -0,0 +1,179 @@
+from unittest import mock
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import AccessToken
+from prescriptions.models import Prescription
+from prescriptions.views import PrescriptionListCreateView
+from users.models import User
+from users.views import ProfileView
+from . import metrics, routing
+from .middleware import CompressionMiddleware, ReplicaRoutingMiddleware
+
+prescription_list = PrescriptionListCreateView.as_view()
+profile = ProfileView.as_view()
+
+
+@mock.patch('mediauth.routing.replica_aliases', return_value=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('doc', user_type='doctor')
+        self.factory = RequestFactory()
+        self.router = routing.ReplicaRouter()
+
+    def request(self, method='get', view=prescription_list, status=200):
+        """Run a request through the middleware; returns the alias its view read from"""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen['alias'] = self.router.db_for_read(Prescription)
+            seen['user_alias'] = self.router.db_for_read(User)
+            return HttpResponse(status=status)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = getattr(self.factory, method)('/', HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        middleware(request)
+        self.assertIsNone(seen['user_alias'])
+        return seen['alias']
+
+    def test_safe_requests_to_routed_apps_read_from_a_replica(self, aliases):
+        self.assertEqual(self.request(), 'replica1')
+        self.assertIsNone(self.request(view=profile))
+        self.assertIsNone(self.request('post'))
+        # Writes always go to the primary, and the alias does not outlive the request
+        self.assertEqual(self.router.db_for_write(Prescription), 'default')
+        self.assertIsNone(routing.read_alias.get())
+
+    def test_successful_write_pins_the_user_to_the_primary(self, aliases):
+        self.request('post')
+        self.assertIsNone(self.request())
+        other = User.objects.create_user('other', user_type='doctor')
+        self.assertFalse(routing.is_pinned(str(other.id)))
+
+    def test_failed_write_does_not_pin(self, aliases):
+        self.request('post', status=400)
+        self.assertEqual(self.request(), 'replica1')
+
+    def test_no_replicas_configured(self, aliases):
+        aliases.return_value = []
+        self.request('post')
+        self.assertFalse(routing.is_pinned(str(self.user.id)))
+        self.assertIsNone(self.request())
+
+
+class MetricsAccessTests(TestCase):
+    url = '/metrics/'
+
+    def setUp(self):
+        self.staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        self.doctor = User.objects.create_user('doc', password='pw', user_type='doctor')
+
+    def scrape(self, user=None, authorization=None):
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {AccessToken.for_user(user)}"
+        return self.client.get(self.url, **headers).status_code
+
+    @override_settings(METRICS_TOKEN='')
+    def test_only_staff_without_a_token(self):
+        self.assertEqual(self.scrape(), 403)
+        self.assertEqual(self.scrape(self.doctor), 403)
+        self.assertEqual(self.scrape(authorization='Bearer junk'), 403)
+        self.assertEqual(self.scrape(self.staff), 200)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.scrape(), 200)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_only_the_token_once_set(self):
+        self.assertEqual(self.scrape(authorization='Bearer scrape-secret'), 200)
+        self.assertEqual(self.scrape(authorization='Bearer scrape-secre'), 403)
+        self.assertEqual(self.scrape(self.staff), 403)
+        self.assertEqual(self.scrape(authorization='Bearer scrape-sécret'), 403)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counters_sum_per_label_set(self):
+        counter = self.registry.counter('jobs', 'Jobs run', ('queue',))
+        counter.inc(queue='ocr')
+        counter.inc(2, queue='ocr')
+        counter.inc(queue='mail "urgent"')
+        self.assertIs(self.registry.counter('jobs', 'Jobs run', ('queue',)), counter)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP jobs Jobs run',
+            '# TYPE jobs counter',
+            'jobs_total{queue="mail \\"urgent\\""} 1',
+            'jobs_total{queue="ocr"} 3',
+        ]) + '\n')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('latency', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [
+            'latency_bucket{le="0.1"} 2',
+            'latency_bucket{le="1.0"} 3',
+            'latency_bucket{le="+Inf"} 4',
+            'latency_sum 3.65',
+            'latency_count 4',
+        ])
+
+
+def sample(metric, view, suffix='_count'):
+    """The value of ``metric``'s series for ``view``, 0 before its first observation"""
+    prefix = f"{metric.name}{suffix}{{"
+    for line in metric.samples():
+        if line.startswith(prefix) and f'view="{view}"' in line:
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('doc', password='pw', user_type='doctor')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {AccessToken.for_user(user)}"
+
+    def test_requests_are_recorded_by_view(self):
+        before = {metric: sample(metric, 'profile') for metric in
+                  (metrics.request_latency, metrics.response_bytes, metrics.db_queries)}
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 200)
+        for metric, count in before.items():
+            self.assertEqual(sample(metric, 'profile'), count + 1, metric.name)
+        self.assertGreater(sample(metrics.db_queries, 'profile', '_sum'), 0)
+        self.assertIn('mediauth_http_request_duration_seconds_bucket{view="profile",method="GET",status="200"',
+                      metrics.registry.render())
+
+    def test_unrouted_requests_share_one_label(self):
+        before = sample(metrics.request_latency, 'unmatched')
+        self.client.get('/no/such/page/')
+        self.assertEqual(sample(metrics.request_latency, 'unmatched'), before + 1)
+
+    @override_settings(REQUEST_PROFILING={'ENABLED': False, 'SAMPLE_RATE': 0, 'INTERVAL_MS': 5, 'THRESHOLD_MS': 0,
+                                          'TOP_STACKS': 5, 'OUTPUT_DIR': ''})
+    def test_slow_requests_are_counted_and_logged(self):
+        before = sample(metrics.slow_requests, 'profile', '_total')
+        with self.assertLogs('mediauth.requests', 'WARNING') as logs:
+            self.client.get('/api/users/profile/')
+        self.assertEqual(sample(metrics.slow_requests, 'profile', '_total'), before + 1)
+        self.assertIn('Slow request GET /api/users/profile/ (profile)', logs.output[0])
+
+
+@override_settings(RESPONSE_COMPRESSION={'ENABLED': True, 'MIN_BYTES': 0, 'GZIP_LEVEL': 5, 'BROTLI_QUALITY': 4,
+                                         'SKIP_VIEWS': ('login', 'token_refresh', 'prescription-token')})
+class CompressionTests(SimpleTestCase):
+    def encoding(self, path):
+        request = RequestFactory().post(path, HTTP_ACCEPT_ENCODING='gzip')
+        request.resolver_match = resolve(path)
+        response = CompressionMiddleware(lambda request: HttpResponse(b'{"access": "eyJ..."}' * 100))(request)
+        return response.get('Content-Encoding')
+
+    def test_responses_carrying_credentials_are_not_compressed(self):
+        self.assertEqual(self.encoding('/api/prescriptions/'), 'gzip')
+        for path in ('/api/users/login/', '/api/users/token/refresh/', '/api/prescriptions/7/token/'):
+            with self.subTest(path=path):
+                self.assertIsNone(self.encoding(path))
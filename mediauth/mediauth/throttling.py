@@ -0,0 +1,174 @@
+"""Token-bucket throttling for expensive endpoints.
+
+Each throttle scope has a rate ``"N/period"`` in ``THROTTLING['RATES']``: a
+client may burst N requests, and the bucket refills evenly over the period.
+Buckets are kept per scope and per user, or per client IP before login, so
+one patient looping OCR reprocessing or a bot guessing passwords runs dry
+without affecting anyone else. The client IP is ``REMOTE_ADDR``, or taken
+from ``X-Forwarded-For`` only as far as ``REST_FRAMEWORK['NUM_PROXIES']``
+trusted proxies vouch for it. A throttled request gets DRF's 429 response
+with ``Retry-After`` set to when the next token arrives, before the view
+does any work.
+
+Buckets are stored in the GCRA form: one timestamp per key (when the bucket
+will be full again) instead of a token count plus last refill time. The
+store is pluggable through ``THROTTLING['STORE']``:
+
+* ``LocalBucketStore`` (default) keeps them in process memory, bounded to
+  ``MAX_KEYS`` with least-recently-used eviction. Every worker process has
+  its own buckets, so the effective limit is the rate times the workers.
+* ``CacheBucketStore`` keeps them in the default cache, shared by every
+  process when that is Redis or Memcached. Updates are read-then-write, so
+  concurrent requests can occasionally both take the last token.
+
+A store that fails lets requests through rather than failing them.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """``(capacity, seconds per token)`` for ``"N/period"``, or None for no limit"""
+    if not rate:
+        return None
+    count, _, period = rate.partition('/')
+    capacity = int(count)
+    return capacity, PERIODS[period.strip().lower()] / capacity
+
+
+def consume(full_at, now, capacity, interval, cost=1):
+    """``(new full_at or None if refused, seconds to wait)`` for taking ``cost`` tokens"""
+    full_at = max(full_at or now, now)
+    new_full_at = full_at + cost * interval
+    # The bucket may be at most `capacity` tokens short of full
+    wait = new_full_at - now - capacity * interval
+    if wait > 0:
+        return None, wait
+    return new_full_at, 0.0
+
+
+class LocalBucketStore:
+    """Buckets in this process's memory"""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, interval, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            full_at, wait = consume(self._buckets.get(key), now, capacity, interval, cost)
+            if full_at is not None:
+                self._buckets[key] = full_at
+                self._buckets.move_to_end(key)
+                # An evicted client simply starts again with a full bucket
+                while len(self._buckets) > settings.THROTTLING['MAX_KEYS']:
+                    self._buckets.popitem(last=False)
+        return full_at is not None, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """Buckets in the default cache, shared between processes"""
+
+    prefix = 'throttle:'
+
+    def take(self, key, capacity, interval, cost=1):
+        # Wall-clock time: the stored timestamps are compared across processes
+        now = time.time()
+        key = f"{self.prefix}{key}"
+        full_at, wait = consume(cache.get(key), now, capacity, interval, cost)
+        if full_at is not None:
+            cache.set(key, full_at, timeout=int(full_at - now) + 1)
+        return full_at is not None, wait
+
+
+_stores = {}
+
+
+def get_store():
+    path = settings.THROTTLING['STORE']
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base for the throttles below; subclasses set ``scope`` and may narrow ``methods``"""
+    scope = None
+    # Only these methods spend tokens; reads of the same endpoint stay free
+    methods = None
+
+    def get_ident_key(self, request, view):
+        """Whose bucket this request draws from, or None to let it through"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        self._wait = 0.0
+        if not settings.THROTTLING['ENABLED'] or (self.methods and request.method not in self.methods):
+            return True
+        rate = parse_rate(settings.THROTTLING['RATES'].get(self.scope))
+        ident = self.get_ident_key(request, view)
+        if rate is None or ident is None:
+            return True
+        try:
+            allowed, self._wait = get_store().take(f"{self.scope}:{ident}", *rate)
+        except Exception:
+            logger.warning("Throttle store failed; letting the request through", exc_info=True)
+            return True
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Password checks per client IP"""
+    scope = 'login'
+
+    def get_ident_key(self, request, view):
+        return f"ip:{self.get_ident(request)}"
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    """Password checks per account, however many addresses they come from"""
+    scope = 'login_username'
+
+    def get_ident_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        # Anything else is not a username the login could match
+        if not isinstance(username, str) or not username:
+            return None
+        return f"username:{username.lower()}"
+
+
+class RegisterThrottle(LoginThrottle):
+    """Account creation (a password hash each) per client IP"""
+    scope = 'register'
+
+
+class TokenRefreshThrottle(LoginThrottle):
+    scope = 'token_refresh'
+
+
+class OCRThrottle(TokenBucketThrottle):
+    """Model calls started by a user: uploads, reprocessing and re-extraction"""
+    scope = 'ocr'
+    methods = ('POST',)
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path , include
 from django.conf import settings
 from django.conf.urls.static import static
+from .views import dashboard, metrics_view
 
 
 
@@ -26,6 +27,10 @@ urlpatterns = [
      path('api/users/', include('users.urls')),
     path('api/prescriptions/', include('prescriptions.urls')),
     path('api/ocr/', include('ocrservice.urls')),
+    path('api/analytics/', include('analytics.urls')),
+    path('api/audit/', include('audit.urls')),
+    path('api/dashboard/', dashboard, name='dashboard'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
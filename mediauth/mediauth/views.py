@@ -0,0 +1,48 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .dashboard import build_dashboard
+from .metrics import registry
+
+DASHBOARD_MAX_LIMIT = 20
+
+
+def metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        # Bytes, as compare_digest refuses str with non-ASCII characters
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode())
+    user = request.user
+    if not user.is_authenticated:
+        try:
+            user, _ = JWTAuthentication().authenticate(request) or (user, None)
+        except AuthenticationFailed:
+            return False
+    return user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint for the METRICS_TOKEN bearer, or staff when no token is set"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard(request):
+    """Profile, recent prescriptions, pending uploads and counts for the user's role"""
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 5)), DASHBOARD_MAX_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(build_dashboard(request, limit))
@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mediauth.settings")
+# Tells app configs this process serves requests (see users.apps.serving)
+os.environ["MEDIAUTH_SERVER"] = "1"
 
 application = get_wsgi_application()
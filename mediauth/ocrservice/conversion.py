@@ -0,0 +1,130 @@
+"""Bulk conversion of completed uploads into draft prescriptions.
+
+Uploads are streamed in id order, mapped from ``parsed_data`` and validated
+in memory. Each chunk that passes is written in one transaction: the
+prescriptions, their items and the upload -> prescription links. Rows that
+fail validation are reported and left unconverted, so a run can be repeated
+after fixing them (for example with field re-extraction).
+"""
+import re
+import uuid
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from prescriptions.bulk import PLACEHOLDER_PREFIX, bulk_insert_prescriptions, finalize_prescription_ids, placeholder_id
+from prescriptions.models import Prescription, PrescriptionItem
+from .models import PrescriptionUpload
+
+QUANTITY = re.compile(r'\d+')
+ITEM_LIMITS = {'medicine_name': 200, 'dosage': 100, 'frequency': 100, 'duration': 100}
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def parse_quantity(value):
+    """'21', 21 or '21 tablets' -> 21; None when there is no number"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    match = QUANTITY.search(_text(value))
+    return int(match.group()) if match else None
+
+
+def map_upload(upload_id, parsed_data):
+    """``(prescription fields, item fields, errors)`` for one upload's parsed_data"""
+    parsed_data = parsed_data if isinstance(parsed_data, dict) else {}
+    errors = []
+
+    diagnosis = _text(parsed_data.get('diagnosis'))
+    if not diagnosis:
+        errors.append('diagnosis: missing')
+    notes = _text(parsed_data.get('notes'))
+    fields = {
+        'diagnosis': diagnosis,
+        'notes': '\n'.join(filter(None, [notes, f"Digitized from upload #{upload_id}"])),
+    }
+
+    items = []
+    medicines = parsed_data.get('medicines') or []
+    if not medicines:
+        errors.append('medicines: none extracted')
+    for index, medicine in enumerate(medicines):
+        if not isinstance(medicine, dict):
+            errors.append(f"medicines.{index}: not an object")
+            continue
+        item = {field: _text(medicine.get(field)) for field in ITEM_LIMITS}
+        for field, limit in ITEM_LIMITS.items():
+            if not item[field]:
+                errors.append(f"medicines.{index}.{field}: missing")
+            elif len(item[field]) > limit:
+                errors.append(f"medicines.{index}.{field}: longer than {limit} characters")
+        item['quantity'] = parse_quantity(medicine.get('quantity'))
+        if item['quantity'] is None or item['quantity'] < 0:
+            errors.append(f"medicines.{index}.quantity: not a number")
+        item['instructions'] = _text(medicine.get('instructions'))
+        items.append(item)
+    return fields, items, errors
+
+
+def pending_uploads(queryset=None):
+    """Completed uploads not yet converted, nor converted and since archived"""
+    queryset = PrescriptionUpload.objects.all() if queryset is None else queryset
+    return queryset.filter(status='completed', prescription__isnull=True, archived_prescription__isnull=True)
+
+
+def _write_chunk(doctor, mapped):
+    """Insert one chunk of ``(upload_id, patient_id, fields, items)``; returns items written"""
+    # The placeholder carries the upload id, so uploads can be linked with one UPDATE, and a
+    # per-chunk nonce, so it cannot match a real id that happens to look like a placeholder
+    nonce = f"U{uuid.uuid4().hex[:6]}"
+    prescriptions = [
+        Prescription(doctor=doctor, patient_id=patient_id, status='draft',
+                     prescription_id=placeholder_id(f"{nonce}{upload_id}"), **fields)
+        for upload_id, patient_id, fields, _ in mapped
+    ]
+    items = [[PrescriptionItem(**item) for item in row_items] for _, _, _, row_items in mapped]
+    with transaction.atomic():
+        created, created_items = bulk_insert_prescriptions(prescriptions, items)
+        placeholder = Concat(Value(f"{PLACEHOLDER_PREFIX}{nonce}"), Cast(OuterRef('id'), CharField()),
+                             output_field=CharField())
+        PrescriptionUpload.objects.filter(id__in=[row[0] for row in mapped]).update(
+            prescription=Subquery(Prescription.objects.filter(prescription_id=placeholder).values('id')[:1])
+        )
+        finalize_prescription_ids(created)
+    return len(created_items)
+
+
+def convert_uploads(queryset, doctor, batch_size=500, dry_run=False, progress=None):
+    """Convert every pending upload in ``queryset`` to a draft prescription by ``doctor``.
+
+    ``progress(report)`` is called after each chunk. Returns the report:
+    counts plus one ``{'upload_id', 'errors'}`` entry per rejected upload.
+    """
+    report = {'processed': 0, 'converted': 0, 'failed': 0, 'items': 0, 'errors': []}
+    rows = pending_uploads(queryset).order_by('id').values_list('id', 'patient_id', 'parsed_data')
+
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            report['items'] += _write_chunk(doctor, chunk)
+        elif chunk:
+            report['items'] += sum(len(items) for _, _, _, items in chunk)
+        report['converted'] += len(chunk)
+        chunk.clear()
+        if progress:
+            progress(report)
+
+    for upload_id, patient_id, parsed_data in rows.iterator(chunk_size=batch_size):
+        report['processed'] += 1
+        fields, items, errors = map_upload(upload_id, parsed_data)
+        if errors:
+            report['failed'] += 1
+            report['errors'].append({'upload_id': upload_id, 'errors': errors})
+        else:
+            chunk.append((upload_id, patient_id, fields, items))
+        if len(chunk) >= batch_size:
+            flush()
+    flush()
+    return report
@@ -0,0 +1,125 @@
+"""Multi-page uploads: PDF rasterization and page bookkeeping.
+
+A PDF upload is split into one JPEG per page with PyMuPDF, entirely
+locally. Uploads made of several photos store every photo as a page. Plain
+single-image uploads have no pages and keep the single-call path.
+"""
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from .hash_index import CHUNK_FIELDS, flag_reuse
+from .models import UploadPage
+from .phash import phash, to_hex
+
+PDF_EXTENSIONS = ('.pdf',)
+
+
+def is_pdf(name):
+    return os.path.splitext(name or '')[1].lower() in PDF_EXTENSIONS
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            raise ValueError("PDF uploads require PyMuPDF (pip install PyMuPDF)")
+    return pymupdf
+
+
+def rasterize_pdf(path, dpi=None, max_pages=None):
+    """Render each PDF page to JPEG bytes"""
+    dpi = dpi or settings.OCR_PDF_DPI
+    max_pages = max_pages or settings.OCR_MAX_PAGES
+    pymupdf = _pymupdf()
+    with pymupdf.open(path) as document:
+        if document.page_count > max_pages:
+            raise ValueError(f"Document has {document.page_count} pages; the limit is {max_pages}")
+        return [page.get_pixmap(dpi=dpi).tobytes('jpeg') for page in document]
+
+
+def add_image_pages(upload, images):
+    """Store a multi-image upload: the main image is page 1, extras follow"""
+    pages = [UploadPage(upload=upload, page_number=1, image=upload.image.name)]
+    for number, image in enumerate(images, start=2):
+        page = UploadPage(upload=upload, page_number=number)
+        page.image.save(image.name, image, save=False)
+        pages.append(page)
+    UploadPage.objects.bulk_create(pages)
+    upload.page_count = len(pages)
+    upload.save(update_fields=['page_count'])
+
+
+def ensure_pages(upload):
+    """Pages to extract for an upload, rasterizing a PDF on first use.
+
+    Returns an empty list for single-image uploads.
+    """
+    pages = list(upload.pages.order_by('page_number'))
+    if pages or not is_pdf(upload.image.name):
+        return pages
+
+    base = os.path.splitext(os.path.basename(upload.image.name))[0]
+    rendered = rasterize_pdf(upload.image.path)
+    for number, data in enumerate(rendered, start=1):
+        page = UploadPage(upload=upload, page_number=number)
+        page.image.save(f"{base}_p{number}.jpg", ContentFile(data), save=False)
+        pages.append(page)
+    UploadPage.objects.bulk_create(pages)
+    upload.page_count = len(pages)
+    update_fields = ['page_count']
+    if rendered and not upload.phash:
+        # The first page stands in for the document in duplicate detection
+        upload.phash = to_hex(phash(io.BytesIO(rendered[0])))
+        # update_fields limits the save to these columns, so the chunks pre_save fills are named too
+        update_fields += ['phash', *CHUNK_FIELDS]
+    upload.save(update_fields=update_fields)
+    flag_reuse(upload)
+    return pages
+
+
+def merge_page_results(results):
+    """Combine per-page parsed data into one ``parsed_data``.
+
+    Header fields come from the first page that has them; medicines are
+    concatenated in page order, dropping exact repeats (headers and
+    continued lists are often repeated on every page).
+    """
+    merged = {
+        'doctor_name': '',
+        'patient_name': '',
+        'date': '',
+        'diagnosis': '',
+        'medicines': [],
+        'notes': '',
+        'confidence': {},
+    }
+    seen = set()
+    notes = []
+    for result in results:
+        data = result.get('parsed_data') or {}
+        confidence = data.get('confidence') if isinstance(data.get('confidence'), dict) else {}
+        for field in ('doctor_name', 'patient_name', 'date', 'diagnosis'):
+            if not merged[field] and data.get(field):
+                merged[field] = data[field]
+                if field in confidence:
+                    merged['confidence'][field] = confidence[field]
+        if data.get('notes') and data['notes'] not in notes:
+            notes.append(data['notes'])
+        for medicine in data.get('medicines') or []:
+            if not isinstance(medicine, dict):
+                continue
+            key = (
+                str(medicine.get('medicine_name', '')).strip().lower(),
+                str(medicine.get('dosage', '')).strip().lower(),
+                str(medicine.get('frequency', '')).strip().lower(),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged['medicines'].append(medicine)
+    merged['notes'] = '\n'.join(notes)
+    return merged
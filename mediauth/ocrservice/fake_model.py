@@ -0,0 +1,180 @@
+"""Local stand-in for the Groq chat completions API.
+
+Serves recorded model responses over HTTP so the OCR pipeline can be
+benchmarked without network access or API quota. Point the processor at it
+with ``GROQ_BASE_URL = server.url``.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_RESPONSE = json.dumps({
+    "doctor_name": "Dr. Anita Rao",
+    "patient_name": "Rahul Sharma",
+    "date": "12/03/2025",
+    "diagnosis": "Acute bronchitis",
+    "medicines": [
+        {
+            "medicine_name": "Amoxicillin",
+            "dosage": "500mg",
+            "frequency": "3 times a day",
+            "duration": "7 days",
+            "quantity": "21",
+            "instructions": "After food"
+        },
+        {
+            "medicine_name": "Paracetamol",
+            "dosage": "650mg",
+            "frequency": "twice daily",
+            "duration": "5 days",
+            "quantity": "10",
+            "instructions": "If fever persists"
+        }
+    ],
+    "notes": "Review after one week"
+}, indent=2)
+
+
+def load_recorded_responses(path):
+    """Load recorded responses from a JSON list or a JSONL file.
+
+    Each entry is either the raw message content string or a full chat
+    completion body as returned by the API.
+    """
+    text = Path(path).read_text()
+    stripped = text.lstrip()
+    if stripped.startswith('['):
+        return json.loads(stripped)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class FakeModelServer:
+    """Threaded HTTP server answering ``/openai/v1/chat/completions``"""
+
+    def __init__(self, responses=None, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, truncate_rate=0.0, seed=None,
+                 host='127.0.0.1', port=0):
+        self.responses = list(responses) if responses else [DEFAULT_RESPONSE]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'truncated': 0}
+        self._cursor = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_reply(self, model):
+        """Pick the next recorded response and decide which fault to inject"""
+        with self.lock:
+            self.stats['requests'] += 1
+            recorded = self.responses[self._cursor % len(self.responses)]
+            self._cursor += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self.random.random() < self.error_rate
+            truncate = not fail and self.random.random() < self.truncate_rate
+            cut = self.random.uniform(0.2, 0.8)
+            if fail:
+                self.stats['errors'] += 1
+            if truncate:
+                self.stats['truncated'] += 1
+
+        if fail:
+            return delay, 500, {'error': {'message': 'Injected model failure', 'type': 'server_error'}}
+
+        if isinstance(recorded, dict):
+            body = json.loads(json.dumps(recorded))
+            body['model'] = model or body.get('model', '')
+        else:
+            body = self.completion_body(recorded, model)
+
+        if truncate:
+            choice = body['choices'][0]
+            content = choice['message']['content']
+            choice['message']['content'] = content[:int(len(content) * cut)]
+            choice['finish_reason'] = 'length'
+        return delay, 200, body
+
+    def completion_body(self, content, model):
+        prompt_tokens = 1200
+        completion_tokens = max(1, len(content) // 4)
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = self.rfile.read(length)
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send(404, {'error': {'message': 'Not found'}})
+                    return
+                try:
+                    model = json.loads(payload or b'{}').get('model', '')
+                except ValueError:
+                    self._send(400, {'error': {'message': 'Invalid JSON body'}})
+                    return
+                delay, status_code, body = server.next_reply(model)
+                if delay:
+                    time.sleep(delay / 1000)
+                self._send(status_code, body)
+
+            def _send(self, status_code, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,92 +1,122 @@
 import base64
 import json
+import logging
+import os
+import time
 from groq import Groq
 from django.conf import settings
+from mediauth import metrics
+from .prompts import estimate_completion_tokens, get_prompt
+
+logger = logging.getLogger(__name__)
 
 class GroqPrescriptionProcessor:
     def __init__(self):
         if not settings.GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY is not configured in settings")
         
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
+        self.client = Groq(
+            api_key=settings.GROQ_API_KEY,
+            base_url=settings.GROQ_BASE_URL,
+            max_retries=settings.GROQ_MAX_RETRIES,
+        )
         self.model = "meta-llama/llama-4-scout-17b-16e-instruct"  # Updated Groq vision model
-        print(f"Groq client initialized with model: {self.model}")  # Debug log
+        logger.debug("Groq client initialized with model: %s", self.model)
     
     def encode_image(self, image_path):
         """Encode image to base64"""
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            data = image_file.read()
+        metrics.ocr_image_bytes.observe(len(data), model=self.model)
+        return base64.b64encode(data).decode('utf-8')
+    
+    def new_usage(self):
+        """Usage record filled in by create_completion"""
+        return {
+            'model': self.model,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_tokens': 0,
+            'latency_ms': None,
+            'image_bytes': 0,
+            'max_completion_tokens': 0,
+        }
     
-    def process_prescription(self, image_path):
+    def create_completion(self, usage, **kwargs):
+        """Call the chat completions API, adding latency and tokens to usage"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            completion = self.client.chat.completions.create(model=self.model, **kwargs)
+            outcome = 'ok'
+            reported = getattr(completion, 'usage', None)
+            if reported is not None:
+                usage['prompt_tokens'] += reported.prompt_tokens or 0
+                usage['completion_tokens'] += reported.completion_tokens or 0
+                usage['total_tokens'] += reported.total_tokens or 0
+            return completion
+        finally:
+            elapsed = time.perf_counter() - started
+            usage['latency_ms'] = round((usage['latency_ms'] or 0) + elapsed * 1000, 3)
+            metrics.ocr_model_latency.observe(elapsed, model=self.model, outcome=outcome)
+    
+    def build_request(self, prompt, base64_image):
+        """Chat completion arguments for a prompt plus one image"""
+        request = {
+            'messages': [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}",
+                            },
+                        },
+                    ],
+                }
+            ],
+            'temperature': 0.1,
+        }
+        if settings.OCR_JSON_MODE:
+            request['response_format'] = {"type": "json_object"}
+        return request
+    
+    def process_prescription(self, image_path, prompt_version=None):
         """Process prescription image using Groq Vision API"""
+        usage = self.new_usage()
+        template = get_prompt(prompt_version)
         try:
             # Encode image
             base64_image = self.encode_image(image_path)
+            usage['image_bytes'] = os.path.getsize(image_path)
+            
+            max_tokens = estimate_completion_tokens(template, image_path)
+            usage['max_completion_tokens'] = max_tokens
+            
+            request = self.build_request(template.text, base64_image)
             
-            # Create prompt for structured extraction
-            prompt = """Analyze this prescription image and extract the following information in JSON format:
-
-{
-  "doctor_name": "Doctor's full name",
-  "patient_name": "Patient's full name",
-  "date": "Date on prescription (format: DD/MM/YYYY)",
-  "diagnosis": "Diagnosis or condition mentioned",
-  "medicines": [
-    {
-      "medicine_name": "Full medicine name",
-      "dosage": "Dosage (e.g., 500mg, 10ml)",
-      "frequency": "How often to take (e.g., twice daily, 3 times a day)",
-      "duration": "Duration (e.g., 7 days, 2 weeks)",
-      "quantity": "Total quantity",
-      "instructions": "Special instructions (e.g., after food, before sleep)"
-    }
-  ],
-  "notes": "Any additional notes or instructions"
-}
-
-Only return the JSON object. If any field is not found or unclear, use an empty string "" for text fields or empty array [] for medicines.
-Extract all medicines you can identify from the prescription."""
-
             # Call Groq Vision API
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                },
-                            },
-                        ],
-                    }
-                ],
-                model=self.model,
-                temperature=0.1,
-                max_completion_tokens=2000,  # Updated parameter name
-            )
+            chat_completion = self.create_completion(usage, max_completion_tokens=max_tokens, **request)
+            
+            # An undersized estimate truncates the JSON; retry once with the full budget
+            if chat_completion.choices[0].finish_reason == 'length' and max_tokens < settings.OCR_COMPLETION_TOKENS['MAX']:
+                max_tokens = settings.OCR_COMPLETION_TOKENS['MAX']
+                usage['max_completion_tokens'] = max_tokens
+                chat_completion = self.create_completion(usage, max_completion_tokens=max_tokens, **request)
             
             # Extract response
             response_text = chat_completion.choices[0].message.content
-            
-            # Parse JSON from response
-            # Sometimes the model wraps JSON in markdown code blocks
-            if "```json" in response_text:
-                json_str = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                json_str = response_text.split("```")[1].split("```")[0].strip()
-            else:
-                json_str = response_text.strip()
-            
-            parsed_data = json.loads(json_str)
+            parsed_data = self.parse_response(response_text)
             
             return {
                 'status': 'completed',
                 'extracted_text': response_text,
                 'parsed_data': parsed_data,
-                'success': True
+                'success': True,
+                'prompt_version': template.version,
+                'usage': usage
             }
             
         except json.JSONDecodeError as e:
@@ -95,7 +125,9 @@ Extract all medicines you can identify from the prescription."""
                 'extracted_text': response_text if 'response_text' in locals() else '',
                 'parsed_data': {},
                 'success': False,
-                'error': f"Failed to parse JSON: {str(e)}"
+                'error': f"Failed to parse JSON: {str(e)}",
+                'prompt_version': template.version,
+                'usage': usage
             }
         except Exception as e:
             return {
@@ -103,5 +135,51 @@ Extract all medicines you can identify from the prescription."""
                 'extracted_text': '',
                 'parsed_data': {},
                 'success': False,
-                'error': str(e)
-            }
\ No newline at end of file
+                'error': str(e),
+                'prompt_version': template.version,
+                'usage': usage
+            }
+    
+    def extract_fields(self, image_data, prompt, max_tokens, prompt_version):
+        """Re-read a few fields from image bytes (often a crop of the original)"""
+        usage = self.new_usage()
+        usage['image_bytes'] = len(image_data)
+        usage['max_completion_tokens'] = max_tokens
+        metrics.ocr_image_bytes.observe(len(image_data), model=self.model)
+        base64_image = base64.b64encode(image_data).decode('utf-8')
+        response_text = ''
+        try:
+            chat_completion = self.create_completion(
+                usage, max_completion_tokens=max_tokens, **self.build_request(prompt, base64_image)
+            )
+            response_text = chat_completion.choices[0].message.content
+            return {
+                'status': 'completed',
+                'extracted_text': response_text,
+                'parsed_data': self.parse_response(response_text),
+                'success': True,
+                'prompt_version': prompt_version,
+                'usage': usage
+            }
+        except Exception as e:
+            return {
+                'status': 'failed',
+                'extracted_text': response_text,
+                'parsed_data': {},
+                'success': False,
+                'error': str(e),
+                'prompt_version': prompt_version,
+                'usage': usage
+            }
+    
+    def parse_response(self, response_text):
+        """Parse JSON from response"""
+        # Sometimes the model wraps JSON in markdown code blocks
+        if "```json" in response_text:
+            json_str = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            json_str = response_text.split("```")[1].split("```")[0].strip()
+        else:
+            json_str = response_text.strip()
+        
+        return json.loads(json_str)
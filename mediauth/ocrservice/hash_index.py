@@ -0,0 +1,142 @@
+"""Hamming-distance lookups over upload perceptual hashes.
+
+Multi-index hashing: each 64-bit hash is split into four 16-bit chunks and
+filed under each chunk in its own table. Two hashes within ``r`` bits must
+agree to within ``r // 4`` bits on at least one chunk (pigeonhole), so a
+lookup only probes the chunk values that close to the query's chunks and
+checks the handful of candidates filed there, instead of scanning every
+hash.
+
+For uploads the tables are the indexed ``phash_chunk0..3`` columns of
+``PrescriptionUpload`` (filled on save, see ``chunk_fields``), so lookups
+see every committed upload and never a deleted one. ``MultiIndexHash`` is
+the same scheme in memory, for hash sets that are not stored.
+"""
+from functools import lru_cache
+from itertools import combinations
+from django.db.models import Q
+from .phash import from_hex
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_FIELDS = tuple(f"phash_chunk{index}" for index in range(CHUNKS))
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """Every CHUNK_BITS-wide mask with at most ``radius`` bits set"""
+    masks = []
+    for count in range(radius + 1):
+        for bits in combinations(range(CHUNK_BITS), count):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            masks.append(mask)
+    return masks
+
+
+def _chunks(value):
+    return [(value >> (CHUNK_BITS * index)) & CHUNK_MASK for index in range(CHUNKS)]
+
+
+class MultiIndexHash:
+    """Hamming-radius lookups over 64-bit hashes; items are any hashable key"""
+
+    def __init__(self):
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, item):
+        self.remove(item)
+        self.values[item] = value
+        for table, chunk in zip(self.tables, _chunks(value)):
+            table.setdefault(chunk, set()).add(item)
+
+    def remove(self, item):
+        value = self.values.pop(item, None)
+        if value is None:
+            return
+        for table, chunk in zip(self.tables, _chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(item)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value, radius):
+        """``(matches, candidates_checked)``; matches are (distance, item) pairs"""
+        masks = _flip_masks(min(radius // CHUNKS, CHUNK_BITS))
+        candidates = set()
+        for table, chunk in zip(self.tables, _chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        matches = []
+        for item in candidates:
+            distance = (self.values[item] ^ value).bit_count()
+            if distance <= radius:
+                matches.append((distance, item))
+        matches.sort()
+        return matches, len(candidates)
+
+
+def chunk_fields(phash_hex):
+    """Values of the ``phash_chunk*`` columns for a hex hash (None without one)"""
+    chunks = _chunks(from_hex(phash_hex)) if phash_hex else [None] * CHUNKS
+    return {field: chunk for field, chunk in zip(CHUNK_FIELDS, chunks)}
+
+
+def similar(phash_hex, radius, exclude=None, limit=50, queryset=None):
+    """Uploads within ``radius`` bits of ``phash_hex``, closest first.
+
+    The chunk lookups run in the database, so every process sees uploads
+    as soon as they are committed, whichever process saved them.
+    """
+    from .models import PrescriptionUpload
+
+    value = from_hex(phash_hex)
+    masks = _flip_masks(min(radius // CHUNKS, CHUNK_BITS))
+    condition = Q()
+    for field, chunk in zip(CHUNK_FIELDS, _chunks(value)):
+        condition |= Q(**{f"{field}__in": [chunk ^ mask for mask in masks]})
+    queryset = PrescriptionUpload.objects.all() if queryset is None else queryset
+    if exclude is not None:
+        queryset = queryset.exclude(pk=exclude)
+    matches = []
+    for upload_id, patient_id, candidate in queryset.filter(condition).values_list('id', 'patient_id', 'phash'):
+        distance = (from_hex(candidate) ^ value).bit_count()
+        if distance <= radius:
+            matches.append((distance, upload_id, patient_id))
+    matches.sort()
+    return [
+        {'upload_id': upload_id, 'patient_id': patient_id, 'distance': distance}
+        for distance, upload_id, patient_id in matches[:limit]
+    ]
+
+
+def flag_reuse(upload):
+    """Check a freshly hashed upload against everything indexed so far.
+
+    Matching another patient's upload marks it ``reuse_suspected``;
+    matching one of the patient's own uploads only adds a warning.
+    """
+    from django.conf import settings
+
+    if not upload.phash:
+        return []
+    matches = similar(upload.phash, settings.OCR_DUPLICATE_DISTANCE, exclude=upload.id)
+    if not matches:
+        return matches
+    fields = []
+    if any(match['patient_id'] != upload.patient_id for match in matches):
+        upload.reuse_suspected = True
+        fields.append('reuse_suspected')
+    if any(match['patient_id'] == upload.patient_id for match in matches):
+        upload.quality_warnings = list(upload.quality_warnings) + ['Looks like a prescription you already uploaded']
+        fields.append('quality_warnings')
+    upload.save(update_fields=fields)
+    return matches
@@ -0,0 +1,54 @@
+import io
+
+from django.core.management.base import BaseCommand
+
+from ocrservice.documents import is_pdf, rasterize_pdf
+from ocrservice.hash_index import CHUNK_FIELDS, chunk_fields
+from ocrservice.models import PrescriptionUpload
+from ocrservice.phash import phash, to_hex
+
+
+def upload_hash(upload):
+    """Hash of the upload's image; the first page stands in for a PDF"""
+    if not is_pdf(upload.image.name):
+        with upload.image.open('rb') as image:
+            return to_hex(phash(image))
+    first_page = upload.pages.order_by('page_number').first()
+    if first_page:
+        with first_page.image.open('rb') as image:
+            return to_hex(phash(image))
+    return to_hex(phash(io.BytesIO(rasterize_pdf(upload.image.path)[0])))
+
+
+class Command(BaseCommand):
+    help = "Compute perceptual hashes for uploads stored before duplicate detection existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per bulk_update')
+        parser.add_argument('--limit', type=int, help='Stop after this many uploads')
+
+    def handle(self, *args, **options):
+        uploads = PrescriptionUpload.objects.filter(phash='').only('id', 'image').order_by('id')
+        if options['limit']:
+            uploads = uploads[:options['limit']]
+
+        batch, hashed, failed = [], 0, 0
+        for upload in uploads.iterator(chunk_size=options['batch_size']):
+            try:
+                upload.phash = upload_hash(upload)
+                # bulk_update skips the pre_save signal that fills these
+                for field, value in chunk_fields(upload.phash).items():
+                    setattr(upload, field, value)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Upload {upload.id}: {e}")
+                continue
+            batch.append(upload)
+            if len(batch) >= options['batch_size']:
+                PrescriptionUpload.objects.bulk_update(batch, ['phash', *CHUNK_FIELDS])
+                hashed += len(batch)
+                batch = []
+        PrescriptionUpload.objects.bulk_update(batch, ['phash', *CHUNK_FIELDS])
+        hashed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} uploads ({failed} failed)"))
@@ -0,0 +1,140 @@
+import io
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from ocrservice.fake_model import FakeModelServer, load_recorded_responses
+from ocrservice.groq_processor import GroqPrescriptionProcessor
+from ocrservice.pipeline import process_upload
+from ocrservice.serializers import PrescriptionUploadCreateSerializer
+
+User = get_user_model()
+
+
+def sample_image_bytes():
+    """Small synthetic prescription-sized JPEG used when no image is given"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (1200, 1600), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(30):
+        draw.text((80, 80 + line * 48), f"Rx line {line}: Amoxicillin 500mg tds x 7 days", fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the upload -> process -> parse OCR pipeline against a local "
+            "fake model server and report latency percentiles, throughput and failures.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Number of uploads to process')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent pipeline workers')
+        parser.add_argument('--latency-ms', type=float, default=250.0, help='Fake model latency')
+        parser.add_argument('--jitter-ms', type=float, default=50.0, help='Uniform +/- latency jitter')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with HTTP 500')
+        parser.add_argument('--truncate-rate', type=float, default=0.0, help='Fraction of responses cut short')
+        parser.add_argument('--max-retries', type=int, default=0, help='Client retries on model errors')
+        parser.add_argument('--responses', help='Recorded responses (JSON list or JSONL)')
+        parser.add_argument('--image', help='Image to upload instead of the synthetic sample')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for fault injection')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        responses = load_recorded_responses(options['responses']) if options['responses'] else None
+        if options['image']:
+            image_name = Path(options['image']).name
+            image_bytes = Path(options['image']).read_bytes()
+        else:
+            image_name, image_bytes = 'sample.jpg', sample_image_bytes()
+
+        server = FakeModelServer(
+            responses=responses,
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            truncate_rate=options['truncate_rate'],
+            seed=options['seed'],
+        )
+
+        with server, isolated_environment(), override_settings(
+            GROQ_API_KEY='bench', GROQ_BASE_URL=server.url, GROQ_MAX_RETRIES=options['max_retries'],
+        ):
+            patient = User.objects.create_user(username='bench-patient', password='bench', user_type='patient')
+            processor = GroqPrescriptionProcessor()
+
+            def run_one(index):
+                stages = {}
+                try:
+                    started = time.perf_counter()
+                    serializer = PrescriptionUploadCreateSerializer(
+                        data={'image': SimpleUploadedFile(image_name, image_bytes, content_type='image/jpeg')},
+                        context={'request': SimpleNamespace(user=patient)},
+                    )
+                    serializer.is_valid(raise_exception=True)
+                    upload = serializer.save()
+                    stages['upload'] = (time.perf_counter() - started) * 1000
+
+                    mark = time.perf_counter()
+                    result = process_upload(upload, processor)
+                    stages['process'] = (time.perf_counter() - mark) * 1000
+
+                    # process_upload parsed the answer once already; parse its raw text again to time parsing alone
+                    mark = time.perf_counter()
+                    parsed = processor.parse_response(result['extracted_text']) if result['success'] else {}
+                    stages['parse'] = (time.perf_counter() - mark) * 1000
+                    medicines = parsed.get('medicines', [])
+                    stages['total'] = (time.perf_counter() - started) * 1000
+
+                    if result['success']:
+                        outcome = 'completed'
+                    elif result.get('error', '').startswith('Failed to parse JSON'):
+                        outcome = 'parse_error'
+                    else:
+                        outcome = 'model_error'
+                    return outcome, stages, len(medicines)
+                except Exception as e:
+                    return f"exception:{type(e).__name__}", stages, 0
+                finally:
+                    connections.close_all()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(run_one, range(options['requests'])))
+            wall_seconds = time.perf_counter() - started
+
+        outcomes = Counter(outcome for outcome, _, _ in results)
+        completed = [stages for outcome, stages, _ in results if outcome == 'completed']
+        report = {
+            'benchmark': 'ocr_pipeline',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in (
+                'requests', 'concurrency', 'latency_ms', 'jitter_ms', 'error_rate',
+                'truncate_rate', 'max_retries', 'seed',
+            )},
+            'wall_seconds': round(wall_seconds, 3),
+            'throughput_per_second': round(len(results) / wall_seconds, 3),
+            'outcomes': dict(outcomes),
+            'failure_rate': round(1 - outcomes['completed'] / len(results), 4),
+            'medicines_extracted': sum(count for _, _, count in results),
+            'latency_ms': {
+                stage: summarize([stages[stage] for _, stages, _ in results if stage in stages])
+                for stage in ('upload', 'process', 'parse', 'total')
+            },
+            'completed_latency_ms': summarize([stages['total'] for stages in completed]),
+            'fake_model': dict(server.stats),
+        }
+        write_report(report, options['output'], self.stdout)
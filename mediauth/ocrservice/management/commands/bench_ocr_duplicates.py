@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from ocrservice import views
+from ocrservice.fake_model import FakeModelServer
+from ocrservice.models import ModelCall, PrescriptionUpload
+
+
+def unguarded_claim(upload, status='processing'):
+    """What reprocessing did before runs were claimed: take the upload whatever runs on it"""
+    token = uuid.uuid4().hex
+    PrescriptionUpload.objects.filter(pk=upload.pk).update(status=status, run_token=token,
+                                                           run_started_at=timezone.now())
+    upload.status, upload.run_token = status, token
+    return token
+
+
+class Command(BaseCommand):
+    help = ("Benchmark duplicate reprocess requests (double clicks, client retries): model calls "
+            "and responses per burst without run claims, with them, and with an Idempotency-Key.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bursts', type=int, default=10, help='Uploads reprocessed per mode')
+        parser.add_argument('--duplicates', type=int, default=4, help='Concurrent identical requests per burst')
+        parser.add_argument('--latency-ms', type=float, default=300.0, help='Fake model latency')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def burst(self, upload, duplicates, key):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(upload.patient).access_token}")
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        start, results = threading.Barrier(duplicates), []
+
+        def send():
+            try:
+                start.wait()
+                started = time.perf_counter()
+                response = client.post(f"/api/ocr/upload/{upload.pk}/reprocess/", **headers)
+                results.append((response.status_code, (time.perf_counter() - started) * 1000))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(duplicates)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def handle(self, *args, **options):
+        modes = {
+            'unguarded': (mock.patch.object(views, 'claim', unguarded_claim), False),
+            'claimed': (mock.patch.object(views, 'claim', views.claim), False),
+            'claimed_with_key': (mock.patch.object(views, 'claim', views.claim), True),
+        }
+        server = FakeModelServer(latency_ms=options['latency_ms'], seed=options['seed'])
+        with server, isolated_environment(), override_settings(
+            GROQ_API_KEY='bench', GROQ_BASE_URL=server.url, GROQ_MAX_RETRIES=0,
+            OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 0, 'TOKENS_PER_DAY': 0},
+        ):
+            bursts = options['bursts']
+            generate_dataset(doctors=1, patients=bursts, pharmacists=0, prescriptions=0,
+                             uploads=bursts * len(modes), seed=options['seed'])
+            uploads = list(PrescriptionUpload.objects.select_related('patient').order_by('pk'))
+
+            runs = {}
+            for index, (mode, (patch, keyed)) in enumerate(modes.items()):
+                batch = uploads[index * bursts:][:bursts]
+                before = server.stats['requests']
+                results = []
+                with patch:
+                    for upload in batch:
+                        results += self.burst(upload, options['duplicates'], uuid.uuid4().hex if keyed else None)
+                model_calls = server.stats['requests'] - before
+                runs[mode] = {
+                    'requests': len(results),
+                    'status_codes': dict(Counter(str(code) for code, _ in results)),
+                    'latency_ms': summarize([latency for _, latency in results]),
+                    'model_calls': model_calls,
+                    'model_calls_per_burst': round(model_calls / bursts, 2),
+                    'usage_rows': ModelCall.objects.filter(upload__in=batch).count(),
+                    'final_status': dict(Counter(PrescriptionUpload.objects.filter(
+                        pk__in=[upload.pk for upload in batch]).values_list('status', flat=True))),
+                    'left_claimed': PrescriptionUpload.objects.filter(
+                        pk__in=[upload.pk for upload in batch]).exclude(run_token='').count(),
+                }
+
+        write_report({
+            'benchmark': 'ocr_duplicates',
+            'environment': describe_environment(),
+            'config': {**{key: options[key] for key in ('bursts', 'duplicates', 'latency_ms', 'seed')},
+                       'runs': settings.OCR_RUNS},
+            'modes': runs,
+        }, options['output'], self.stdout)
@@ -0,0 +1,130 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from ocrservice.hash_index import MultiIndexHash, chunk_fields, similar
+from ocrservice.models import PrescriptionUpload
+from ocrservice.phash import to_hex
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def synthetic_hashes(size, duplicate_rate, max_flips, rng):
+    """Random hashes with a share of near-duplicates (a few bits flipped)"""
+    hashes = []
+    for _ in range(size):
+        if hashes and rng.random() < duplicate_rate:
+            hashes.append(flip_bits(rng.choice(hashes), rng.randint(0, max_flips), rng))
+        else:
+            hashes.append(rng.getrandbits(64))
+    return hashes
+
+
+def linear_scan(np, table, values, query, radius):
+    """Vectorized brute force: XOR everything, popcount through a byte table"""
+    xor = np.bitwise_xor(values, np.uint64(query))
+    distances = table[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+    return np.flatnonzero(distances <= radius)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the perceptual-hash index: build time, query latency and "
+            "candidates checked, against a numpy linear scan over the same hashes, "
+            "and optionally the database-backed lookup uploads use.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=200000, help='Hashes in the index')
+        parser.add_argument('--queries', type=int, default=500, help='Lookups to time')
+        parser.add_argument('--radius', type=int, default=6, help='Hamming radius per lookup')
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help='Share of near-duplicate hashes')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', action='store_true',
+                            help='Also time lookups over the same hashes stored as uploads')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def database_lookups(self, hashes, queries, found, radius, options):
+        with isolated_environment():
+            patient = generate_dataset(doctors=0, patients=1, pharmacists=0, prescriptions=0, uploads=0,
+                                       seed=options['seed'])['patient'][0]
+            rows = []
+            for value in hashes:
+                rows.append(PrescriptionUpload(patient=patient, image='bench.jpg', original_filename='bench.jpg',
+                                               status='completed', phash=to_hex(value), **chunk_fields(to_hex(value))))
+            created = PrescriptionUpload.objects.bulk_create(rows, batch_size=1000)
+            items = {upload.pk: item for item, upload in enumerate(created)}
+            latencies, mismatches = [], 0
+            for query, expected in zip(queries, found):
+                mark = time.perf_counter()
+                matches = similar(to_hex(query), radius, limit=len(hashes))
+                latencies.append((time.perf_counter() - mark) * 1000)
+                if sorted(items[match['upload_id']] for match in matches) != expected:
+                    mismatches += 1
+        return {'query_latency_ms': summarize(latencies), 'result_mismatches': mismatches}
+
+    def handle(self, *args, **options):
+        import numpy as np
+
+        if options['size'] < 1 or options['queries'] < 1:
+            raise CommandError('--size and --queries must be positive')
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+        hashes = synthetic_hashes(options['size'], options['duplicate_rate'], radius, rng)
+
+        started = time.perf_counter()
+        index = MultiIndexHash()
+        for item, value in enumerate(hashes):
+            index.add(value, item)
+        build_seconds = time.perf_counter() - started
+
+        # Half the queries are near-duplicates of indexed hashes, half are new images
+        queries = [
+            flip_bits(rng.choice(hashes), rng.randint(0, radius), rng) if i % 2 == 0 else rng.getrandbits(64)
+            for i in range(options['queries'])
+        ]
+
+        index_ms, checked, found = [], [], []
+        for query in queries:
+            mark = time.perf_counter()
+            matches, candidates = index.search(query, radius)
+            index_ms.append((time.perf_counter() - mark) * 1000)
+            checked.append(candidates)
+            found.append(sorted(item for _, item in matches))
+
+        values = np.array(hashes, dtype=np.uint64)
+        table = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+        scan_ms, mismatches = [], 0
+        for query, expected in zip(queries, found):
+            mark = time.perf_counter()
+            indexes = linear_scan(np, table, values, query, radius)
+            scan_ms.append((time.perf_counter() - mark) * 1000)
+            if indexes.tolist() != expected:
+                mismatches += 1
+
+        index_summary, scan_summary = summarize(index_ms), summarize(scan_ms)
+        database = self.database_lookups(hashes, queries, found, radius, options) if options['database'] else None
+        report = {
+            'benchmark': 'phash_index',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('size', 'queries', 'radius', 'duplicate_rate', 'seed')},
+            'build_seconds': round(build_seconds, 3),
+            'build_per_second': round(len(hashes) / build_seconds, 1),
+            'query_latency_ms': index_summary,
+            'candidates_checked': {
+                'mean': round(sum(checked) / len(checked), 1),
+                'max': max(checked),
+                'mean_fraction': round(sum(checked) / len(checked) / len(hashes), 6),
+            },
+            'matches_per_query': round(sum(len(items) for items in found) / len(found), 2),
+            'linear_scan_ms': scan_summary,
+            'speedup_p50': round(scan_summary['p50'] / index_summary['p50'], 2) if index_summary['p50'] else None,
+            'result_mismatches': mismatches,
+            'database': database,
+        }
+        write_report(report, options['output'], self.stdout)
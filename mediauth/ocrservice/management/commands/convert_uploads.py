@@ -0,0 +1,69 @@
+import json
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ocrservice.conversion import convert_uploads, pending_uploads
+from ocrservice.models import PrescriptionUpload
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Convert completed OCR uploads into draft prescriptions for a doctor, "
+            "in batched inserts with chunked transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', required=True, help='Username of the doctor the drafts belong to')
+        parser.add_argument('--patient', action='append', default=[], help='Only this patient (repeatable)')
+        parser.add_argument('--upload', type=int, action='append', default=[], help='Only this upload id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Uploads per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing')
+        parser.add_argument('--errors', help='Write per-upload errors here as JSON lines')
+
+    def handle(self, *args, **options):
+        try:
+            doctor = User.objects.get(username=options['doctor'], user_type='doctor')
+        except User.DoesNotExist:
+            raise CommandError(f"No doctor named {options['doctor']!r}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        uploads = PrescriptionUpload.objects.all()
+        if options['patient']:
+            uploads = uploads.filter(patient__username__in=options['patient'])
+        if options['upload']:
+            uploads = uploads.filter(id__in=options['upload'])
+        total = pending_uploads(uploads).count()
+        self.stdout.write(f"{total} uploads to convert")
+
+        started = time.perf_counter()
+
+        def progress(report):
+            elapsed = time.perf_counter() - started
+            rate = report['processed'] / elapsed if elapsed else 0
+            self.stdout.write(
+                f"  {report['processed']}/{total} processed, {report['converted']} converted, "
+                f"{report['failed']} failed ({rate:.0f} uploads/s)"
+            )
+
+        report = convert_uploads(uploads, doctor, batch_size=options['batch_size'],
+                                 dry_run=options['dry_run'], progress=progress)
+
+        if options['errors']:
+            with Path(options['errors']).open('w') as handle:
+                for entry in report['errors']:
+                    handle.write(json.dumps(entry) + '\n')
+        else:
+            for entry in report['errors'][:20]:
+                self.stderr.write(f"Upload {entry['upload_id']}: {'; '.join(entry['errors'])}")
+            if len(report['errors']) > 20:
+                self.stderr.write(f"... {len(report['errors']) - 20} more; use --errors to save them all")
+
+        verb = 'Would convert' if options['dry_run'] else 'Converted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['converted']} uploads ({report['items']} items), "
+            f"{report['failed']} rejected in {time.perf_counter() - started:.1f}s"
+        ))
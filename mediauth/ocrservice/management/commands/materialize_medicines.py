@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from ocrservice.medicines import materialize_batch
+from ocrservice.models import ExtractedMedicine, PrescriptionUpload
+
+
+class Command(BaseCommand):
+    help = ("Backfill ExtractedMedicine rows from PrescriptionUpload.parsed_data, "
+            "streaming uploads in batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Uploads per transaction')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild every completed upload, not only those without rows')
+
+    def handle(self, *args, **options):
+        uploads = PrescriptionUpload.objects.filter(status='completed')
+        if not options['rebuild']:
+            uploads = uploads.filter(~Exists(ExtractedMedicine.objects.filter(upload=OuterRef('pk'))))
+        rows = uploads.order_by('id').values_list('id', 'patient_id', 'parsed_data')
+
+        started = time.perf_counter()
+        batch, processed, created = [], 0, 0
+        for row in rows.iterator(chunk_size=options['batch_size']):
+            batch.append(row)
+            if len(batch) >= options['batch_size']:
+                created += materialize_batch(batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            created += materialize_batch(batch)
+            processed += len(batch)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Materialized {created} medicines from {processed} uploads in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,73 @@
+"""Materialize extracted medicines into ``ExtractedMedicine`` rows.
+
+``parsed_data`` stays the source of truth; the rows are rebuilt whenever it
+changes so medicine-level queries ("every upload mentioning amoxicillin")
+are index lookups on ``normalized_name`` instead of JSON scans.
+"""
+import re
+from django.db import transaction
+from .models import ExtractedMedicine
+
+DOSAGE_FORM_PREFIXES = ('tab', 'tabs', 'tablet', 'cap', 'caps', 'capsule', 'syp', 'syrup', 'inj', 'oint')
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(name):
+    """Search key for a medicine name: 'Tab. Amoxicillin-500' -> 'amoxicillin 500'"""
+    words = NON_WORD.sub(' ', str(name or '').lower()).split()
+    if len(words) > 1 and words[0] in DOSAGE_FORM_PREFIXES:
+        words = words[1:]
+    return ' '.join(words)[:200]
+
+
+def _text(value, limit=None):
+    text = '' if value is None else str(value).strip()
+    return text[:limit] if limit else text
+
+
+def medicine_rows(upload_id, patient_id, parsed_data):
+    """Unsaved ExtractedMedicine rows for one upload's parsed_data"""
+    rows = []
+    medicines = (parsed_data or {}).get('medicines') if isinstance(parsed_data, dict) else None
+    for position, medicine in enumerate(medicines or []):
+        if not isinstance(medicine, dict):
+            continue
+        name = _text(medicine.get('medicine_name'), 200)
+        normalized = normalize_name(name)
+        if not normalized:
+            continue
+        page = medicine.get('page')
+        rows.append(ExtractedMedicine(
+            upload_id=upload_id,
+            patient_id=patient_id,
+            position=position,
+            page=page if isinstance(page, int) and page > 0 else None,
+            medicine_name=name,
+            normalized_name=normalized,
+            dosage=_text(medicine.get('dosage'), 100),
+            frequency=_text(medicine.get('frequency'), 100),
+            duration=_text(medicine.get('duration'), 100),
+            quantity=_text(medicine.get('quantity'), 50),
+            instructions=_text(medicine.get('instructions')),
+        ))
+    return rows
+
+
+def materialize_medicines(upload):
+    """Replace an upload's medicine rows with what its parsed_data holds now"""
+    rows = medicine_rows(upload.id, upload.patient_id, upload.parsed_data)
+    with transaction.atomic():
+        ExtractedMedicine.objects.filter(upload_id=upload.id).delete()
+        ExtractedMedicine.objects.bulk_create(rows)
+    return rows
+
+
+def materialize_batch(uploads):
+    """Rebuild medicine rows for many ``(id, patient_id, parsed_data)`` tuples in one transaction"""
+    rows = []
+    for upload_id, patient_id, parsed_data in uploads:
+        rows.extend(medicine_rows(upload_id, patient_id, parsed_data))
+    with transaction.atomic():
+        ExtractedMedicine.objects.filter(upload_id__in=[upload[0] for upload in uploads]).delete()
+        ExtractedMedicine.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
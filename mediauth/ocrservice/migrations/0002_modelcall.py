@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ocrservice', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('total_tokens', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.FloatField()),
+                ('image_bytes', models.PositiveIntegerField(default=0)),
+                ('success', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_model_calls', to=settings.AUTH_USER_MODEL)),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='model_calls', to='ocrservice.prescriptionupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'created_at'], name='ocrservice__patient_5e65d1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0002_modelcall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelcall',
+            name='max_completion_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelcall',
+            name='prompt_version',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='prompt_version',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:06
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0003_modelcall_max_completion_tokens_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='page_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='prescriptionupload',
+            name='image',
+            field=models.FileField(upload_to='prescription_images/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tif', 'tiff', 'pdf'])]),
+        ),
+        migrations.CreateModel(
+            name='UploadPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('image', models.ImageField(upload_to='prescription_pages/')),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing', max_length=20)),
+                ('extracted_text', models.TextField(blank=True)),
+                ('parsed_data', models.JSONField(blank=True, default=dict)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='ocrservice.prescriptionupload')),
+            ],
+            options={
+                'ordering': ['page_number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='uploadpage',
+            constraint=models.UniqueConstraint(fields=('upload', 'page_number'), name='unique_upload_page'),
+        ),
+    ]
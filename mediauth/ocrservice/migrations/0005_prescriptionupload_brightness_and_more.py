@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0004_prescriptionupload_page_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='brightness',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='contrast',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='quality_warnings',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='sharpness',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0005_prescriptionupload_brightness_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='phash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='reuse_suspected',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ocrservice', '0006_prescriptionupload_phash_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedMedicine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('page', models.PositiveIntegerField(blank=True, null=True)),
+                ('medicine_name', models.CharField(max_length=200)),
+                ('normalized_name', models.CharField(db_index=True, max_length=200)),
+                ('dosage', models.CharField(blank=True, max_length=100)),
+                ('frequency', models.CharField(blank=True, max_length=100)),
+                ('duration', models.CharField(blank=True, max_length=100)),
+                ('quantity', models.CharField(blank=True, max_length=50)),
+                ('instructions', models.TextField(blank=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extracted_medicines', to=settings.AUTH_USER_MODEL)),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='medicines', to='ocrservice.prescriptionupload')),
+            ],
+            options={
+                'ordering': ['upload', 'position'],
+                'indexes': [models.Index(fields=['patient', 'normalized_name'], name='ocrservice__patient_c7cb35_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0005_alter_prescription_prescription_id'),
+        ('ocrservice', '0007_extractedmedicine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='prescription',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source_upload', to='prescriptions.prescription'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:19
+
+from django.db import migrations, models
+
+
+def fill_chunks(apps, schema_editor):
+    PrescriptionUpload = apps.get_model('ocrservice', 'PrescriptionUpload')
+    batch = []
+    for upload in PrescriptionUpload.objects.exclude(phash='').only('id', 'phash').iterator(chunk_size=2000):
+        value = int(upload.phash, 16)
+        for index in range(4):
+            setattr(upload, f"phash_chunk{index}", (value >> (16 * index)) & 0xFFFF)
+        batch.append(upload)
+        if len(batch) >= 2000:
+            PrescriptionUpload.objects.bulk_update(batch, [f"phash_chunk{index}" for index in range(4)])
+            batch = []
+    PrescriptionUpload.objects.bulk_update(batch, [f"phash_chunk{index}" for index in range(4)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0009_upload_run_token_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='phash_chunk0',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='phash_chunk1',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='phash_chunk2',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionupload',
+            name='phash_chunk3',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_chunks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0010_prescriptionupload_phash_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelcall',
+            name='pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
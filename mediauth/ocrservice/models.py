@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.validators import FileExtensionValidator
 
 User = get_user_model()
 
@@ -11,17 +12,147 @@ class PrescriptionUpload(models.Model):
     ]
     
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_prescriptions')
-    image = models.ImageField(upload_to='prescription_images/')
+    # A single photo, or a multi-page PDF that is split into UploadPage rows
+    image = models.FileField(
+        upload_to='prescription_images/',
+        validators=[FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tif', 'tiff', 'pdf'])],
+    )
     original_filename = models.CharField(max_length=255)
+    page_count = models.PositiveIntegerField(default=1)
+    
+    # Image quality measured at upload time (see ocrservice.quality)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    sharpness = models.FloatField(null=True, blank=True)
+    brightness = models.FloatField(null=True, blank=True)
+    contrast = models.FloatField(null=True, blank=True)
+    quality_warnings = models.JSONField(default=list, blank=True)
+    
+    # Perceptual hash (hex) for near-duplicate detection, see ocrservice.phash
+    phash = models.CharField(max_length=16, blank=True, db_index=True)
+    # Its four 16-bit chunks, probed by Hamming-distance lookups (see ocrservice.hash_index)
+    phash_chunk0 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    phash_chunk1 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    phash_chunk2 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    phash_chunk3 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    reuse_suspected = models.BooleanField(default=False)
     
     # OCR Results
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
     extracted_text = models.TextField(blank=True)
     parsed_data = models.JSONField(default=dict, blank=True)
+    prompt_version = models.CharField(max_length=30, blank=True)
+    
+    # Held by the extraction run in flight, if any (see ocrservice.runs)
+    run_token = models.CharField(max_length=32, blank=True)
+    run_started_at = models.DateTimeField(null=True, blank=True)
+    
+    # Prescription created from this upload by the bulk conversion job
+    prescription = models.OneToOneField(
+        'prescriptions.Prescription', on_delete=models.SET_NULL, null=True, blank=True, related_name='source_upload',
+    )
     
     # Timestamps
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
-        return f"Upload by {self.patient.username} - {self.status}"
\ No newline at end of file
+        return f"Upload by {self.patient.username} - {self.status}"
+
+class UploadPage(models.Model):
+    """One page of a multi-page upload, extracted independently"""
+    upload = models.ForeignKey(PrescriptionUpload, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    image = models.ImageField(upload_to='prescription_pages/')
+    
+    status = models.CharField(max_length=20, choices=PrescriptionUpload.STATUS_CHOICES, default='processing')
+    extracted_text = models.TextField(blank=True)
+    parsed_data = models.JSONField(default=dict, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['page_number']
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'page_number'], name='unique_upload_page'),
+        ]
+    
+    def __str__(self):
+        return f"Page {self.page_number} of upload {self.upload_id}"
+
+
+class ModelCall(models.Model):
+    """Token usage and latency of one vision-model call"""
+    upload = models.ForeignKey(PrescriptionUpload, on_delete=models.CASCADE, related_name='model_calls')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ocr_model_calls')
+    model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=30, blank=True)
+    
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    total_tokens = models.PositiveIntegerField(default=0)
+    max_completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.FloatField()
+    image_bytes = models.PositiveIntegerField(default=0)
+    success = models.BooleanField(default=True)
+    # Holds a budget slot while a call is in flight (see ocrservice.usage.reserve_call)
+    pending = models.BooleanField(default=False)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.model} call for upload {self.upload_id} - {self.total_tokens} tokens"
+
+
+class ExtractedMedicine(models.Model):
+    """One medicine from an upload's parsed_data, materialized for indexed lookups"""
+    upload = models.ForeignKey(PrescriptionUpload, on_delete=models.CASCADE, related_name='medicines')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='extracted_medicines')
+    position = models.PositiveIntegerField()
+    page = models.PositiveIntegerField(null=True, blank=True)
+    
+    medicine_name = models.CharField(max_length=200)
+    # Lowercased, punctuation and dosage-form prefixes stripped; see ocrservice.medicines
+    normalized_name = models.CharField(max_length=200, db_index=True)
+    dosage = models.CharField(max_length=100, blank=True)
+    frequency = models.CharField(max_length=100, blank=True)
+    duration = models.CharField(max_length=100, blank=True)
+    quantity = models.CharField(max_length=50, blank=True)
+    instructions = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['upload', 'position']
+        indexes = [
+            models.Index(fields=['patient', 'normalized_name']),
+        ]
+    
+    def __str__(self):
+        return f"{self.medicine_name} - upload {self.upload_id}"
+
+
+class IdempotencyKey(models.Model):
+    """An ``Idempotency-Key`` a patient sent with an upload or reprocess request"""
+    ACTION_CHOICES = [
+        ('upload', 'Upload'),
+        ('reprocess', 'Reprocess'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ocr_idempotency_keys')
+    key = models.CharField(max_length=255)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    # Set once the upload exists; a retried upload waits for it
+    upload = models.ForeignKey(PrescriptionUpload, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='idempotency_keys')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_ocr_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} key {self.key} for {self.user_id}"
@@ -0,0 +1,64 @@
+"""Perceptual hashes for spotting the same prescription photographed twice.
+
+``phash`` keeps the sign pattern of the lowest DCT frequencies of a 32x32
+grayscale thumbnail, so it survives re-compression, resizing and small
+lighting changes. Hashes are 64-bit and compared by Hamming distance.
+"""
+from functools import lru_cache
+
+HASH_SIZE = 8
+SAMPLE_SIZE = 32
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix(n=SAMPLE_SIZE):
+    import numpy as np
+
+    k = np.arange(n).reshape(-1, 1)
+    i = np.arange(n).reshape(1, -1)
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0, :] = np.sqrt(1 / n)
+    return matrix
+
+
+def _thumbnail(image):
+    import numpy as np
+    from PIL import Image
+
+    image.draft('L', (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+    small = image.convert('L').resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.LANCZOS)
+    return np.asarray(small, dtype=np.float64)
+
+
+def phash(file):
+    """64-bit DCT perceptual hash of an image file or file-like object"""
+    import numpy as np
+    from PIL import Image
+
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    with Image.open(file) as image:
+        pixels = _thumbnail(image)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    matrix = _dct_matrix()
+    low = (matrix @ pixels @ matrix.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only reflects overall brightness; leave it out of the median
+    bits = low > np.median(low[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
@@ -0,0 +1,100 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from .documents import ensure_pages, merge_page_results
+from .groq_processor import GroqPrescriptionProcessor
+from .medicines import materialize_medicines
+from .models import UploadPage
+from .runs import release
+from .usage import record_call
+
+logger = logging.getLogger(__name__)
+
+
+def apply_result(upload, result, token=None):
+    """Store a processor result on the upload; returns False if the run lost the upload"""
+    fields = {
+        'status': result['status'],
+        'extracted_text': result['extracted_text'],
+        'parsed_data': result['parsed_data'],
+        'prompt_version': result.get('prompt_version', ''),
+        'processed_at': timezone.now(),
+    }
+    if token is None:
+        for field, value in fields.items():
+            setattr(upload, field, value)
+        upload.save()
+    elif not release(upload, token, **fields):
+        logger.warning("Upload %s was taken over by a newer run; dropping this result", upload.pk)
+        return False
+    materialize_medicines(upload)
+    return True
+
+
+def extract(processor, image_path):
+    """Run the model over one image; an answer that is not a JSON object is a failed extraction"""
+    result = processor.process_prescription(image_path)
+    if result['success'] and not isinstance(result['parsed_data'], dict):
+        result.update(status='failed', parsed_data={}, success=False, error='Model answer is not a JSON object')
+    return result
+
+
+def process_upload(upload, processor=None, token=None):
+    """Run the vision model over an upload and save the parsed result.
+
+    ``token`` is the run's claim on the upload (see ocrservice.runs); the
+    result is only saved while it still holds. Errors raised while building
+    the processor propagate so each caller can report them the way it
+    already does.
+    """
+    processor = processor or GroqPrescriptionProcessor()
+    pages = ensure_pages(upload)
+    if pages:
+        result = process_pages(upload, pages, processor)
+    else:
+        result = extract(processor, upload.image.path)
+        record_call(upload, result)
+    apply_result(upload, result, token)
+    return result
+
+
+def process_pages(upload, pages, processor):
+    """Extract every page concurrently and merge them into one result.
+
+    Model calls run in worker threads; all database writes stay on the
+    calling thread. Wall-clock time follows the slowest page as long as
+    OCR_PAGE_CONCURRENCY covers the page count.
+    """
+    workers = max(1, min(len(pages), settings.OCR_PAGE_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda page: extract(processor, page.image.path), pages))
+
+    now = timezone.now()
+    for page, result in zip(pages, results):
+        page.status = result['status']
+        page.extracted_text = result['extracted_text']
+        page.parsed_data = result['parsed_data']
+        page.processed_at = now
+        record_call(upload, result)
+    UploadPage.objects.bulk_update(pages, ['status', 'extracted_text', 'parsed_data', 'processed_at'])
+
+    # Remember which page each medicine came from so fields can be re-read later
+    for page, result in zip(pages, results):
+        for medicine in result['parsed_data'].get('medicines') or []:
+            if isinstance(medicine, dict):
+                medicine['page'] = page.page_number
+    
+    failed = [page.page_number for page, result in zip(pages, results) if not result['success']]
+    merged = {
+        'status': 'failed' if failed else 'completed',
+        'extracted_text': '\n\n'.join(
+            f"--- Page {page.page_number} ---\n{result['extracted_text']}" for page, result in zip(pages, results)
+        ),
+        'parsed_data': merge_page_results([result for result in results if result['success']]),
+        'success': not failed,
+        'prompt_version': results[0].get('prompt_version', ''),
+    }
+    if failed:
+        merged['error'] = f"Extraction failed for pages {', '.join(map(str, failed))}"
+    return merged
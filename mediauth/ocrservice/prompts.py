@@ -0,0 +1,109 @@
+"""Versioned extraction prompts and completion-token budgeting.
+
+Every processed upload is tagged with the prompt version that produced it,
+so changing ``OCR_PROMPT_VERSION`` never makes old results ambiguous. Add a
+new version instead of editing an existing one.
+"""
+from django.conf import settings
+
+
+class PromptTemplate:
+    def __init__(self, version, text, base_tokens, tokens_per_medicine):
+        self.version = version
+        self.text = text
+        # Expected completion size: fixed fields plus one block per medicine
+        self.base_tokens = base_tokens
+        self.tokens_per_medicine = tokens_per_medicine
+
+    def __repr__(self):
+        return f"PromptTemplate({self.version!r})"
+
+
+V1_PROMPT = """Analyze this prescription image and extract the following information in JSON format:
+
+{
+  "doctor_name": "Doctor's full name",
+  "patient_name": "Patient's full name",
+  "date": "Date on prescription (format: DD/MM/YYYY)",
+  "diagnosis": "Diagnosis or condition mentioned",
+  "medicines": [
+    {
+      "medicine_name": "Full medicine name",
+      "dosage": "Dosage (e.g., 500mg, 10ml)",
+      "frequency": "How often to take (e.g., twice daily, 3 times a day)",
+      "duration": "Duration (e.g., 7 days, 2 weeks)",
+      "quantity": "Total quantity",
+      "instructions": "Special instructions (e.g., after food, before sleep)"
+    }
+  ],
+  "notes": "Any additional notes or instructions"
+}
+
+Only return the JSON object. If any field is not found or unclear, use an empty string "" for text fields or empty array [] for medicines.
+Extract all medicines you can identify from the prescription."""
+
+V2_COMPACT_PROMPT = """Extract this prescription as one JSON object with keys:
+doctor_name, patient_name, date (DD/MM/YYYY), diagnosis, notes,
+medicines: [{medicine_name, dosage, frequency, duration, quantity, instructions}].
+Use "" for unclear text and [] if no medicines. Return only compact JSON."""
+
+V3_CONFIDENCE_PROMPT = """Extract this prescription as one JSON object with keys:
+doctor_name, patient_name, date (DD/MM/YYYY), diagnosis, notes,
+confidence: {field: 0-1 for each of the fields above},
+medicines: [{medicine_name, dosage, frequency, duration, quantity, instructions,
+confidence: {field: 0-1 for each medicine field}, bbox: [x0, y0, x1, y1] of the medicine's
+lines as fractions of image width/height}].
+Use "" for unclear text and [] if no medicines. Return only compact JSON."""
+
+PROMPTS = {
+    'v1': PromptTemplate('v1', V1_PROMPT, base_tokens=200, tokens_per_medicine=110),
+    'v2-compact': PromptTemplate('v2-compact', V2_COMPACT_PROMPT, base_tokens=120, tokens_per_medicine=70),
+    'v3-confidence': PromptTemplate('v3-confidence', V3_CONFIDENCE_PROMPT, base_tokens=170, tokens_per_medicine=130),
+}
+
+
+def get_prompt(version=None):
+    version = version or settings.OCR_PROMPT_VERSION
+    try:
+        return PROMPTS[version]
+    except KeyError:
+        raise ValueError(f"Unknown OCR prompt version: {version}")
+
+
+def estimate_line_count(image_path):
+    """Rough number of text lines, from the dark-pixel row profile.
+
+    The image is reduced to a 256px-high grayscale thumbnail so this costs a
+    few milliseconds regardless of the original resolution.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        image = image.convert('L')
+        image.thumbnail((512, 256))
+        pixels = np.asarray(image, dtype=np.float32)
+
+    if pixels.size == 0:
+        return 0
+    threshold = pixels.mean() - pixels.std()
+    ink_rows = (pixels < threshold).mean(axis=1) > 0.01
+    # Count runs of inked rows: each run is one line of text
+    starts = np.flatnonzero(ink_rows[1:] & ~ink_rows[:-1])
+    return int(len(starts) + (1 if ink_rows[0] else 0))
+
+
+def estimate_completion_tokens(template, image_path):
+    """``max_completion_tokens`` sized for the prescription in the image.
+
+    Roughly every two text lines on a prescription carry one medicine.
+    The estimate is clamped to OCR_COMPLETION_TOKENS; callers retry with
+    the maximum when a response is cut short.
+    """
+    limits = settings.OCR_COMPLETION_TOKENS
+    try:
+        medicines = max(1, estimate_line_count(image_path) // 2)
+    except Exception:
+        return limits['MAX']
+    budget = int((template.base_tokens + template.tokens_per_medicine * medicines) * limits['HEADROOM'])
+    return max(limits['MIN'], min(limits['MAX'], budget))
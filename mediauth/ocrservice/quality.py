@@ -0,0 +1,75 @@
+"""Fast local image-quality checks run before any model call.
+
+Photos are reduced to a fixed-size grayscale array and scored with
+vectorized numpy operations, so a check costs a few milliseconds:
+
+* sharpness - variance of the Laplacian (low means blurry)
+* exposure - mean brightness and contrast (standard deviation)
+* resolution - original width and height
+
+Thresholds live in ``OCR_QUALITY``; every score is stored on the upload so
+they can be tuned against real outcomes.
+"""
+from django.conf import settings
+
+ANALYSIS_SIZE = 800
+
+
+def measure_image(file):
+    """Quality metrics for an image file or file-like object"""
+    import numpy as np
+    from PIL import Image
+
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        # Let the JPEG decoder downscale while decoding when it can
+        scale = min(1.0, ANALYSIS_SIZE / max(width, height))
+        image.draft('L', (max(1, int(width * scale)), max(1, int(height * scale))))
+        gray = image.convert('L')
+        gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+        pixels = np.asarray(gray, dtype=np.float32)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    # 4-neighbour Laplacian over the interior pixels
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    return {
+        'width': width,
+        'height': height,
+        'sharpness': round(float(laplacian.var()), 2) if laplacian.size else 0.0,
+        'brightness': round(float(pixels.mean()), 2),
+        'contrast': round(float(pixels.std()), 2),
+    }
+
+
+def assess(quality):
+    """Split problems into hard rejections and warnings"""
+    limits = settings.OCR_QUALITY
+    errors, warnings = [], []
+
+    if min(quality['width'], quality['height']) < limits['REJECT_MIN_SIDE']:
+        errors.append(f"Image is too small ({quality['width']}x{quality['height']})")
+    elif min(quality['width'], quality['height']) < limits['WARN_MIN_SIDE']:
+        warnings.append('Low resolution; small text may not be readable')
+
+    if quality['sharpness'] < limits['REJECT_SHARPNESS']:
+        errors.append('Image is too blurry to read')
+    elif quality['sharpness'] < limits['WARN_SHARPNESS']:
+        warnings.append('Image looks slightly blurry')
+
+    if quality['brightness'] < limits['REJECT_DARK']:
+        errors.append('Image is too dark')
+    elif quality['brightness'] < limits['WARN_DARK']:
+        warnings.append('Image is quite dark')
+
+    if quality['contrast'] < limits['REJECT_CONTRAST']:
+        errors.append('Image is blank or washed out')
+    elif quality['contrast'] < limits['WARN_CONTRAST']:
+        warnings.append('Low contrast; text may be faint')
+
+    return errors, warnings
@@ -0,0 +1,193 @@
+"""Targeted re-extraction of individual fields.
+
+Instead of re-running the whole image, only the missing or low-confidence
+fields are re-read. When every requested field belongs to medicines with a
+known ``bbox``, just that region of the image is sent, which keeps both the
+prompt (image tokens) and the answer small.
+
+Fields are addressed as ``diagnosis`` or ``medicines.<index>.<field>``.
+"""
+import io
+import json
+from django.conf import settings
+
+HEADER_FIELDS = ('doctor_name', 'patient_name', 'date', 'diagnosis', 'notes')
+MEDICINE_FIELDS = ('medicine_name', 'dosage', 'frequency', 'duration', 'quantity', 'instructions')
+FIELD_PROMPT_VERSION = 'fields-v1'
+CROP_PADDING = 0.03
+TOKENS_PER_FIELD = 40
+
+
+def _confidence(container, field):
+    confidence = container.get('confidence')
+    if isinstance(confidence, dict):
+        try:
+            return float(confidence.get(field))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def low_confidence_fields(parsed_data, threshold=None):
+    """Field paths that are empty or below the confidence threshold"""
+    threshold = settings.OCR_FIELD_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    fields = []
+    for field in HEADER_FIELDS:
+        confidence = _confidence(parsed_data, field)
+        if field != 'notes' and not parsed_data.get(field):
+            fields.append(field)
+        elif confidence is not None and confidence < threshold:
+            fields.append(field)
+    for index, medicine in enumerate(parsed_data.get('medicines') or []):
+        if not isinstance(medicine, dict):
+            continue
+        for field in MEDICINE_FIELDS:
+            confidence = _confidence(medicine, field)
+            if field != 'instructions' and not medicine.get(field):
+                fields.append(f"medicines.{index}.{field}")
+            elif confidence is not None and confidence < threshold:
+                fields.append(f"medicines.{index}.{field}")
+    return fields
+
+
+def validate_fields(parsed_data, fields):
+    """Reject unknown paths or medicine indexes out of range"""
+    medicines = parsed_data.get('medicines') or []
+    errors = []
+    for path in fields:
+        parts = str(path).split('.')
+        if len(parts) == 1 and parts[0] in HEADER_FIELDS:
+            continue
+        if (len(parts) == 3 and parts[0] == 'medicines' and parts[1].isdigit()
+                and int(parts[1]) < len(medicines) and parts[2] in MEDICINE_FIELDS):
+            continue
+        errors.append(path)
+    return errors
+
+
+def build_prompt(parsed_data, fields):
+    """Compact prompt naming only the fields to re-read, with context"""
+    medicines = parsed_data.get('medicines') or []
+    lines = []
+    for path in fields:
+        parts = path.split('.')
+        if len(parts) == 3:
+            medicine = medicines[int(parts[1])]
+            label = medicine.get('medicine_name') or f"medicine #{int(parts[1]) + 1}"
+            lines.append(f'- "{path}": the {parts[2]} of {label} (current: "{medicine.get(parts[2], "")}")')
+        else:
+            lines.append(f'- "{path}": the {path.replace("_", " ")} (current: "{parsed_data.get(path, "")}")')
+    return (
+        "Re-read only these fields from the prescription image:\n"
+        + "\n".join(lines)
+        + '\nReturn only JSON: {"<field>": {"value": "...", "confidence": 0-1}} for each field listed.'
+    )
+
+
+def _bbox(medicine):
+    bbox = medicine.get('bbox')
+    if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(value) for value in bbox)
+    except (TypeError, ValueError):
+        return None
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        return None
+    return x0, y0, x1, y1
+
+
+def crop_region(parsed_data, fields):
+    """Normalized box covering every requested field, or None for the full image"""
+    medicines = parsed_data.get('medicines') or []
+    boxes = []
+    for path in fields:
+        parts = path.split('.')
+        if len(parts) != 3:
+            return None
+        box = _bbox(medicines[int(parts[1])])
+        if box is None:
+            return None
+        boxes.append(box)
+    if not boxes:
+        return None
+    return (
+        max(0.0, min(box[0] for box in boxes) - CROP_PADDING),
+        max(0.0, min(box[1] for box in boxes) - CROP_PADDING),
+        min(1.0, max(box[2] for box in boxes) + CROP_PADDING),
+        min(1.0, max(box[3] for box in boxes) + CROP_PADDING),
+    )
+
+
+def source_image_path(upload, parsed_data, fields):
+    """Image the fields were read from: the medicine's page for multi-page uploads"""
+    pages = {page.page_number: page for page in upload.pages.all()}
+    if not pages:
+        return upload.image.path
+    medicines = parsed_data.get('medicines') or []
+    numbers = set()
+    for path in fields:
+        parts = path.split('.')
+        numbers.add(medicines[int(parts[1])].get('page', 1) if len(parts) == 3 else 1)
+    # Fields spread over several pages: fall back to the first page for context
+    number = numbers.pop() if len(numbers) == 1 else 1
+    return pages.get(number, pages[min(pages)]).image.path
+
+
+def load_image_bytes(path, region=None):
+    """JPEG bytes of the image, cropped to a normalized region when given"""
+    if region is None:
+        with open(path, 'rb') as image_file:
+            return image_file.read()
+    from PIL import Image
+
+    with Image.open(path) as image:
+        width, height = image.size
+        box = (int(region[0] * width), int(region[1] * height), int(region[2] * width), int(region[3] * height))
+        buffer = io.BytesIO()
+        image.crop(box).convert('RGB').save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+
+def merge_fields(parsed_data, answers, fields):
+    """Write re-read values (and their confidence) into a copy of parsed_data"""
+    merged = json.loads(json.dumps(parsed_data))
+    if isinstance(answers.get('fields'), dict):
+        answers = answers['fields']
+    updated = []
+    for path in fields:
+        answer = answers.get(path)
+        if isinstance(answer, dict):
+            value, confidence = answer.get('value', ''), answer.get('confidence')
+        elif answer is not None:
+            value, confidence = answer, None
+        else:
+            continue
+        parts = path.split('.')
+        container = merged['medicines'][int(parts[1])] if len(parts) == 3 else merged
+        field = parts[-1]
+        container[field] = value
+        if confidence is not None:
+            container.setdefault('confidence', {})
+            if isinstance(container['confidence'], dict):
+                container['confidence'][field] = confidence
+        updated.append(path)
+    return merged, updated
+
+
+def reextract_fields(upload, processor, fields):
+    """Re-read ``fields`` of a processed upload; returns (result, updated paths)"""
+    parsed_data = upload.parsed_data or {}
+    region = crop_region(parsed_data, fields)
+    image_data = load_image_bytes(source_image_path(upload, parsed_data, fields), region)
+    max_tokens = max(settings.OCR_COMPLETION_TOKENS['MIN'], TOKENS_PER_FIELD * len(fields))
+    result = processor.extract_fields(image_data, build_prompt(parsed_data, fields), max_tokens, FIELD_PROMPT_VERSION)
+    result['cropped'] = region is not None
+    if result['success'] and not isinstance(result['parsed_data'], dict):
+        # Valid JSON but not the object the prompt asks for; the call is still recorded as made
+        result.update(success=False, error='Model answer is not a JSON object of fields')
+    if not result['success']:
+        return result, []
+    merged, updated = merge_fields(parsed_data, result['parsed_data'], fields)
+    result['parsed_data'] = merged
+    return result, updated
@@ -0,0 +1,100 @@
+"""At most one extraction per upload, and idempotent upload/reprocess requests.
+
+A run starts with ``claim``: a single conditional UPDATE that sets
+``status='processing'`` and a fresh ``run_token`` only if no other run holds
+the upload. Whoever gets the row back runs the model; everyone else gets
+None and answers with the upload as it stands (``run_finished`` tells
+whether that is a result or a run still in flight) instead of starting a
+second one. The run ends with ``release``, which saves its result only while
+the row still carries its token, so a run whose lease expired
+(``OCR_RUNS['LEASE_SECONDS']``) and was taken over cannot overwrite the newer
+result.
+
+Clients that retry may also send an ``Idempotency-Key`` header. The first
+request with a key stores it (unique per user) and does the work; repeats
+are answered at once with the current state of the upload that request
+created or reprocessed. Nothing waits on a run server-side: a request
+arriving while it is in flight gets 202 and polls the upload, so duplicates
+never hold a worker for the length of a model call.
+"""
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import IdempotencyKey, PrescriptionUpload
+
+KEY_HEADER = 'Idempotency-Key'
+
+
+def claim(upload, status='processing'):
+    """Take the upload for a new run; returns its token, or None while another run holds it"""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OCR_RUNS['LEASE_SECONDS'])
+    fields = {'run_token': uuid.uuid4().hex, 'run_started_at': now}
+    if status:
+        fields['status'] = status
+    claimed = PrescriptionUpload.objects.filter(pk=upload.pk).filter(
+        Q(run_token='') | Q(run_started_at__lt=stale)
+    ).update(**fields)
+    if not claimed:
+        return None
+    for field, value in fields.items():
+        setattr(upload, field, value)
+    return fields['run_token']
+
+
+def release(upload, token, **fields):
+    """End the run holding ``token``, saving ``fields``; False if another run took the upload over"""
+    fields.update(run_token='', run_started_at=None)
+    if not PrescriptionUpload.objects.filter(pk=upload.pk, run_token=token).update(**fields):
+        return False
+    for field, value in fields.items():
+        setattr(upload, field, value)
+    return True
+
+
+def run_finished(upload, since=None):
+    """Reload ``upload``; False while a run holds it.
+
+    With ``since``, a run must also have finished after then, in case the
+    request being repeated has not claimed the upload yet.
+    """
+    upload.refresh_from_db()
+    if upload.run_token:
+        return False
+    return since is None or (upload.processed_at is not None and upload.processed_at >= since)
+
+
+def request_key(request):
+    """The request's ``Idempotency-Key``, or None; raises ValueError if it is too long"""
+    key = request.headers.get(KEY_HEADER, '').strip()
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValueError(f"{KEY_HEADER} is too long")
+    return key or None
+
+
+def remember_key(user, key, action, upload=None):
+    """``(record, True)`` for a key seen for the first time, else the earlier ``(record, False)``"""
+    expired = timezone.now() - timedelta(hours=settings.OCR_RUNS['KEY_TTL_HOURS'])
+    IdempotencyKey.objects.filter(user=user, created_at__lt=expired).delete()
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, action=action, upload=upload), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            # Otherwise the first request failed and dropped the key meanwhile; try again
+            if record is not None:
+                return record, False
+
+
+def keyed_upload(record):
+    """The upload ``record`` refers to, or None while the first request is still creating it"""
+    try:
+        record.refresh_from_db()
+    except IdempotencyKey.DoesNotExist:
+        # The first request failed; the retry may start over with the same key
+        return None
+    return record.upload
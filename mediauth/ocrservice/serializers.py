@@ -1,26 +1,102 @@
 from rest_framework import serializers
-from .models import PrescriptionUpload
+from django.conf import settings
+from mediauth.sparse import SparseFieldsMixin
+from .documents import add_image_pages, is_pdf
+from .hash_index import flag_reuse
+from .models import ModelCall, PrescriptionUpload, UploadPage
+from .phash import phash, to_hex
+from .quality import assess, measure_image
 
-class PrescriptionUploadSerializer(serializers.ModelSerializer):
+class UploadPageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadPage
+        fields = ['page_number', 'image', 'status', 'parsed_data', 'processed_at']
+
+class PrescriptionUploadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    pages = UploadPageSerializer(many=True, read_only=True)
+    
     class Meta:
         model = PrescriptionUpload
-        fields = ['id', 'image', 'original_filename', 'status', 'extracted_text', 
-                 'parsed_data', 'uploaded_at', 'processed_at']
-        read_only_fields = ['id', 'status', 'extracted_text', 'parsed_data', 
+        fields = ['id', 'image', 'original_filename', 'page_count', 'status', 'extracted_text', 
+                 'parsed_data', 'prompt_version', 'image_width', 'image_height', 'sharpness',
+                 'brightness', 'contrast', 'quality_warnings', 'phash', 'reuse_suspected',
+                 'uploaded_at', 'processed_at', 'pages']
+        read_only_fields = ['id', 'page_count', 'status', 'extracted_text', 'parsed_data', 
+                           'prompt_version', 'image_width', 'image_height', 'sharpness',
+                           'brightness', 'contrast', 'quality_warnings', 'phash', 'reuse_suspected',
                            'uploaded_at', 'processed_at']
+        # Left out of list responses unless asked for with ?expand=
+        heavy_fields = ['extracted_text', 'parsed_data', 'pages']
 
 class PrescriptionUploadCreateSerializer(serializers.ModelSerializer):
+    # Further photos of the same prescription, extracted as pages 2..n
+    extra_images = serializers.ListField(child=serializers.ImageField(), required=False, write_only=True)
+    
     class Meta:
         model = PrescriptionUpload
-        fields = ['image']
+        fields = ['image', 'extra_images']
+    
+    def validate_image(self, value):
+        if is_pdf(value.name):
+            return value
+        # Anything that is not a PDF must be a real image
+        value = serializers.ImageField().to_internal_value(value)
+        self.quality, self.quality_warnings = self.check_quality(value)
+        return value
+    
+    def validate_extra_images(self, value):
+        self.extra_warnings = []
+        for number, image in enumerate(value, start=2):
+            _, warnings = self.check_quality(image, f"Page {number}: ")
+            self.extra_warnings += warnings
+        return value
+    
+    def check_quality(self, image, prefix=''):
+        """Measure an image and reject it if it cannot be read"""
+        quality = measure_image(image)
+        errors, warnings = assess(quality)
+        if errors and settings.OCR_QUALITY['ENFORCE']:
+            raise serializers.ValidationError([prefix + error for error in errors])
+        return quality, [prefix + problem for problem in errors + warnings]
+    
+    def validate(self, attrs):
+        extra_images = attrs.get('extra_images', [])
+        if extra_images and is_pdf(attrs['image'].name):
+            raise serializers.ValidationError("Extra images cannot be combined with a PDF upload.")
+        if len(extra_images) + 1 > settings.OCR_MAX_PAGES:
+            raise serializers.ValidationError(f"At most {settings.OCR_MAX_PAGES} pages per upload.")
+        return attrs
     
     def create(self, validated_data):
+        extra_images = validated_data.pop('extra_images', [])
         image = validated_data['image']
         validated_data['original_filename'] = image.name
         
+        quality = getattr(self, 'quality', None)
+        if quality:
+            validated_data.update(
+                image_width=quality['width'],
+                image_height=quality['height'],
+                sharpness=quality['sharpness'],
+                brightness=quality['brightness'],
+                contrast=quality['contrast'],
+            )
+        validated_data['quality_warnings'] = getattr(self, 'quality_warnings', []) + getattr(self, 'extra_warnings', [])
+        if not is_pdf(image.name):
+            validated_data['phash'] = to_hex(phash(image))
+        
         upload = PrescriptionUpload.objects.create(
             patient=self.context['request'].user,
             **validated_data
         )
+        if extra_images:
+            add_image_pages(upload, extra_images)
+        flag_reuse(upload)
         
-        return upload
\ No newline at end of file
+        return upload
+
+class ModelCallSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ModelCall
+        fields = ['id', 'model', 'prompt_version', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+                 'max_completion_tokens', 'latency_ms', 'image_bytes', 'success', 'created_at']
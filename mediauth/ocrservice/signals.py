@@ -0,0 +1,10 @@
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from .hash_index import chunk_fields
+from .models import PrescriptionUpload
+
+
+@receiver(pre_save, sender=PrescriptionUpload)
+def store_hash_chunks(sender, instance, **kwargs):
+    for field, value in chunk_fields(instance.phash).items():
+        setattr(instance, field, value)
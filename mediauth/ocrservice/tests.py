@@ -1,3 +1,446 @@
-from django.test import TestCase
+import io
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from mediauth.testing import IsolatedTestMixin
+from users.models import User
+from .fake_model import DEFAULT_RESPONSE, FakeModelServer
+from .hash_index import MultiIndexHash, chunk_fields, flag_reuse, similar
+from .medicines import materialize_medicines, normalize_name
+from .models import IdempotencyKey, ModelCall, PrescriptionUpload
+from .runs import claim, release, run_finished
+from .usage import budget_status, reserve_call
 
-# Create your tests here.
+PARSED = {'patient_name': 'Alice Moreno', 'medicines': [{'medicine_name': 'Amoxicillin', 'dosage': '500mg'}]}
+
+
+def image_file(name='rx.png', seed=0):
+    """A noisy PNG that passes the quality checks; ``seed`` varies its content"""
+    noise = random.Random(seed)
+    image = Image.frombytes('L', (400, 400), bytes(noise.randrange(256) for _ in range(400 * 400)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def pdf_file(name='rx.pdf', seed=0):
+    """A one-page PDF of ``image_file(seed=seed)``"""
+    import pymupdf
+
+    image = image_file(seed=seed).read()
+    with pymupdf.open() as document:
+        document.new_page(width=400, height=400).insert_image(pymupdf.Rect(0, 0, 400, 400), stream=image)
+        return SimpleUploadedFile(name, document.tobytes(), content_type='application/pdf')
+
+
+def make_upload(patient, **fields):
+    return PrescriptionUpload.objects.create(patient=patient, image='prescriptions/rx.png',
+                                             original_filename='rx.png', **fields)
+
+
+def make_upload_copy(upload):
+    """The same row as another request would load it"""
+    return PrescriptionUpload.objects.get(pk=upload.pk)
+
+
+class FakeProcessor:
+    """Stands in for the vision model; counts the calls it answers"""
+    calls = 0
+    # What ``process_prescription`` parses from an image
+    parsed = PARSED
+    # What ``extract_fields`` reads back from the image
+    answer = {}
+
+    def process_prescription(self, path):
+        FakeProcessor.calls += 1
+        return {'status': 'completed', 'extracted_text': 'Amoxicillin 500mg', 'parsed_data': FakeProcessor.parsed,
+                'success': True, 'prompt_version': 'test',
+                'usage': {'model': 'fake', 'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15,
+                          'latency_ms': 1.0, 'image_bytes': 100, 'max_completion_tokens': 50}}
+
+    def extract_fields(self, image_data, prompt, max_tokens, prompt_version):
+        FakeProcessor.calls += 1
+        result = self.process_prescription(None)
+        result.update(parsed_data=FakeProcessor.answer, prompt_version=prompt_version)
+        return result
+
+
+class FakeModelMixin(IsolatedTestMixin):
+    def setUp(self):
+        super().setUp()
+        FakeProcessor.calls, FakeProcessor.parsed, FakeProcessor.answer = 0, PARSED, {}
+        for target in ('ocrservice.pipeline.GroqPrescriptionProcessor', 'ocrservice.views.GroqPrescriptionProcessor'):
+            patcher = mock.patch(target, FakeProcessor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.patient = User.objects.create_user('pat', password='pw', user_type='patient')
+        self.client.force_authenticate(self.patient)
+
+    def upload(self, key=None, seed=0):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/ocr/upload/', {'image': image_file(seed=seed)}, format='multipart', **headers)
+
+    def uploaded(self, **kwargs):
+        self.assertEqual(self.upload(**kwargs).status_code, 201)
+        return PrescriptionUpload.objects.filter(patient=self.patient).latest('uploaded_at')
+
+    def reprocess(self, upload, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(f"/api/ocr/upload/{upload.pk}/reprocess/", **headers)
+
+
+class RunClaimTests(TestCase):
+    def setUp(self):
+        self.upload = make_upload(User.objects.create_user('pat', user_type='patient'), status='completed')
+
+    def test_one_run_at_a_time(self):
+        token = claim(self.upload)
+        self.assertTrue(token)
+        self.assertIsNone(claim(make_upload_copy(self.upload)))
+        self.assertFalse(run_finished(make_upload_copy(self.upload)))
+        self.assertTrue(release(self.upload, token, status='completed', processed_at=timezone.now()))
+        self.assertTrue(run_finished(make_upload_copy(self.upload)))
+        self.assertTrue(claim(self.upload))
+
+    def test_release_with_a_lost_token_writes_nothing(self):
+        token = claim(self.upload)
+        self.assertFalse(release(self.upload, 'someone-else', status='failed'))
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.status, self.upload.run_token), ('processing', token))
+
+    @override_settings(OCR_RUNS={'LEASE_SECONDS': 60, 'KEY_TTL_HOURS': 24})
+    def test_expired_lease_is_taken_over_and_the_old_run_cannot_save(self):
+        stale = claim(self.upload)
+        PrescriptionUpload.objects.filter(pk=self.upload.pk).update(
+            run_started_at=timezone.now() - timedelta(seconds=120))
+        newer = claim(make_upload_copy(self.upload))
+        self.assertTrue(newer)
+        self.assertFalse(release(self.upload, stale, status='failed'))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.run_token, newer)
+
+    def test_claim_can_leave_the_status_alone(self):
+        claim(self.upload, status=None)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, 'completed')
+
+
+@override_settings(OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 0, 'TOKENS_PER_DAY': 0})
+class IdempotencyTests(FakeModelMixin, APITestCase):
+    def test_repeated_upload_is_replayed(self):
+        first = self.upload(key='k1')
+        self.assertEqual(first.status_code, 201)
+        again = self.upload(key='k1')
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.data['id'], PrescriptionUpload.objects.get().id)
+        self.assertEqual((PrescriptionUpload.objects.count(), FakeProcessor.calls), (1, 1))
+
+    def test_keys_belong_to_one_request(self):
+        upload = self.uploaded(key='k1')
+        self.assertEqual(self.reprocess(upload, key='k1').status_code, 422)
+        self.assertEqual(self.client.post('/api/ocr/upload/', {'image': image_file()}, format='multipart',
+                                          HTTP_IDEMPOTENCY_KEY='k' * 256).status_code, 400)
+
+    def test_repeated_reprocess_is_replayed(self):
+        upload = self.uploaded()
+        self.assertEqual(self.reprocess(upload, key='r1').status_code, 200)
+        again = self.reprocess(upload, key='r1')
+        self.assertEqual((again.status_code, again['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(FakeProcessor.calls, 2)
+        self.assertEqual(IdempotencyKey.objects.filter(user=self.patient).count(), 1)
+
+    def test_reprocess_during_a_run_answers_202_without_a_second_call(self):
+        upload = self.uploaded()
+        token = claim(make_upload_copy(upload))
+        response = self.reprocess(upload)
+        self.assertEqual((response.status_code, response['Idempotent-Replayed']), (202, 'true'))
+        self.assertEqual(FakeProcessor.calls, 1)
+        # The reservation taken for the refused call is gone
+        self.assertFalse(ModelCall.objects.filter(pending=True).exists())
+        release(upload, token)
+
+
+def flipped(phash_hex, *bits):
+    value = int(phash_hex, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return f"{value:016x}"
+
+
+class MultiIndexHashTests(SimpleTestCase):
+    def test_matches_a_linear_scan(self):
+        noise = random.Random(7)
+        base = noise.getrandbits(64)
+        # Near neighbours of one hash, plus unrelated ones
+        values = [base ^ sum(1 << bit for bit in noise.sample(range(64), noise.randrange(12))) for _ in range(300)]
+        values += [noise.getrandbits(64) for _ in range(300)]
+        index = MultiIndexHash()
+        for item, value in enumerate(values):
+            index.add(value, item)
+        for radius in (0, 3, 6, 10):
+            with self.subTest(radius=radius):
+                expected = sorted(((value ^ base).bit_count(), item) for item, value in enumerate(values)
+                                  if (value ^ base).bit_count() <= radius)
+                matches, checked = index.search(base, radius)
+                self.assertEqual(matches, expected)
+                self.assertLess(checked, len(values))
+
+    def test_remove_and_replace(self):
+        index = MultiIndexHash()
+        index.add(0b1011, 'a')
+        index.add(0b1010, 'a')
+        self.assertEqual(index.search(0b1010, 0)[0], [(0, 'a')])
+        index.remove('a')
+        self.assertEqual((len(index), index.search(0b1010, 4)[0]), (0, []))
+
+
+class SimilarUploadTests(IsolatedTestMixin, APITestCase):
+    phash = 'f0e1d2c3b4a59687'
+
+    def setUp(self):
+        self.patient = User.objects.create_user('pat', user_type='patient')
+        self.other = User.objects.create_user('other', user_type='patient')
+
+    def test_saving_files_the_hash_chunks(self):
+        upload = make_upload(self.patient, phash=self.phash)
+        upload.refresh_from_db()
+        self.assertEqual({field: getattr(upload, field) for field in chunk_fields(self.phash)},
+                         chunk_fields(self.phash))
+        upload.phash = ''
+        upload.save()
+        upload.refresh_from_db()
+        self.assertIsNone(upload.phash_chunk0)
+
+    def test_similar_finds_uploads_within_the_radius(self):
+        close = make_upload(self.patient, phash=flipped(self.phash, 1, 20, 40))
+        spread = make_upload(self.patient, phash=flipped(self.phash, 0, 1, 2, 3, 4, 5, 6))
+        make_upload(self.patient, phash=flipped(self.phash, *range(0, 64, 3)))
+        make_upload(self.patient)
+        self.assertEqual(similar(self.phash, 6), [{'upload_id': close.id, 'patient_id': self.patient.id,
+                                                  'distance': 3}])
+        self.assertEqual([match['upload_id'] for match in similar(self.phash, 7)], [close.id, spread.id])
+        self.assertEqual(similar(self.phash, 7, exclude=close.id, limit=1)[0]['upload_id'], spread.id)
+
+    def test_reuse_across_patients_is_flagged(self):
+        make_upload(self.other, phash=flipped(self.phash, 9))
+        upload = make_upload(self.patient, phash=self.phash)
+        flag_reuse(upload)
+        self.assertTrue(upload.reuse_suspected)
+        own = make_upload(self.other, phash=self.phash)
+        flag_reuse(own)
+        self.assertIn('Looks like a prescription you already uploaded', own.quality_warnings)
+
+    def test_patients_only_see_their_own_matches(self):
+        upload = make_upload(self.patient, phash=self.phash)
+        mine = make_upload(self.patient, phash=flipped(self.phash, 2))
+        make_upload(self.other, phash=self.phash)
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(f"/api/ocr/upload/{upload.pk}/similar/")
+        self.assertEqual([match['upload_id'] for match in response.data['matches']], [mine.id])
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(f"/api/ocr/upload/{upload.pk}/similar/").status_code, 404)
+
+
+@override_settings(OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 2, 'TOKENS_PER_DAY': 0})
+class UsageBudgetTests(FakeModelMixin, APITestCase):
+    def test_calls_beyond_the_budget_are_refused(self):
+        upload = self.uploaded()
+        self.assertEqual(self.reprocess(upload).status_code, 200)
+        response = self.reprocess(upload)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 3500)
+        refused = self.upload(seed=1)
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual((PrescriptionUpload.objects.count(), FakeProcessor.calls), (1, 2))
+        self.assertFalse(ModelCall.objects.filter(pending=True).exists())
+
+    def test_reservations_count_until_the_call_is_recorded(self):
+        upload = self.uploaded()
+        reservation = reserve_call(upload)
+        self.assertFalse(budget_status(self.patient)['allowed'])
+        # Reservations are not usage
+        self.assertEqual(len(self.client.get(f"/api/ocr/upload/{upload.pk}/usage/").data), 1)
+        self.assertEqual(self.client.get('/api/ocr/usage/').data['calls'], 1)
+        reservation.delete()
+        self.assertTrue(budget_status(self.patient)['allowed'])
+
+    def test_usage_of_other_patients_uploads_is_not_found(self):
+        upload = self.uploaded()
+        self.client.force_authenticate(User.objects.create_user('other', user_type='patient'))
+        self.assertEqual(self.client.get(f"/api/ocr/upload/{upload.pk}/usage/").status_code, 404)
+
+
+@override_settings(OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 0, 'TOKENS_PER_DAY': 0})
+class ReextractTests(FakeModelMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload = self.uploaded()
+        self.upload.parsed_data = {
+            'patient_name': 'Alice Moreno', 'diagnosis': '',
+            'medicines': [{'medicine_name': 'Amoxicillin', 'dosage': '5OOmg', 'frequency': 'Twice daily',
+                           'duration': '5 days', 'quantity': 10, 'confidence': {'dosage': 0.2},
+                           'bbox': [0.1, 0.4, 0.9, 0.5]}],
+        }
+        self.upload.save()
+
+    def reextract(self, **data):
+        return self.client.post(f"/api/ocr/upload/{self.upload.pk}/reextract/", data, format='json')
+
+    def test_only_the_requested_fields_are_merged(self):
+        FakeProcessor.answer = {'medicines.0.dosage': {'value': '500mg', 'confidence': 0.95}}
+        response = self.reextract(fields=['medicines.0.dosage'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['reextracted_fields'], response.data['cropped']),
+                         (['medicines.0.dosage'], True))
+        self.upload.refresh_from_db()
+        medicine = self.upload.parsed_data['medicines'][0]
+        self.assertEqual((medicine['dosage'], medicine['confidence']['dosage']), ('500mg', 0.95))
+        self.assertEqual(self.upload.parsed_data['patient_name'], 'Alice Moreno')
+        self.assertEqual(self.upload.model_calls.filter(prompt_version='fields-v1').count(), 1)
+
+    def test_low_confidence_and_missing_fields_are_the_default(self):
+        FakeProcessor.answer = {'diagnosis': 'Sinusitis', 'doctor_name': 'Dr. Grey', 'date': '2024-05-01',
+                                'medicines.0.dosage': '500mg'}
+        response = self.reextract()
+        self.assertEqual(sorted(response.data['reextracted_fields']),
+                         ['date', 'diagnosis', 'doctor_name', 'medicines.0.dosage'])
+        # Header fields have no box, so the whole image is sent
+        self.assertFalse(response.data['cropped'])
+
+    def test_answers_that_are_not_an_object_are_a_bad_gateway(self):
+        for answer in (['500mg'], '500mg', 5):
+            with self.subTest(answer=answer):
+                FakeProcessor.answer = answer
+                response = self.reextract(fields=['medicines.0.dosage'])
+                self.assertEqual(response.status_code, 502)
+                self.upload.refresh_from_db()
+                self.assertEqual(self.upload.parsed_data['medicines'][0]['dosage'], '5OOmg')
+                self.assertEqual(self.upload.run_token, '')
+        # Every call was made, so every call is recorded
+        self.assertEqual(self.upload.model_calls.filter(prompt_version='fields-v1', success=False).count(), 3)
+
+    def test_stored_results_that_are_not_an_object_are_rejected(self):
+        for stored in (['Amoxicillin'], 'Amoxicillin', 5):
+            with self.subTest(stored=stored):
+                PrescriptionUpload.objects.filter(pk=self.upload.pk).update(parsed_data=stored)
+                self.assertEqual(self.reextract().status_code, 400)
+                self.assertEqual(self.reextract(fields=['medicines.0.dosage']).status_code, 400)
+        self.assertEqual(FakeProcessor.calls, 1)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.reextract(fields=['medicines.3.dosage', 'secret'])
+        self.assertEqual((response.status_code, response.data['fields']), (400, ['medicines.3.dosage', 'secret']))
+
+
+@override_settings(OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 0, 'TOKENS_PER_DAY': 0})
+class PdfSimilarityTests(FakeModelMixin, APITestCase):
+    def test_pdf_uploads_are_indexed_for_similarity(self):
+        for _ in range(2):
+            response = self.client.post('/api/ocr/upload/', {'image': pdf_file()}, format='multipart')
+            self.assertEqual(response.status_code, 201)
+        first, second = PrescriptionUpload.objects.order_by('id')
+        self.assertEqual(second.page_count, 1)
+        self.assertEqual({field: getattr(second, field) for field in chunk_fields(second.phash)},
+                         chunk_fields(second.phash))
+        matches = self.client.get(f"/api/ocr/upload/{second.pk}/similar/").data['matches']
+        self.assertEqual([match['upload_id'] for match in matches], [first.id])
+        self.assertIn('Looks like a prescription you already uploaded', second.quality_warnings)
+
+
+@override_settings(OCR_USAGE_BUDGETS={'CALLS_PER_HOUR': 0, 'TOKENS_PER_DAY': 0})
+class ExtractionFailureTests(FakeModelMixin, APITestCase):
+    def test_answers_that_are_not_an_object_fail_the_upload(self):
+        FakeProcessor.parsed = ['Amoxicillin 500mg']
+        for document in (image_file(), pdf_file(seed=1)):
+            with self.subTest(document=document.name):
+                response = self.client.post('/api/ocr/upload/', {'image': document}, format='multipart')
+                self.assertLess(response.status_code, 500)
+                upload = PrescriptionUpload.objects.filter(patient=self.patient).latest('uploaded_at')
+                self.assertEqual(upload.status, 'failed')
+                self.assertIsInstance(upload.parsed_data, dict)
+                self.assertFalse(upload.parsed_data.get('medicines'))
+                self.assertFalse(upload.medicines.exists())
+        self.assertFalse(ModelCall.objects.filter(success=True).exists())
+
+
+class MedicineFilterTests(IsolatedTestMixin, APITestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user('pat', user_type='patient')
+        self.client.force_authenticate(self.patient)
+
+    def upload_with(self, patient, *names):
+        upload = make_upload(patient, status='completed',
+                             parsed_data={'medicines': [{'medicine_name': name} for name in names]})
+        materialize_medicines(upload)
+        return upload
+
+    def listed(self, medicine):
+        return sorted(row['id'] for row in self.client.get('/api/ocr/upload/', {'medicine': medicine}).data)
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('Tab. Amoxicillin-500'), 'amoxicillin 500')
+        self.assertEqual(normalize_name('  IBUPROFEN  '), 'ibuprofen')
+        self.assertEqual(normalize_name(None), '')
+
+    def test_filters_own_uploads_by_name_prefix(self):
+        both = self.upload_with(self.patient, 'Amoxicillin 500mg', 'Amoxil')
+        other = self.upload_with(self.patient, 'Cap. Amoxicillin')
+        self.upload_with(self.patient, 'Ibuprofen')
+        self.upload_with(User.objects.create_user('other', user_type='patient'), 'Amoxicillin')
+        self.assertEqual(self.listed('amox'), [both.id, other.id])
+        self.assertEqual(self.listed('Tab. AMOXIL'), [both.id])
+        self.assertEqual(self.listed('xicillin'), [])
+
+    def test_rows_follow_parsed_data(self):
+        upload = self.upload_with(self.patient, 'Amoxicillin')
+        upload.parsed_data = {'medicines': [{'medicine_name': 'Ibuprofen'}]}
+        upload.save()
+        materialize_medicines(upload)
+        self.assertEqual((self.listed('amox'), self.listed('ibu')), ([], [upload.id]))
+
+
+class FakeModelServerTests(SimpleTestCase):
+    def complete(self, server, path='/openai/v1/chat/completions'):
+        """POST a chat completion; returns (status, body, seconds taken)"""
+        request = urllib.request.Request(server.url + path, data=json.dumps({'model': 'vision-test'}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                status, body = response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            status, body = e.code, json.load(e)
+        return status, body, time.perf_counter() - started
+
+    def test_answers_like_the_chat_completions_api(self):
+        with FakeModelServer(latency_ms=50) as server:
+            status, body, seconds = self.complete(server)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['model'], 'vision-test')
+        choice = body['choices'][0]
+        self.assertEqual((choice['message'], choice['finish_reason']),
+                         ({'role': 'assistant', 'content': DEFAULT_RESPONSE}, 'stop'))
+        usage = body['usage']
+        self.assertEqual(usage['total_tokens'], usage['prompt_tokens'] + usage['completion_tokens'])
+        self.assertGreaterEqual(seconds, 0.05)
+
+    def test_injected_faults(self):
+        with FakeModelServer(error_rate=1.0) as server:
+            self.assertEqual(self.complete(server)[0], 500)
+            self.assertEqual(self.complete(server, '/openai/v1/models')[0], 404)
+        with FakeModelServer(responses=['{"medicines": []}'], truncate_rate=1.0, seed=1) as server:
+            _, body, _ = self.complete(server)
+        choice = body['choices'][0]
+        self.assertEqual(choice['finish_reason'], 'length')
+        self.assertTrue('{"medicines": []}'.startswith(choice['message']['content']))
+        self.assertEqual(server.stats, {'requests': 1, 'errors': 0, 'truncated': 1})
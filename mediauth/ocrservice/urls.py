@@ -5,4 +5,8 @@ urlpatterns = [
     path('upload/', views.PrescriptionUploadListCreateView.as_view(), name='prescription-upload'),
     path('upload/<int:pk>/', views.PrescriptionUploadDetailView.as_view(), name='prescription-upload-detail'),
     path('upload/<int:pk>/reprocess/', views.reprocess_upload, name='reprocess-upload'),
+    path('upload/<int:pk>/reextract/', views.reextract_upload, name='reextract-upload'),
+    path('upload/<int:pk>/similar/', views.similar_uploads, name='similar-uploads'),
+    path('upload/<int:pk>/usage/', views.upload_usage, name='upload-usage'),
+    path('usage/', views.usage_summary, name='ocr-usage'),
 ]
\ No newline at end of file
@@ -0,0 +1,118 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+from django.utils import timezone
+from .models import ModelCall
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost from OCR_MODEL_PRICING (per million tokens)"""
+    pricing = settings.OCR_MODEL_PRICING.get(model)
+    if not pricing:
+        return None
+    return round(
+        (prompt_tokens or 0) * pricing['prompt'] / 1_000_000
+        + (completion_tokens or 0) * pricing['completion'] / 1_000_000,
+        6,
+    )
+
+
+def record_call(upload, result):
+    """Store the usage record returned by the processor, if a call was made"""
+    usage = result.get('usage')
+    if not usage or usage.get('latency_ms') is None:
+        return None
+    return ModelCall.objects.create(
+        upload=upload,
+        patient_id=upload.patient_id,
+        model=usage['model'],
+        prompt_version=result.get('prompt_version', ''),
+        prompt_tokens=usage['prompt_tokens'],
+        completion_tokens=usage['completion_tokens'],
+        total_tokens=usage['total_tokens'],
+        max_completion_tokens=usage.get('max_completion_tokens', 0),
+        latency_ms=usage['latency_ms'],
+        image_bytes=usage['image_bytes'],
+        success=result['success'],
+    )
+
+
+def claim_budget(patient):
+    """``budget_status`` with the patient's row locked; call inside ``transaction.atomic``.
+
+    Together with ``reserve_call`` in the same transaction this makes the
+    check and the reservation one step: concurrent requests for a patient
+    queue on the lock (on SQLite, on the write lock ``BEGIN IMMEDIATE``
+    takes), so they cannot all pass a budget that has one call left.
+    """
+    get_user_model().objects.select_for_update().filter(pk=patient.pk).values_list('pk').first()
+    return budget_status(patient)
+
+
+def reserve_call(upload):
+    """Count one call against the budget until the real usage is recorded; delete it afterwards"""
+    return ModelCall.objects.create(upload=upload, patient_id=upload.patient_id, model='', latency_ms=0,
+                                    pending=True)
+
+
+def budget_status(patient, now=None):
+    """How much of the per-patient OCR budget is left.
+
+    Returns a dict with ``allowed`` and, when exhausted, ``retry_after``
+    seconds until the oldest call leaves the window.
+    """
+    now = now or timezone.now()
+    budgets = settings.OCR_USAGE_BUDGETS
+    calls = ModelCall.objects.filter(patient=patient)
+
+    hourly = calls.filter(created_at__gte=now - HOUR).aggregate(count=Count('id'), oldest=Min('created_at'))
+    daily = calls.filter(created_at__gte=now - DAY).aggregate(tokens=Sum('total_tokens'), oldest=Min('created_at'))
+    daily_tokens = daily['tokens'] or 0
+
+    status = {
+        'allowed': True,
+        'calls_last_hour': hourly['count'],
+        'calls_per_hour': budgets['CALLS_PER_HOUR'],
+        'tokens_last_day': daily_tokens,
+        'tokens_per_day': budgets['TOKENS_PER_DAY'],
+        'retry_after': 0,
+    }
+    waits = []
+    if budgets['CALLS_PER_HOUR'] and hourly['count'] >= budgets['CALLS_PER_HOUR']:
+        waits.append(hourly['oldest'] + HOUR - now)
+    if budgets['TOKENS_PER_DAY'] and daily_tokens >= budgets['TOKENS_PER_DAY']:
+        waits.append(daily['oldest'] + DAY - now)
+    if waits:
+        status['allowed'] = False
+        status['retry_after'] = max(1, int(max(waits).total_seconds()) + 1)
+    return status
+
+
+def summarize_calls(calls):
+    """Aggregate token, latency and cost figures for a ModelCall queryset"""
+    rows = calls.filter(pending=False).values('model', 'prompt_version').annotate(
+        calls=Count('id'),
+        failed=Count('id', filter=Q(success=False)),
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+        total_tokens=Sum('total_tokens'),
+        avg_latency_ms=Avg('latency_ms'),
+        max_latency_ms=Max('latency_ms'),
+        image_bytes=Sum('image_bytes'),
+    ).order_by('model', 'prompt_version')
+
+    by_model = []
+    for row in rows:
+        row['avg_latency_ms'] = round(row['avg_latency_ms'] or 0, 3)
+        row['estimated_cost_usd'] = estimate_cost(row['model'], row['prompt_tokens'], row['completion_tokens'])
+        by_model.append(row)
+    return {
+        'calls': sum(row['calls'] for row in by_model),
+        'total_tokens': sum(row['total_tokens'] or 0 for row in by_model),
+        'estimated_cost_usd': round(sum(row['estimated_cost_usd'] or 0 for row in by_model), 6),
+        'by_model': by_model,
+    }
@@ -1,54 +1,119 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import PrescriptionUpload
-from .serializers import PrescriptionUploadSerializer, PrescriptionUploadCreateSerializer
+from mediauth.sparse import SparseQuerysetMixin
+from mediauth.throttling import OCRThrottle
+from .models import ModelCall, PrescriptionUpload
+from .serializers import ModelCallSerializer, PrescriptionUploadSerializer, PrescriptionUploadCreateSerializer
 from .groq_processor import GroqPrescriptionProcessor
+from .hash_index import similar
+from .medicines import materialize_medicines, normalize_name
+from .pipeline import process_upload
+from .reextract import low_confidence_fields, reextract_fields, validate_fields
+from .runs import KEY_HEADER, claim, keyed_upload, release, remember_key, request_key, run_finished
+from .usage import budget_status, claim_budget, record_call, reserve_call, summarize_calls
 
-class PrescriptionUploadListCreateView(generics.ListCreateAPIView):
+def replay(upload, done_status=status.HTTP_200_OK, since=None):
+    """Answer a repeated request with the upload as it is now; 202 while its run is in flight"""
+    finished = run_finished(upload, since=since)
+    serializer = PrescriptionUploadSerializer(upload)
+    return Response(serializer.data, status=done_status if finished else status.HTTP_202_ACCEPTED,
+                    headers={'Idempotent-Replayed': 'true'})
+
+def key_reused():
+    return Response({'error': f'{KEY_HEADER} was already used for a different request'},
+                   status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+class PrescriptionUploadListCreateView(SparseQuerysetMixin, generics.ListCreateAPIView):
     serializer_class = PrescriptionUploadSerializer
     permission_classes = [IsAuthenticated]
+    # Uploads start a model call; listing them is not throttled
+    throttle_classes = [OCRThrottle]
+    compact_list = True
     
     def get_queryset(self):
         if self.request.user.user_type != 'patient':
             return PrescriptionUpload.objects.none()
-        return PrescriptionUpload.objects.filter(patient=self.request.user).order_by('-uploaded_at')
+        queryset = PrescriptionUpload.objects.filter(patient=self.request.user).order_by('-uploaded_at')
+        
+        # ?medicine=amox matches name prefixes on the indexed ExtractedMedicine rows
+        medicine = normalize_name(self.request.query_params.get('medicine', ''))
+        if medicine:
+            queryset = queryset.filter(medicines__normalized_name__startswith=medicine).distinct()
+        return queryset
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PrescriptionUploadCreateSerializer
         return PrescriptionUploadSerializer
     
+    def create(self, request, *args, **kwargs):
+        try:
+            key = request_key(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        self.idempotency = None
+        if key:
+            record, new = remember_key(request.user, key, 'upload')
+            if not new:
+                if record.action != 'upload':
+                    return key_reused()
+                upload = keyed_upload(record)
+                if upload is None:
+                    return Response({'error': 'The first request with this key has not created an upload yet; retry shortly'},
+                                   status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                return replay(upload, status.HTTP_201_CREATED)
+            self.idempotency = record
+        
+        try:
+            return super().create(request, *args, **kwargs)
+        except Exception:
+            # Nothing was uploaded, so a retry with the same key starts over
+            if self.idempotency is not None and self.idempotency.upload_id is None:
+                self.idempotency.delete()
+            raise
+    
     def perform_create(self, serializer):
         if self.request.user.user_type != 'patient':
             raise PermissionError("Only patients can upload prescriptions")
         
-        upload = serializer.save()
+        with transaction.atomic():
+            budget = claim_budget(self.request.user)
+            if not budget['allowed']:
+                raise Throttled(wait=budget['retry_after'], detail="OCR usage budget exceeded")
+            upload = serializer.save()
+            reservation = reserve_call(upload)
         
-        # Process with Groq API
-        self.process_with_groq(upload)
+        try:
+            token = claim(upload)
+            # Claimed first, so a retry that finds the upload sees this run
+            if self.idempotency is not None:
+                self.idempotency.upload = upload
+                self.idempotency.save(update_fields=['upload'])
+            
+            # Process with Groq API
+            self.process_with_groq(upload, token)
+        finally:
+            reservation.delete()
     
-    def process_with_groq(self, upload):
+    def process_with_groq(self, upload, token):
         """Process prescription using Groq API"""
         try:
-            processor = GroqPrescriptionProcessor()
-            result = processor.process_prescription(upload.image.path)
-            
-            upload.status = result['status']
-            upload.extracted_text = result['extracted_text']
-            upload.parsed_data = result['parsed_data']
-            upload.processed_at = timezone.now()
-            upload.save()
+            process_upload(upload, token=token)
             
         except Exception as e:
-            upload.status = 'failed'
-            upload.extracted_text = f"Processing failed: {str(e)}"
-            upload.processed_at = timezone.now()
-            upload.save()
+            release(upload, token, status='failed', extracted_text=f"Processing failed: {str(e)}",
+                    processed_at=timezone.now())
 
-class PrescriptionUploadDetailView(generics.RetrieveDestroyAPIView):
+class PrescriptionUploadDetailView(SparseQuerysetMixin, generics.RetrieveDestroyAPIView):
     serializer_class = PrescriptionUploadSerializer
     permission_classes = [IsAuthenticated]
     
@@ -59,6 +124,7 @@ class PrescriptionUploadDetailView(generics.RetrieveDestroyAPIView):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([OCRThrottle])
 def reprocess_upload(request, pk):
     """Reprocess prescription with Groq API"""
     if request.user.user_type != 'patient':
@@ -71,27 +137,206 @@ def reprocess_upload(request, pk):
         return Response({'error': 'Upload not found'}, 
                        status=status.HTTP_404_NOT_FOUND)
     
-    upload.status = 'processing'
-    upload.save()
+    try:
+        key = request_key(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    record = None
+    if key:
+        record, new = remember_key(request.user, key, 'reprocess', upload)
+        if not new:
+            if record.action != 'reprocess' or record.upload_id != upload.pk:
+                return key_reused()
+            return replay(upload, since=record.created_at)
+    
+    with transaction.atomic():
+        budget = claim_budget(request.user)
+        reservation = reserve_call(upload) if budget['allowed'] else None
+    if reservation is None:
+        if record is not None:
+            record.delete()
+        return Response({'error': 'OCR usage budget exceeded', 'budget': budget},
+                       status=status.HTTP_429_TOO_MANY_REQUESTS,
+                       headers={'Retry-After': str(budget['retry_after'])})
     
     try:
-        processor = GroqPrescriptionProcessor()
-        result = processor.process_prescription(upload.image.path)
-        
-        upload.status = result['status']
-        upload.extracted_text = result['extracted_text']
-        upload.parsed_data = result['parsed_data']
-        upload.processed_at = timezone.now()
-        upload.save()
+        token = claim(upload)
+        if token is None:
+            # A double click or retry without a key: answer with the run already in flight
+            return replay(upload)
         
+        try:
+            process_upload(upload, token=token)
+            
+            serializer = PrescriptionUploadSerializer(upload)
+            return Response(serializer.data)
+            
+        except Exception as e:
+            release(upload, token, status='failed', extracted_text=f"Reprocessing failed: {str(e)}",
+                    processed_at=timezone.now())
+            
+            return Response({'error': str(e)}, 
+                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    finally:
+        reservation.delete()
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([OCRThrottle])
+def reextract_upload(request, pk):
+    """Re-read only missing or low-confidence fields and merge them in"""
+    if request.user.user_type != 'patient':
+        return Response({'error': 'Only patients can re-extract uploads'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        upload = PrescriptionUpload.objects.get(pk=pk, patient=request.user)
+    except PrescriptionUpload.DoesNotExist:
+        return Response({'error': 'Upload not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    if upload.status != 'completed':
+        return Response({'error': 'Only completed uploads can be re-extracted; reprocess it instead'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    # Rows written before answers were checked can hold a list or a bare value
+    if not isinstance(upload.parsed_data, dict):
+        return Response({'error': 'Stored result is not a set of fields; reprocess it instead'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        threshold = float(request.data['threshold']) if 'threshold' in request.data else None
+    except (TypeError, ValueError):
+        return Response({'error': 'threshold must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    fields = request.data.get('fields')
+    if fields is None:
+        fields = low_confidence_fields(upload.parsed_data, threshold)
+    elif not isinstance(fields, list):
+        return Response({'error': 'fields must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    invalid = validate_fields(upload.parsed_data, fields)
+    if invalid:
+        return Response({'error': 'Unknown fields', 'fields': invalid}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    if not fields:
         serializer = PrescriptionUploadSerializer(upload)
-        return Response(serializer.data)
-        
+        return Response({'upload': serializer.data, 'reextracted_fields': []})
+    
+    with transaction.atomic():
+        budget = claim_budget(request.user)
+        reservation = reserve_call(upload) if budget['allowed'] else None
+    if reservation is None:
+        return Response({'error': 'OCR usage budget exceeded', 'budget': budget},
+                       status=status.HTTP_429_TOO_MANY_REQUESTS,
+                       headers={'Retry-After': str(budget['retry_after'])})
+    try:
+        return reextract_claimed(upload, fields)
+    finally:
+        reservation.delete()
+
+def reextract_claimed(upload, fields):
+    """Re-extract ``fields`` once the caller has reserved a budget slot"""
+    # Holds the upload like a reprocess run, but leaves it completed meanwhile
+    token = claim(upload, status=None)
+    if token is None:
+        return Response({'error': 'Upload is being processed; try again once it has finished'}, 
+                       status=status.HTTP_409_CONFLICT)
+    
+    try:
+        result, updated = reextract_fields(upload, GroqPrescriptionProcessor(), fields)
     except Exception as e:
-        upload.status = 'failed'
-        upload.extracted_text = f"Reprocessing failed: {str(e)}"
-        upload.processed_at = timezone.now()
-        upload.save()
-        
+        release(upload, token)
         return Response({'error': str(e)}, 
-                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    record_call(upload, result)
+    if not result['success']:
+        release(upload, token)
+        return Response({'error': result.get('error', 'Re-extraction failed')}, 
+                       status=status.HTTP_502_BAD_GATEWAY)
+    
+    if not release(upload, token, parsed_data=result['parsed_data'], processed_at=timezone.now()):
+        return Response({'error': 'Upload was reprocessed meanwhile; its new result was kept'}, 
+                       status=status.HTTP_409_CONFLICT)
+    materialize_medicines(upload)
+    
+    serializer = PrescriptionUploadSerializer(upload)
+    return Response({
+        'upload': serializer.data,
+        'reextracted_fields': updated,
+        'cropped': result['cropped'],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upload_usage(request, pk):
+    """Model calls made for one upload"""
+    if request.user.user_type != 'patient':
+        return Response({'error': 'Only patients can view upload usage'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    upload = get_object_or_404(PrescriptionUpload, pk=pk, patient=request.user)
+    calls = upload.model_calls.filter(pending=False).order_by('-created_at')
+    serializer = ModelCallSerializer(calls, many=True)
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def usage_summary(request):
+    """Token, latency and cost totals: own usage for patients, everything for staff"""
+    if request.user.is_staff:
+        calls = ModelCall.objects.filter(pending=False)
+        summary = summarize_calls(calls)
+        summary['top_patients'] = list(
+            calls.values('patient_id', 'patient__username')
+            .annotate(total_tokens=Sum('total_tokens'))
+            .order_by('-total_tokens')[:20]
+        )
+        return Response(summary)
+    
+    if request.user.user_type != 'patient':
+        return Response({'error': 'Only patients can view OCR usage'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    summary = summarize_calls(ModelCall.objects.filter(patient=request.user))
+    summary['budget'] = budget_status(request.user)
+    return Response(summary)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def similar_uploads(request, pk):
+    """Near-duplicate uploads by perceptual hash: own uploads for patients, all for staff"""
+    uploads = PrescriptionUpload.objects.all()
+    if not request.user.is_staff:
+        if request.user.user_type != 'patient':
+            return Response({'error': 'Only patients can search similar uploads'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+        uploads = uploads.filter(patient=request.user)
+    
+    try:
+        upload = uploads.get(pk=pk)
+    except PrescriptionUpload.DoesNotExist:
+        return Response({'error': 'Upload not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    if not upload.phash:
+        return Response({'error': 'Upload has no image hash yet'}, 
+                       status=status.HTTP_409_CONFLICT)
+    
+    try:
+        distance = int(request.query_params.get('distance', settings.OCR_DUPLICATE_DISTANCE))
+    except ValueError:
+        return Response({'error': 'distance must be an integer'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    distance = max(0, min(distance, 16))
+    
+    matches = similar(upload.phash, distance, exclude=upload.id, queryset=uploads)
+    return Response({
+        'upload_id': upload.id,
+        'phash': upload.phash,
+        'distance': distance,
+        'reuse_suspected': upload.reuse_suspected,
+        'matches': matches,
+    })
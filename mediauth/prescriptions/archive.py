@@ -0,0 +1,126 @@
+"""Cold storage for finished prescriptions.
+
+Filled and cancelled prescriptions that nobody has touched for
+``PRESCRIPTION_ARCHIVE['AFTER_DAYS']`` are moved, a batch per transaction,
+into ``ArchivedPrescription``: one row per prescription with its items
+folded into a JSON value, under the original primary key. The hot
+``Prescription`` and ``PrescriptionItem`` tables, and every role-scoped
+list and index over them, then only hold prescriptions still in play.
+
+Archiving is not deletion: analytics keep counting archived prescriptions,
+the detail view falls back to the archive, and ``restore`` moves rows back.
+An upload converted into an archived prescription stays linked to it
+through ``source_upload``, so it is not converted a second time.
+Run ``archive_prescriptions`` periodically (cron or a scheduler) to do it.
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from audit import log as audit_log
+from ocrservice.models import PrescriptionUpload
+from .models import ArchivedPrescription, Prescription, PrescriptionItem
+
+ARCHIVED_STATUSES = ('filled', 'cancelled')
+ITEM_FIELDS = ('medicine_name', 'dosage', 'frequency', 'duration', 'quantity', 'instructions')
+COLUMNS = ('prescription_id', 'doctor_id', 'patient_id', 'filled_by_id', 'status',
+           'created_at', 'updated_at', 'issued_date', 'filled_date')
+
+
+def archive_cutoff(after_days=None):
+    if after_days is None:
+        after_days = settings.PRESCRIPTION_ARCHIVE['AFTER_DAYS']
+    return timezone.now() - timedelta(days=after_days)
+
+
+def archivable(cutoff):
+    """Prescriptions finished and unchanged since ``cutoff``"""
+    return Prescription.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=cutoff)
+
+
+def archived_row(prescription, upload_id=None):
+    return ArchivedPrescription(
+        id=prescription.pk,
+        source_upload_id=upload_id,
+        data={
+            'diagnosis': prescription.diagnosis,
+            'notes': prescription.notes,
+            'items': [{field: getattr(item, field) for field in ITEM_FIELDS} for item in prescription.items.all()],
+        },
+        **{column: getattr(prescription, column) for column in COLUMNS},
+    )
+
+
+def archive_batch(cutoff, batch_size=None):
+    """Move up to ``batch_size`` archivable prescriptions in one transaction; returns how many moved"""
+    batch_size = batch_size or settings.PRESCRIPTION_ARCHIVE['BATCH_SIZE']
+    with transaction.atomic():
+        # Locked where the database supports it, so an edit racing the move waits for it
+        prescriptions = list(archivable(cutoff).select_for_update().order_by('pk')[:batch_size]
+                             .prefetch_related('items'))
+        if not prescriptions:
+            return 0
+        # Deleting the prescription clears the upload's link; the archive row keeps it
+        uploads = dict(PrescriptionUpload.objects.filter(prescription__in=[p.pk for p in prescriptions])
+                       .values_list('prescription_id', 'id'))
+        ArchivedPrescription.objects.bulk_create([archived_row(p, uploads.get(p.pk)) for p in prescriptions])
+        # Stats already count these prescriptions; a plain delete leaves them alone
+        Prescription.objects.filter(pk__in=[p.pk for p in prescriptions]).delete()
+        events = [audit_log.event('archived', p, None) for p in prescriptions]
+        transaction.on_commit(lambda: audit_log.record(*events))
+    return len(prescriptions)
+
+
+def archive_old(cutoff=None, batch_size=None, max_batches=None, pause=0, progress=None):
+    """Archive everything finished before ``cutoff`` (default: ``AFTER_DAYS`` ago), batch by batch.
+
+    ``pause`` seconds between batches leave room for other writers.
+    """
+    cutoff = cutoff or archive_cutoff()
+    report = {'batches': 0, 'archived': 0}
+    while max_batches is None or report['batches'] < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        report['batches'] += 1
+        report['archived'] += moved
+        if progress:
+            progress(report)
+        if pause:
+            time.sleep(pause)
+    return report
+
+
+def restore(ids):
+    """Move archived prescriptions back into the hot tables; returns how many moved"""
+    with transaction.atomic():
+        rows = list(ArchivedPrescription.objects.select_for_update().filter(pk__in=ids))
+        for row in rows:
+            prescription = Prescription(
+                pk=row.pk, diagnosis=row.data.get('diagnosis', ''), notes=row.data.get('notes', ''),
+                **{column: getattr(row, column) for column in COLUMNS},
+            )
+            prescription.save(force_insert=True)
+            # auto_now/auto_now_add stamped the insert; put the original dates back
+            Prescription.objects.filter(pk=row.pk).update(created_at=row.created_at, updated_at=row.updated_at)
+            PrescriptionItem.objects.bulk_create([
+                PrescriptionItem(prescription_id=row.pk, **item) for item in row.data.get('items', [])
+            ])
+            if row.source_upload_id:
+                PrescriptionUpload.objects.filter(pk=row.source_upload_id).update(prescription=row.pk)
+        ArchivedPrescription.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        events = [audit_log.event('restored', row, None) for row in rows]
+        transaction.on_commit(lambda: audit_log.record(*events))
+    return len(rows)
+
+
+def archived_prescriptions(user):
+    """Archived prescriptions a user may open: the detail view's scoping, applied to the archive"""
+    if user.user_type == 'doctor':
+        return ArchivedPrescription.objects.filter(doctor=user)
+    elif user.user_type == 'patient':
+        return ArchivedPrescription.objects.filter(patient=user)
+    elif user.user_type == 'pharmacist':
+        return ArchivedPrescription.objects.all()
+    return ArchivedPrescription.objects.none()
@@ -0,0 +1,95 @@
+"""Batched writes for prescriptions.
+
+``bulk_create`` skips ``Prescription.save``, which is where
+``prescription_id`` is derived from the row id. Rows are inserted with a
+unique placeholder id and then given their real ids by one set-based
+UPDATE computed in SQL, rather than a per-row ``bulk_update``. The UPDATE
+matches the exact placeholders it was given, so a real id that happens to
+start with ``PLACEHOLDER_PREFIX`` is never replaced.
+"""
+import uuid
+from datetime import datetime
+from django.db import transaction
+from django.db.models import CharField, Case, F, Value, When
+from django.db.models.functions import Cast, Concat, LPad
+from analytics.aggregates import record_created
+from audit import log as audit_log
+from .models import Prescription, PrescriptionItem
+
+PLACEHOLDER_PREFIX = 'TMP'
+
+
+def placeholder_id(key=None):
+    """Temporary unique prescription_id; ``key`` must be unique among live placeholders"""
+    return f"{PLACEHOLDER_PREFIX}{key if key is not None else uuid.uuid4().hex[:17]}"
+
+
+def prescription_id_for(pk, when=None):
+    """Same format Prescription.save uses"""
+    return f"RX{(when or datetime.now()).strftime('%Y%m%d')}{pk:04d}"
+
+
+def finalize_prescription_ids(prescriptions, when=None):
+    """Give inserted ``prescriptions``, still carrying their placeholders, ``prescription_id_for(pk)`` in one UPDATE"""
+    prefix = f"RX{(when or datetime.now()).strftime('%Y%m%d')}"
+    pk_text = Cast('id', CharField())
+    placeholders = {prescription.pk: prescription.prescription_id for prescription in prescriptions}
+    return Prescription.objects.filter(pk__in=placeholders, prescription_id__in=placeholders.values()).update(
+        prescription_id=Concat(
+            Value(prefix),
+            # LPad truncates longer values, so only pad ids below 1000
+            Case(When(id__lt=1000, then=LPad(pk_text, 4, Value('0'))), default=pk_text),
+            output_field=CharField(),
+        )
+    )
+
+
+def bulk_insert_prescriptions(prescriptions, items_per_prescription, batch_size=1000):
+    """Insert prescriptions and their items, leaving placeholder ids in place.
+
+    ``items_per_prescription`` lines up with ``prescriptions``. Needs a
+    backend that returns primary keys from bulk_create (SQLite 3.35+,
+    PostgreSQL). Call inside a transaction and finish with
+    ``finalize_prescription_ids`` so placeholders are never seen. The new
+    rows are counted in the analytics tables and, once committed, in the
+    audit log.
+    """
+    for prescription in prescriptions:
+        if not prescription.prescription_id:
+            prescription.prescription_id = placeholder_id()
+    created = Prescription.objects.bulk_create(prescriptions, batch_size=batch_size)
+
+    items, grouped = [], []
+    for prescription, prescription_items in zip(created, items_per_prescription):
+        prescription_items = list(prescription_items)
+        for item in prescription_items:
+            item.prescription = prescription
+            items.append(item)
+        grouped.append(prescription_items)
+    PrescriptionItem.objects.bulk_create(items, batch_size=batch_size)
+    record_created(created, grouped)
+
+    events = [
+        audit_log.event('created', prescription, None,
+                        after=audit_log.prescription_state(prescription, prescription_items))
+        for prescription, prescription_items in zip(created, grouped)
+    ]
+
+    def record_events():
+        # Placeholders have been replaced by now; log the ids the rows were committed with
+        final_ids = dict(Prescription.objects.filter(pk__in=[event['prescription_pk'] for event in events])
+                         .values_list('pk', 'prescription_id'))
+        for event in events:
+            event['prescription_id'] = final_ids.get(event['prescription_pk'], event['prescription_id'])
+        audit_log.record(*events)
+
+    transaction.on_commit(record_events)
+    return created, items
+
+
+def bulk_create_prescriptions(prescriptions, items_per_prescription, batch_size=1000):
+    """Insert prescriptions with their items and final prescription_ids"""
+    placeholders = [prescription for prescription in prescriptions if not prescription.prescription_id]
+    created, items = bulk_insert_prescriptions(prescriptions, items_per_prescription, batch_size)
+    finalize_prescription_ids(placeholders)
+    return created, items
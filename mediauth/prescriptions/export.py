@@ -0,0 +1,134 @@
+"""Streaming export of prescriptions as NDJSON or CSV.
+
+Rows are read with ``.iterator(chunk_size=...)`` (a server-side cursor
+where the backend has one) and items are fetched one chunk of
+prescriptions at a time, so memory stays flat however large the table is.
+Output is produced as an iterator of byte strings, optionally gzipped, and
+can be fed to a ``StreamingHttpResponse`` or written to a file.
+
+Archived prescriptions (see ``prescriptions.archive``) follow the hot ones
+when an archive queryset is passed; every record says which table it came
+from in ``archived``.
+"""
+import csv
+import io
+import json
+import zlib
+from itertools import chain, islice
+from .models import PrescriptionItem
+
+PRESCRIPTION_FIELDS = {
+    'id': 'id',
+    'prescription_id': 'prescription_id',
+    'status': 'status',
+    'doctor': 'doctor__username',
+    'patient': 'patient__username',
+    'diagnosis': 'diagnosis',
+    'notes': 'notes',
+    'created_at': 'created_at',
+    'issued_date': 'issued_date',
+    'filled_by': 'filled_by__username',
+    'filled_date': 'filled_date',
+}
+ITEM_FIELDS = ('medicine_name', 'dosage', 'frequency', 'duration', 'quantity', 'instructions')
+CSV_COLUMNS = list(PRESCRIPTION_FIELDS) + ['archived'] + [f"item_{field}" for field in ITEM_FIELDS]
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FLUSH_BYTES = 64 * 1024
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def iter_records(queryset, chunk_size=2000):
+    """Prescriptions as plain dicts with an ``items`` list, one chunk at a time"""
+    rows = queryset.order_by('id').values_list(*PRESCRIPTION_FIELDS.values()).iterator(chunk_size=chunk_size)
+    names = list(PRESCRIPTION_FIELDS)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        items = {}
+        for item in (PrescriptionItem.objects.filter(prescription_id__in=[row[0] for row in chunk])
+                     .order_by('prescription_id', 'id').values_list('prescription_id', *ITEM_FIELDS)):
+            items.setdefault(item[0], []).append(dict(zip(ITEM_FIELDS, item[1:])))
+        for row in chunk:
+            record = dict(zip(names, row))
+            for field in ('created_at', 'issued_date', 'filled_date'):
+                record[field] = _isoformat(record[field])
+            record['items'] = items.get(record['id'], [])
+            record['archived'] = False
+            yield record
+
+
+def iter_archived_records(queryset, chunk_size=2000):
+    """Archived prescriptions in the same shape; their diagnosis, notes and items live in ``data``"""
+    columns = {name: path for name, path in PRESCRIPTION_FIELDS.items() if name not in ('diagnosis', 'notes')}
+    rows = queryset.order_by('id').values_list(*columns.values(), 'data').iterator(chunk_size=chunk_size)
+    for row in rows:
+        values, data = dict(zip(columns, row)), row[-1]
+        values.update(diagnosis=data.get('diagnosis', ''), notes=data.get('notes', ''))
+        record = {name: values[name] for name in PRESCRIPTION_FIELDS}
+        for field in ('created_at', 'issued_date', 'filled_date'):
+            record[field] = _isoformat(record[field])
+        record['items'] = data.get('items', [])
+        record['archived'] = True
+        yield record
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def csv_lines(records):
+    """One row per item; prescriptions without items get a single row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for record in records:
+        base = [record[field] if record[field] is not None else '' for field in PRESCRIPTION_FIELDS]
+        base.append(record['archived'])
+        for item in record['items'] or [{}]:
+            writer.writerow(base + [item.get(field, '') for field in ITEM_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _buffered(lines):
+    """Group small text pieces into ~64 KB byte chunks"""
+    parts, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def _gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(queryset, output='ndjson', compress=False, chunk_size=2000, archived=None):
+    """Byte chunks of the export; ``output`` is one of FORMATS, ``archived`` an optional archive queryset"""
+    if output not in FORMATS:
+        raise ValueError(f"Unknown export format {output!r}; use one of {', '.join(FORMATS)}")
+    records = iter_records(queryset, chunk_size)
+    if archived is not None:
+        records = chain(records, iter_archived_records(archived, chunk_size))
+    lines = ndjson_lines(records) if output == 'ndjson' else csv_lines(records)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if compress else chunks
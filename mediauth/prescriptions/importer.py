@@ -0,0 +1,305 @@
+"""Streaming bulk import of prescriptions from NDJSON or CSV.
+
+The input uses the export format (see ``prescriptions.export``): NDJSON
+with one prescription and its ``items`` per line, or CSV with one row per
+item, consecutive rows of the same prescription grouped together. Records
+are parsed lazily, validated a batch at a time, and written with
+``bulk_create`` in one transaction per batch. Usernames are resolved
+through a cache that loads each batch's unknown names in a single query.
+
+After each committed batch the number of records consumed is written to an
+optional checkpoint file, so an interrupted import resumes where it
+stopped. Records whose ``prescription_id`` already exists are skipped,
+which also makes re-running a partially committed batch safe. Records
+without one get an id derived from their content (``derived_id``), so
+they are skipped on a re-run too rather than inserted again.
+
+``created_at`` is always the import time (the field is ``auto_now_add``);
+``issued_date`` and ``filled_date`` are kept from the source.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+from datetime import timezone as dt_timezone
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .bulk import bulk_insert_prescriptions
+from .export import ITEM_FIELDS, PRESCRIPTION_FIELDS
+from .models import ArchivedPrescription, Prescription, PrescriptionItem
+
+User = get_user_model()
+
+STATUSES = {choice for choice, _ in Prescription.STATUS_CHOICES}
+ITEM_LIMITS = {'medicine_name': 200, 'dosage': 100, 'frequency': 100, 'duration': 100}
+USER_ROLES = {'doctor': 'doctor', 'patient': 'patient', 'filled_by': 'pharmacist'}
+GZIP_MAGIC = b'\x1f\x8b'
+DERIVED_PREFIX = 'IMP'
+
+
+def open_source(file):
+    """Text stream over a seekable binary file object, transparently gunzipping"""
+    head = file.read(2)
+    file.seek(0)
+    if head == GZIP_MAGIC:
+        file = gzip.GzipFile(fileobj=file)
+    return io.TextIOWrapper(file, encoding='utf-8', newline='')
+
+
+def detect_format(name):
+    name = (name or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def _ndjson_records(text):
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, [f"invalid JSON: {e}"]
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, ['expected a JSON object']
+            continue
+        yield line_number, record, []
+
+
+def _csv_records(text):
+    """Group consecutive item rows of the same prescription into one record"""
+    reader = csv.DictReader(text)
+    current, key, start = None, None, None
+    for row in reader:
+        row_key = row.get('prescription_id') or row.get('id') or f"line-{reader.line_num}"
+        if current is not None and row_key == key:
+            item = {field: row.get(f"item_{field}", '') for field in ITEM_FIELDS}
+            if any(item.values()):
+                current['items'].append(item)
+            continue
+        if current is not None:
+            yield start, current, []
+        current = {field: row.get(field) or None for field in PRESCRIPTION_FIELDS}
+        item = {field: row.get(f"item_{field}", '') for field in ITEM_FIELDS}
+        current['items'] = [item] if any(item.values()) else []
+        key, start = row_key, reader.line_num
+    if current is not None:
+        yield start, current, []
+
+
+def read_records(file, output='ndjson'):
+    """``(line, record, parse_errors)`` for each prescription in the source"""
+    text = open_source(file)
+    return _csv_records(text) if output == 'csv' else _ndjson_records(text)
+
+
+class UserCache:
+    """username -> (id, user_type), filled one query per batch of unknown names"""
+
+    def __init__(self, max_size=100000):
+        self.users = {}
+        self.max_size = max_size
+
+    def load(self, usernames):
+        missing = {name for name in usernames if name and name not in self.users}
+        if not missing:
+            return
+        if len(self.users) + len(missing) > self.max_size:
+            self.users.clear()
+        found = {
+            username: (pk, user_type)
+            for username, pk, user_type in
+            User.objects.filter(username__in=missing).values_list('username', 'id', 'user_type')
+        }
+        for name in missing:
+            self.users[name] = found.get(name)
+
+    def get(self, username):
+        return self.users.get(username)
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _datetime(value):
+    if value in (None, ''):
+        return None, None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        return None, f"not an ISO 8601 datetime: {value!r}"
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed, None
+
+
+def build_prescription(record, users):
+    """``(Prescription, [PrescriptionItem], errors)`` for one record"""
+    errors = []
+    references = {}
+    for field, role in USER_ROLES.items():
+        username = _text(record.get(field))
+        if not username:
+            if field != 'filled_by':
+                errors.append(f"{field}: missing")
+            continue
+        user = users.get(username)
+        if user is None:
+            errors.append(f"{field}: unknown user {username!r}")
+        elif user[1] != role:
+            errors.append(f"{field}: {username!r} is not a {role}")
+        else:
+            references[f"{field}_id"] = user[0]
+
+    prescription_id = _text(record.get('prescription_id'))
+    if len(prescription_id) > 20:
+        errors.append('prescription_id: longer than 20 characters')
+    status = _text(record.get('status')) or 'draft'
+    if status not in STATUSES:
+        errors.append(f"status: must be one of {', '.join(sorted(STATUSES))}")
+    diagnosis = _text(record.get('diagnosis'))
+    if not diagnosis:
+        errors.append('diagnosis: missing')
+    dates = {}
+    for field in ('issued_date', 'filled_date'):
+        dates[field], error = _datetime(record.get(field))
+        if error:
+            errors.append(f"{field}: {error}")
+
+    items = []
+    raw_items = record.get('items') or []
+    if not isinstance(raw_items, list) or not raw_items:
+        errors.append('items: at least one medicine item is required')
+        raw_items = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            errors.append(f"items.{index}: not an object")
+            continue
+        item = {field: _text(raw.get(field)) for field in ITEM_LIMITS}
+        for field, limit in ITEM_LIMITS.items():
+            if not item[field]:
+                errors.append(f"items.{index}.{field}: missing")
+            elif len(item[field]) > limit:
+                errors.append(f"items.{index}.{field}: longer than {limit} characters")
+        try:
+            item['quantity'] = int(raw.get('quantity'))
+        except (TypeError, ValueError):
+            errors.append(f"items.{index}.quantity: not an integer")
+            continue
+        item['instructions'] = _text(raw.get('instructions'))
+        items.append(PrescriptionItem(**item))
+
+    if errors:
+        return None, [], errors
+    prescription = Prescription(
+        prescription_id=prescription_id,
+        status=status,
+        diagnosis=diagnosis,
+        notes=_text(record.get('notes')),
+        **references,
+        **dates,
+    )
+    return prescription, items, []
+
+
+def derived_id(record):
+    """Stable ``prescription_id`` for a record that has none: a digest of its content"""
+    content = json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+    return f"{DERIVED_PREFIX}{hashlib.sha256(content.encode()).hexdigest()[:17]}"
+
+
+def record_id(record):
+    return _text(record.get('prescription_id')) or derived_id(record)
+
+
+def import_batch(entries, users, dry_run=False):
+    """Validate and insert one batch of ``(line, record, parse_errors)``; returns counts and errors"""
+    result = {'imported': 0, 'skipped': 0, 'rejected': 0, 'items': 0, 'errors': []}
+    users.load(
+        _text(record.get(field)) for _, record, _ in entries if record for field in USER_ROLES
+    )
+    given_ids = [record_id(record) for _, record, _ in entries if record]
+    # Archived ids are taken too; restoring them would collide
+    existing = set(Prescription.objects.filter(prescription_id__in=given_ids).values_list('prescription_id', flat=True))
+    existing.update(ArchivedPrescription.objects.filter(
+        prescription_id__in=given_ids).values_list('prescription_id', flat=True))
+
+    prescriptions, items, seen = [], [], set()
+    for line, record, errors in entries:
+        if not errors:
+            prescription_id = record_id(record)
+            if prescription_id in existing or prescription_id in seen:
+                result['skipped'] += 1
+                continue
+            prescription, prescription_items, errors = build_prescription(record, users)
+        if errors:
+            result['rejected'] += 1
+            result['errors'].append({'line': line, 'errors': errors})
+            continue
+        prescription.prescription_id = prescription_id
+        seen.add(prescription_id)
+        prescriptions.append(prescription)
+        items.append(prescription_items)
+
+    result['imported'] = len(prescriptions)
+    result['items'] = sum(len(prescription_items) for prescription_items in items)
+    if prescriptions and not dry_run:
+        with transaction.atomic():
+            bulk_insert_prescriptions(prescriptions, items)
+    return result
+
+
+def read_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as handle:
+            return json.load(handle)
+    return None
+
+
+def write_checkpoint(path, state):
+    """Atomically replace the checkpoint file"""
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as handle:
+        json.dump(state, handle)
+    os.replace(temporary, path)
+
+
+def import_records(records, batch_size=1000, checkpoint=None, resume=False, dry_run=False,
+                   progress=None, max_errors=None):
+    """Import ``(line, record, errors)`` entries batch by batch.
+
+    With ``checkpoint`` set, progress is saved after every committed batch;
+    ``resume`` skips the records an earlier run already committed.
+    ``progress(report)`` is called after each batch.
+    """
+    report = {'consumed': 0, 'imported': 0, 'skipped': 0, 'rejected': 0, 'items': 0, 'errors': []}
+    state = read_checkpoint(checkpoint) if resume else None
+    if state:
+        for key in ('consumed', 'imported', 'skipped', 'rejected', 'items'):
+            report[key] = state.get(key, 0)
+        records = islice(records, report['consumed'], None)
+
+    users = UserCache()
+    while True:
+        entries = list(islice(records, batch_size))
+        if not entries:
+            break
+        result = import_batch(entries, users, dry_run)
+        report['consumed'] += len(entries)
+        for key in ('imported', 'skipped', 'rejected', 'items'):
+            report[key] += result[key]
+        room = None if max_errors is None else max(0, max_errors - len(report['errors']))
+        report['errors'].extend(result['errors'][:room])
+        if checkpoint and not dry_run:
+            write_checkpoint(checkpoint, {key: value for key, value in report.items() if key != 'errors'})
+        if progress:
+            progress(report, result)
+    return report
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from prescriptions.archive import archivable, archive_cutoff, archive_old, restore
+
+
+class Command(BaseCommand):
+    help = ("Move filled and cancelled prescriptions untouched for PRESCRIPTION_ARCHIVE['AFTER_DAYS'] "
+            "into the archive table, one batch per transaction. Meant to run periodically.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-days', type=int, help='Override PRESCRIPTION_ARCHIVE AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, help='Override PRESCRIPTION_ARCHIVE BATCH_SIZE')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, leaving room for other writers')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+        parser.add_argument('--restore', type=int, nargs='+', metavar='ID',
+                            help='Move these archived prescriptions back instead')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            restored = restore(options['restore'])
+            self.stdout.write(self.style.SUCCESS(f"Restored {restored} prescriptions"))
+            return
+
+        cutoff = archive_cutoff(options['after_days'])
+        if options['dry_run']:
+            self.stdout.write(f"{archivable(cutoff).count()} prescriptions finished before {cutoff:%Y-%m-%d}")
+            return
+
+        def progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{report['archived']} prescriptions archived")
+
+        started = time.perf_counter()
+        report = archive_old(cutoff, options['batch_size'], options['max_batches'], options['pause'], progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {report['archived']} prescriptions in {report['batches']} batches in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from prescriptions.archive import archive_cutoff, archive_old
+from prescriptions.models import ArchivedPrescription, Prescription, PrescriptionItem
+
+ROLES = ('doctor', 'patient', 'pharmacist')
+# Both are scoped to the caller and unpaginated or counted over their rows
+URLS = ('/api/prescriptions/', '/api/dashboard/')
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the role-scoped prescription endpoints before and after moving old finished "
+            "prescriptions to the archive, plus archiving throughput and archived detail reads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=5)
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--prescriptions', type=int, default=20000)
+        parser.add_argument('--after-days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def measure(self, client, url, iterations):
+        assert client.get(url).status_code == 200, url  # warm-up
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+        return {'latency_ms': summarize(samples), 'bytes': len(response.content)}
+
+    def measure_roles(self, clients, iterations):
+        return {
+            role: {url: self.measure(clients[role], url, iterations) for url in URLS}
+            for role in ROLES
+        }
+
+    def table_sizes(self):
+        return {
+            'prescriptions': Prescription.objects.count(),
+            'items': PrescriptionItem.objects.count(),
+            'archived': ArchivedPrescription.objects.count(),
+        }
+
+    def handle(self, *args, **options):
+        with isolated_environment():
+            dataset = generate_dataset(doctors=options['doctors'], patients=options['patients'], pharmacists=2,
+                                       prescriptions=options['prescriptions'], uploads=0, seed=options['seed'])
+            # Synthetic rows were all written just now; date them by when they last changed
+            Prescription.objects.update(updated_at=Coalesce('filled_date', 'issued_date', F('created_at')))
+            clients = {role: self.client(dataset[role][0]) for role in ROLES}
+
+            before = {'tables': self.table_sizes(), 'endpoints': self.measure_roles(clients, options['iterations'])}
+            started = time.perf_counter()
+            report = archive_old(archive_cutoff(options['after_days']), options['batch_size'])
+            elapsed = time.perf_counter() - started
+            after = {'tables': self.table_sizes(), 'endpoints': self.measure_roles(clients, options['iterations'])}
+
+            archived = ArchivedPrescription.objects.filter(doctor=dataset['doctor'][0]).first()
+            archived_detail = (self.measure(clients['doctor'], f"/api/prescriptions/{archived.pk}/",
+                                            options['iterations']) if archived else None)
+
+        write_report({
+            'benchmark': 'archive',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('doctors', 'patients', 'prescriptions', 'after_days',
+                                                     'batch_size', 'iterations', 'seed')},
+            'archiving': {
+                **report,
+                'seconds': round(elapsed, 2),
+                'per_second': round(report['archived'] / elapsed, 1) if elapsed else None,
+            },
+            'before': before,
+            'after': after,
+            'archived_detail': archived_detail,
+        }, options['output'], self.stdout)
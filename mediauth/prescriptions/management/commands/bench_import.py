@@ -0,0 +1,99 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from types import SimpleNamespace
+
+from mediauth.bench import describe_environment, isolated_environment, write_report
+from mediauth.synthetic import DIAGNOSES, FREQUENCIES, MEDICINES, generate_dataset
+from prescriptions.importer import import_records, read_records
+from prescriptions.models import Prescription
+from prescriptions.serializers import PrescriptionCreateSerializer
+
+
+def synthetic_records(count, items_per_prescription, doctors, patients, rng):
+    for index in range(count):
+        yield {
+            'prescription_id': f"LEG{index:010d}",
+            'status': 'issued',
+            'doctor': rng.choice(doctors).username,
+            'patient': rng.choice(patients).username,
+            'diagnosis': rng.choice(DIAGNOSES),
+            'notes': 'Imported from legacy system',
+            'issued_date': '2024-01-15T10:30:00+00:00',
+            'items': [
+                {'medicine_name': name, 'dosage': dosage, 'frequency': rng.choice(FREQUENCIES),
+                 'duration': '7 days', 'quantity': rng.randrange(5, 60), 'instructions': ''}
+                for name, dosage in rng.sample(MEDICINES, items_per_prescription)
+            ],
+        }
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the bulk prescription importer in rows/sec against creating the "
+            "same records one by one through PrescriptionCreateSerializer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prescriptions', type=int, default=50000, help='Records in the import file')
+        parser.add_argument('--items', type=int, default=3, help='Items per prescription')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records per transaction')
+        parser.add_argument('--baseline', type=int, default=500,
+                            help='Records created through the serializer for comparison (0 to skip)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['prescriptions'] < 1 or not 1 <= options['items'] <= len(MEDICINES):
+            raise CommandError('--prescriptions must be positive and --items between 1 and %d' % len(MEDICINES))
+        rng = random.Random(options['seed'])
+
+        with isolated_environment() as workdir:
+            users = generate_dataset(doctors=20, patients=2000, pharmacists=5, prescriptions=0,
+                                     uploads=0, seed=options['seed'])
+            source = workdir / 'import.ndjson'
+            with source.open('w') as handle:
+                for record in synthetic_records(options['prescriptions'], options['items'],
+                                                users['doctor'], users['patient'], rng):
+                    handle.write(json.dumps(record) + '\n')
+
+            started = time.perf_counter()
+            with source.open('rb') as handle:
+                report = import_records(read_records(handle, 'ndjson'), batch_size=options['batch_size'])
+            import_seconds = time.perf_counter() - started
+            assert Prescription.objects.count() == report['imported']
+
+            baseline = None
+            if options['baseline']:
+                records = synthetic_records(options['baseline'], options['items'],
+                                            users['doctor'], users['patient'], rng)
+                started = time.perf_counter()
+                for record in records:
+                    doctor = next(user for user in users['doctor'] if user.username == record['doctor'])
+                    patient = next(user for user in users['patient'] if user.username == record['patient'])
+                    serializer = PrescriptionCreateSerializer(
+                        data={'patient_id': patient.id, 'diagnosis': record['diagnosis'],
+                              'notes': record['notes'], 'items': record['items']},
+                        context={'request': SimpleNamespace(user=doctor)},
+                    )
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save(doctor=doctor)
+                seconds = time.perf_counter() - started
+                baseline = {
+                    'records': options['baseline'],
+                    'seconds': round(seconds, 3),
+                    'records_per_second': round(options['baseline'] / seconds, 1),
+                }
+
+        report.pop('errors')
+        records_per_second = report['consumed'] / import_seconds
+        write_report({
+            'benchmark': 'prescription_import',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('prescriptions', 'items', 'batch_size', 'seed')},
+            'import': dict(report, seconds=round(import_seconds, 3),
+                           records_per_second=round(records_per_second, 1),
+                           items_per_second=round(report['items'] / import_seconds, 1)),
+            'serializer_baseline': baseline,
+            'speedup': round(records_per_second / baseline['records_per_second'], 1) if baseline else None,
+        }, options['output'], self.stdout)
@@ -0,0 +1,83 @@
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.renderers import FastJSONRenderer, orjson
+from mediauth.synthetic import generate_dataset
+
+ENDPOINTS = [
+    ('prescription-list', '/api/prescriptions/', {}, 'pharmacist'),
+    ('prescription-list-expanded', '/api/prescriptions/', {'expand': 'items,notes'}, 'pharmacist'),
+    ('upload-list', '/api/ocr/upload/', {}, 'patient'),
+    ('upload-list-expanded', '/api/ocr/upload/', {'expand': 'extracted_text,parsed_data,pages'}, 'patient'),
+]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, summarize(samples)
+
+
+class Command(BaseCommand):
+    help = ("Compare JSON rendering time and bytes on the wire (identity, gzip, brotli) "
+            "for the prescription and upload list endpoints.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prescriptions', type=int, default=2000)
+        parser.add_argument('--uploads', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        repeat = options['repeat']
+
+        results = []
+        with isolated_environment():
+            # One pharmacist sees every issued prescription; one patient owns every upload
+            users = generate_dataset(doctors=5, patients=1, pharmacists=1, prescriptions=options['prescriptions'],
+                                     uploads=options['uploads'])
+            client = APIClient()
+            for name, url, params, role in ENDPOINTS:
+                client.force_authenticate(users[role][0])
+                data = client.get(url, params).data
+                _, request_ms = timed(lambda: client.get(url, params), repeat)
+
+                standard, standard_ms = timed(lambda: JSONRenderer().render(data), repeat)
+                fast, fast_ms = timed(lambda: FastJSONRenderer().render(data), repeat)
+                assert json.loads(standard) == json.loads(fast)
+                gzipped, gzip_ms = timed(lambda: gzip.compress(fast, compresslevel=5, mtime=0), repeat)
+                entry = {
+                    'endpoint': name,
+                    'params': params,
+                    'rows': len(data),
+                    'request_ms': request_ms,
+                    'render_ms': {'drf_json': standard_ms, 'fast_json': fast_ms},
+                    'render_speedup_p50': round(standard_ms['p50'] / fast_ms['p50'], 2) if fast_ms['p50'] else None,
+                    'bytes': {'identity': len(fast), 'gzip': len(gzipped)},
+                    'compress_ms': {'gzip': gzip_ms},
+                }
+                if brotli is not None:
+                    compressed, brotli_ms = timed(lambda: brotli.compress(fast, quality=4), repeat)
+                    entry['bytes']['br'] = len(compressed)
+                    entry['compress_ms']['br'] = brotli_ms
+                results.append(entry)
+
+        write_report({
+            'benchmark': 'rendering',
+            'environment': dict(describe_environment(), orjson=bool(orjson), brotli=brotli is not None),
+            'config': {key: options[key] for key in ('prescriptions', 'uploads', 'repeat')},
+            'endpoints': results,
+        }, options['output'], self.stdout)
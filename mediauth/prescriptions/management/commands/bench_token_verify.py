@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from prescriptions.models import Prescription, PrescriptionRevocation
+from prescriptions.tokens import mint_token, revocations, verify_token
+
+
+class Command(BaseCommand):
+    help = ("Benchmark signed prescription token verification: per-token latency, "
+            "throughput and database queries, with a populated revocation list.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prescriptions', type=int, default=2000, help='Issued prescriptions to mint tokens for')
+        parser.add_argument('--revocations', type=int, default=50000, help='Rows in the revocation list')
+        parser.add_argument('--verifications', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with isolated_environment():
+            generate_dataset(doctors=5, patients=200, pharmacists=1, prescriptions=options['prescriptions'],
+                             uploads=0, seed=options['seed'])
+            issued = list(Prescription.objects.filter(status='issued').prefetch_related('items'))
+            started = time.perf_counter()
+            tokens = [mint_token(prescription) for prescription in issued]
+            mint_us = (time.perf_counter() - started) / len(tokens) * 1e6
+
+            PrescriptionRevocation.objects.bulk_create([
+                PrescriptionRevocation(prescription_id=f"RXOLD{index:012d}", reason='filled')
+                for index in range(options['revocations'])
+            ], batch_size=5000)
+            # A tenth of the tokens belong to prescriptions revoked after minting
+            for prescription in rng.sample(issued, len(issued) // 10):
+                PrescriptionRevocation.objects.create(prescription_id=prescription.prescription_id, reason='filled')
+            revocations.reset()
+            started = time.perf_counter()
+            revocations.refresh(force=True)
+            load_ms = (time.perf_counter() - started) * 1000
+
+            samples, outcomes = [], {}
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(options['verifications']):
+                    token = rng.choice(tokens)
+                    mark = time.perf_counter()
+                    _, reason = verify_token(token)
+                    samples.append((time.perf_counter() - mark) * 1e6)
+                    outcomes[reason or 'valid'] = outcomes.get(reason or 'valid', 0) + 1
+                elapsed = time.perf_counter() - started
+
+        latency = summarize(samples)
+        write_report({
+            'benchmark': 'token_verify',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('prescriptions', 'revocations', 'verifications', 'seed')},
+            'tokens': len(tokens),
+            'token_length': {'min': min(map(len, tokens)), 'max': max(map(len, tokens))},
+            'mint_us': round(mint_us, 2),
+            'revocation_load_ms': round(load_ms, 2),
+            'verify_us': latency,
+            'verifications_per_second': round(options['verifications'] / elapsed, 1),
+            'queries_during_verification': len(queries.captured_queries),
+            'outcomes': outcomes,
+        }, options['output'], self.stdout)
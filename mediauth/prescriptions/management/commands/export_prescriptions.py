@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from prescriptions.export import FORMATS, export_stream
+from prescriptions.models import ArchivedPrescription, Prescription
+
+
+class Command(BaseCommand):
+    help = "Stream every prescription, archived ones included, with its items to NDJSON or CSV, optionally gzipped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="File to write, or '-' for stdout")
+        parser.add_argument('--format', dest='output_format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--status', help='Only prescriptions with this status')
+        parser.add_argument('--since', help='Only prescriptions created at or after this ISO datetime')
+        parser.add_argument('--skip-archived', action='store_true', help='Leave out archived prescriptions')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['status']:
+            filters['status'] = options['status']
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('--since must be an ISO 8601 datetime')
+            filters['created_at__gte'] = since
+        queryset = Prescription.objects.filter(**filters)
+        archived = None if options['skip_archived'] else ArchivedPrescription.objects.filter(**filters)
+
+        started = time.perf_counter()
+        written = 0
+        chunks = export_stream(queryset, options['output_format'], options['gzip'], options['chunk_size'], archived)
+        target = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                target.write(chunk)
+                written += len(chunk)
+        finally:
+            if target is not sys.stdout.buffer:
+                target.close()
+            else:
+                target.flush()
+
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} bytes to {options['output']} in {time.perf_counter() - started:.1f}s"
+            ))
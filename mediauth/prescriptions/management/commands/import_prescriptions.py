@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.importer import detect_format, import_records, read_records
+
+
+class Command(BaseCommand):
+    help = ("Import prescriptions from NDJSON or CSV (optionally gzipped) with batched "
+            "inserts, cached user lookups and resumable checkpoints.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', dest='input_format', choices=['ndjson', 'csv'],
+                            help='Input format; guessed from the file name by default')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records per transaction')
+        parser.add_argument('--checkpoint', help='Save progress here after every batch')
+        parser.add_argument('--resume', action='store_true', help='Continue from --checkpoint')
+        parser.add_argument('--errors', help='Write rejected records here as JSON lines')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without writing')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume needs --checkpoint')
+
+        input_format = options['input_format'] or detect_format(options['path'])
+        errors_file = open(options['errors'], 'a') if options['errors'] else None
+        started = time.perf_counter()
+
+        def progress(report, batch):
+            if errors_file:
+                for entry in batch['errors']:
+                    errors_file.write(json.dumps(entry) + '\n')
+            else:
+                for entry in batch['errors']:
+                    self.stderr.write(f"Line {entry['line']}: {'; '.join(entry['errors'])}")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {report['consumed']} read, {report['imported']} imported, {report['skipped']} skipped, "
+                f"{report['rejected']} rejected ({report['consumed'] / elapsed:.0f} records/s)"
+            )
+
+        try:
+            with open(options['path'], 'rb') as source:
+                report = import_records(
+                    read_records(source, input_format),
+                    batch_size=options['batch_size'],
+                    checkpoint=options['checkpoint'],
+                    resume=options['resume'],
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                    max_errors=0,
+                )
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['imported']} prescriptions ({report['items']} items); "
+            f"{report['skipped']} already present, {report['rejected']} rejected "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,292 @@
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+
+from analytics.aggregates import rebuild as rebuild_analytics
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import SYNTHETIC_PASSWORD, generate_dataset
+from ocrservice.fake_model import FakeModelServer
+from ocrservice.management.commands.bench_ocr import sample_image_bytes
+from ocrservice.models import PrescriptionUpload
+from prescriptions.models import Prescription, PrescriptionItem
+from prescriptions.tokens import mint_token
+
+ROLES = ('doctor', 'patient', 'pharmacist')
+
+
+class Scenario:
+    """One endpoint exercised as one role.
+
+    ``prepare`` runs untimed before every request and returns the URL kwargs
+    and request body, so mutating endpoints always get a fresh target.
+    """
+
+    def __init__(self, url_name, method, role, prepare=None, fmt='json'):
+        self.url_name = url_name
+        self.method = method
+        self.role = role
+        self.prepare = prepare or (lambda ctx: ({}, None))
+        self.fmt = fmt
+
+    @property
+    def key(self):
+        return f"{self.method} {self.url_name} [{self.role or 'anonymous'}]"
+
+
+def build_scenarios(ctx):
+    """Every route in users, prescriptions and ocrservice, per role"""
+    image = ctx['image_bytes']
+
+    def own_prescription(role):
+        def prepare(ctx):
+            user = ctx['user'][role]
+            lookup = {'doctor': 'doctor', 'patient': 'patient'}.get(role)
+            queryset = Prescription.objects.filter(**{lookup: user}) if lookup else Prescription.objects.filter(status='issued')
+            return {'pk': queryset.values_list('pk', flat=True).first()}, None
+        return prepare
+
+    def new_draft(ctx):
+        doctor = ctx['user']['doctor']
+        prescription = Prescription.objects.create(doctor=doctor, patient=ctx['user']['patient'], diagnosis='Load test')
+        PrescriptionItem.objects.create(prescription=prescription, medicine_name='Paracetamol', dosage='650mg',
+                                        frequency='twice daily', duration='5 days', quantity=10)
+        return prescription
+
+    def issued(ctx):
+        prescription = new_draft(ctx)
+        prescription.status = 'issued'
+        prescription.save()
+        return prescription
+
+    def create_body(ctx):
+        return {}, {
+            'patient_id': ctx['user']['patient'].id,
+            'diagnosis': 'Load test',
+            'notes': '',
+            'items': [{'medicine_name': 'Amoxicillin', 'dosage': '500mg', 'frequency': '3 times a day',
+                       'duration': '7 days', 'quantity': 21, 'instructions': 'After food'}],
+        }
+
+    def own_upload(ctx):
+        upload = PrescriptionUpload.objects.filter(patient=ctx['user']['patient']).values_list('pk', flat=True).first()
+        return {'pk': upload}, None
+
+    def fresh_upload(ctx):
+        upload = PrescriptionUpload.objects.create(
+            patient=ctx['user']['patient'], image=ctx['stored_image'], original_filename='loadtest.jpg',
+            status='completed',
+        )
+        return {'pk': upload.pk}, None
+
+    counter = {'n': 0}
+
+    def register_body(ctx):
+        counter['n'] += 1
+        return {}, {
+            'username': f"loadtest-new-{counter['n']}", 'email': f"new{counter['n']}@example.com",
+            'password': SYNTHETIC_PASSWORD, 'password_confirm': SYNTHETIC_PASSWORD,
+            'user_type': 'patient', 'first_name': 'Load', 'last_name': 'Test',
+        }
+
+    def login_body(ctx):
+        return {}, {'username': ctx['user']['patient'].username, 'password': SYNTHETIC_PASSWORD}
+
+    def refresh_body(ctx):
+        return {}, {'refresh': ctx['refresh']}
+
+    scenarios = [
+        Scenario('register', 'post', None, register_body),
+        Scenario('login', 'post', None, login_body),
+        Scenario('token_refresh', 'post', None, refresh_body),
+        Scenario('prescription-list-create', 'post', 'doctor', create_body),
+        Scenario('get-patients', 'get', 'doctor'),
+        Scenario('search-patients', 'get', 'doctor', lambda ctx: ({}, {'q': 'syn-pat-00001'})),
+        Scenario('issue-prescription', 'post', 'doctor', lambda ctx: ({'pk': new_draft(ctx).pk}, None)),
+        Scenario('fill-prescription', 'post', 'pharmacist', lambda ctx: ({'pk': issued(ctx).pk}, None)),
+        Scenario('prescription-token', 'get', 'doctor', lambda ctx: ({'pk': issued(ctx).pk}, None)),
+        Scenario('verify-prescription-token', 'post', 'pharmacist',
+                 lambda ctx: ({}, {'token': mint_token(issued(ctx))})),
+        Scenario('prescription-revocations', 'get', 'pharmacist'),
+        Scenario('prescription-detail', 'patch', 'doctor',
+                 lambda ctx: ({'pk': new_draft(ctx).pk}, {'notes': 'Updated by load test'})),
+        Scenario('prescription-detail', 'delete', 'doctor', lambda ctx: ({'pk': new_draft(ctx).pk}, None)),
+        # Staff only: exercises the permission check for the synthetic roles
+        Scenario('import-prescriptions', 'post', 'doctor',
+                 lambda ctx: ({}, {'file': SimpleUploadedFile('loadtest.ndjson', b'{}\n'), 'dry_run': 'true'}),
+                 fmt='multipart'),
+        Scenario('prescription-upload', 'post', 'patient',
+                 lambda ctx: ({}, {'image': SimpleUploadedFile('loadtest.jpg', image, content_type='image/jpeg')}),
+                 fmt='multipart'),
+        Scenario('prescription-upload-detail', 'get', 'patient', own_upload),
+        Scenario('prescription-upload-detail', 'delete', 'patient', fresh_upload),
+        Scenario('reprocess-upload', 'post', 'patient', fresh_upload),
+        Scenario('reextract-upload', 'post', 'patient',
+                 lambda ctx: (own_upload(ctx)[0], {'fields': ['medicines.0.dosage']})),
+        Scenario('upload-usage', 'get', 'patient', own_upload),
+        Scenario('similar-uploads', 'get', 'patient', own_upload),
+        Scenario('analytics-doctor-detail', 'get', 'doctor',
+                 lambda ctx: ({'doctor_id': ctx['user']['doctor'].id}, None)),
+        Scenario('analytics-medicines', 'get', 'doctor'),
+        # Staff only, like import-prescriptions
+        Scenario('analytics-summary', 'get', 'doctor'),
+        Scenario('analytics-doctors', 'get', 'doctor'),
+        Scenario('audit-events', 'get', 'doctor'),
+    ]
+    for role in ROLES:
+        scenarios += [
+            Scenario('profile', 'get', role),
+            Scenario('profile', 'patch', role, lambda ctx: ({}, {'phone_number': '9000000000'})),
+            Scenario('prescription-list-create', 'get', role),
+            Scenario('prescription-detail', 'get', role, own_prescription(role)),
+            Scenario('prescription-upload', 'get', role),
+            Scenario('ocr-usage', 'get', role),
+            Scenario('export-prescriptions', 'get', role),
+            Scenario('dashboard', 'get', role),
+        ]
+    return scenarios
+
+
+def route_names():
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        if getattr(pattern, 'app_name', None) is None and hasattr(pattern, 'url_patterns'):
+            names.update(p.name for p in pattern.url_patterns if getattr(p, 'name', None))
+    return names
+
+
+class Command(BaseCommand):
+    help = ("Load-test every API route per role against a synthetic dataset and report "
+            "latency percentiles, query counts and peak memory per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--doctors', type=int, default=5)
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--pharmacists', type=int, default=3)
+        parser.add_argument('--prescriptions', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=3, help='Items per prescription')
+        parser.add_argument('--uploads', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--model-latency-ms', type=float, default=0.0, help='Fake OCR model latency')
+        parser.add_argument('--only', help='Only run endpoints whose key contains this text')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--baseline', help='Previous report to compare p50/p95 and query counts against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+
+        with FakeModelServer(latency_ms=options['model_latency_ms']) as server, isolated_environment(), \
+                override_settings(GROQ_API_KEY='loadtest', GROQ_BASE_URL=server.url, GROQ_MAX_RETRIES=0):
+            started = time.perf_counter()
+            dataset = generate_dataset(
+                doctors=options['doctors'], patients=options['patients'], pharmacists=options['pharmacists'],
+                prescriptions=options['prescriptions'], items_per_prescription=options['items'],
+                uploads=options['uploads'], seed=options['seed'],
+            )
+            generate_seconds = time.perf_counter() - started
+
+            patient = dataset['patient'][0]
+            ctx = {
+                'user': {role: dataset[role][0] for role in ROLES},
+                'image_bytes': sample_image_bytes(),
+                'stored_image': PrescriptionUpload.objects.values_list('image', flat=True).first() or '',
+            }
+            # Make sure the acting users own some rows for the detail endpoints
+            sample = list(Prescription.objects.values_list('pk', flat=True)[:10])
+            Prescription.objects.filter(pk__in=sample).update(doctor=ctx['user']['doctor'], patient=patient)
+            sample = list(PrescriptionUpload.objects.values_list('pk', flat=True)[:5])
+            PrescriptionUpload.objects.filter(pk__in=sample).update(patient=patient)
+            rebuild_analytics()
+            login = APIClient().post('/api/users/login/', {'username': patient.username, 'password': SYNTHETIC_PASSWORD})
+            ctx['refresh'] = login.data.get('refresh', '')
+
+            scenarios = [s for s in build_scenarios(ctx) if not options['only'] or options['only'] in s.key]
+            endpoints = [self.run_scenario(scenario, ctx, options['iterations']) for scenario in scenarios]
+
+        covered = {scenario.url_name for scenario in scenarios}
+        report = {
+            'benchmark': 'api_loadtest',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in (
+                'iterations', 'doctors', 'patients', 'pharmacists', 'prescriptions', 'items', 'uploads', 'seed',
+            )},
+            'dataset_seconds': round(generate_seconds, 3),
+            'uncovered_routes': sorted(route_names() - covered) if not options['only'] else [],
+            'endpoints': endpoints,
+        }
+        if options['baseline']:
+            report['comparison'] = compare(json.loads(Path(options['baseline']).read_text()), report)
+        write_report(report, options['output'], self.stdout)
+
+    def run_scenario(self, scenario, ctx, iterations):
+        client = APIClient()
+        client.raise_request_exception = False
+        if scenario.role:
+            client.force_authenticate(ctx['user'][scenario.role])
+
+        def request():
+            kwargs, body = scenario.prepare(ctx)
+            url = reverse(scenario.url_name, kwargs=kwargs or None)
+            call = getattr(client, scenario.method)
+            started = time.perf_counter()
+            response = call(url, body, format=scenario.fmt) if body is not None else call(url)
+            # Streaming responses do their work while being consumed
+            size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+            return (time.perf_counter() - started) * 1000, response, size
+
+        request()  # warm-up
+        latencies, statuses = [], {}
+        for _ in range(iterations):
+            elapsed, response, _ = request()
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        # One extra profiled request: query capture and tracemalloc skew timings,
+        # so they are kept out of the latency samples.
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                _, response, size = request()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'endpoint': scenario.key,
+            'url_name': scenario.url_name,
+            'method': scenario.method.upper(),
+            'role': scenario.role or 'anonymous',
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+            'latency_ms': summarize(latencies),
+            'queries': len(queries.captured_queries),
+            'query_time_ms': round(sum(float(q['time']) for q in queries.captured_queries) * 1000, 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'response_bytes': size,
+        }
+
+
+def compare(baseline, report):
+    """Per-endpoint deltas against an earlier report"""
+    previous = {entry['endpoint']: entry for entry in baseline.get('endpoints', [])}
+    rows = []
+    for entry in report['endpoints']:
+        before = previous.get(entry['endpoint'])
+        if not before:
+            continue
+        rows.append({
+            'endpoint': entry['endpoint'],
+            'p50_delta_ms': round(entry['latency_ms']['p50'] - before['latency_ms']['p50'], 3),
+            'p95_delta_ms': round(entry['latency_ms']['p95'] - before['latency_ms']['p95'], 3),
+            'queries_delta': entry['queries'] - before['queries'],
+            'peak_memory_delta_kb': round(entry['peak_memory_kb'] - before['peak_memory_kb'], 1),
+        })
+    return rows
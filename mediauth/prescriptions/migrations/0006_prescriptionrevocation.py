@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0005_alter_prescription_prescription_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prescription_id', models.CharField(db_index=True, max_length=20)),
+                ('reason', models.CharField(choices=[('filled', 'Filled'), ('cancelled', 'Cancelled'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=20)),
+                ('revoked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
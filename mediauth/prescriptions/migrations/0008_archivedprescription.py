@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('prescriptions', '0007_prescription_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPrescription',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('prescription_id', models.CharField(max_length=20, unique=True)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('issued', 'Issued'), ('filled', 'Filled'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('issued_date', models.DateTimeField(blank=True, null=True)),
+                ('filled_date', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(default=dict)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_prescriptions', to=settings.AUTH_USER_MODEL)),
+                ('filled_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_patient_prescriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
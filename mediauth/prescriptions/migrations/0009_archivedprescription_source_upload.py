@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrservice', '0009_upload_run_token_idempotencykey'),
+        ('prescriptions', '0008_archivedprescription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedprescription',
+            name='source_upload',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_prescription', to='ocrservice.prescriptionupload'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0009_archivedprescription_source_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prescriptionrevocation',
+            name='revoked_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
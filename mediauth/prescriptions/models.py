@@ -31,6 +31,14 @@ class Prescription(models.Model):
     filled_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='filled_prescriptions')
     filled_date = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            # Newest-first lists per role (list view, dashboard) without sorting every row
+            models.Index(fields=['doctor', '-created_at'], name='rx_doctor_created_idx'),
+            models.Index(fields=['patient', '-created_at'], name='rx_patient_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='rx_status_created_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         # Save first to get a valid ID
         is_new = self.pk is None
@@ -54,4 +62,48 @@ class PrescriptionItem(models.Model):
     instructions = models.TextField(blank=True)
     
     def __str__(self):
-        return f"{self.medicine_name} - {self.prescription.prescription_id}"
\ No newline at end of file
+        return f"{self.medicine_name} - {self.prescription.prescription_id}"
+
+class PrescriptionRevocation(models.Model):
+    """Tokens for a prescription issued before ``revoked_at`` are no longer valid"""
+    REASON_CHOICES = [
+        ('filled', 'Filled'),
+        ('cancelled', 'Cancelled'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    # The public RX id rather than a foreign key, so revocations outlive deleted prescriptions
+    prescription_id = models.CharField(max_length=20, db_index=True)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.prescription_id} revoked ({self.reason})"
+
+class ArchivedPrescription(models.Model):
+    """A filled or cancelled prescription moved out of the hot tables by ``prescriptions.archive``"""
+    # The original primary key, so detail URLs keep working after archiving
+    id = models.BigIntegerField(primary_key=True)
+    prescription_id = models.CharField(max_length=20, unique=True)
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_prescriptions')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_patient_prescriptions')
+    filled_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Prescription.STATUS_CHOICES)
+    
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    issued_date = models.DateTimeField(null=True, blank=True)
+    filled_date = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    # The upload converted into this prescription, relinked on restore
+    source_upload = models.OneToOneField(
+        'ocrservice.PrescriptionUpload', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_prescription',
+    )
+    
+    # Diagnosis, notes and items: only ever read whole, so one JSON value instead of item rows
+    data = models.JSONField(default=dict)
+    
+    def __str__(self):
+        return f"{self.prescription_id} (archived)"
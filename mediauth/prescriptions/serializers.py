@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Prescription, PrescriptionItem
+from mediauth.sparse import SparseFieldsMixin
+from .models import ArchivedPrescription, Prescription, PrescriptionItem
 
 User = get_user_model()
 
@@ -15,7 +16,7 @@ class PrescriptionItemSerializer(serializers.ModelSerializer):
         fields = ['medicine_name', 'dosage', 'frequency', 'duration', 'quantity', 'instructions']
         read_only_fields = ['id']
 
-class PrescriptionSerializer(serializers.ModelSerializer):
+class PrescriptionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = PrescriptionItemSerializer(many=True, required=False)
     doctor = UserBasicSerializer(read_only=True)
     patient = UserBasicSerializer(read_only=True)
@@ -30,6 +31,8 @@ class PrescriptionSerializer(serializers.ModelSerializer):
             'issued_date', 'filled_by', 'filled_date', 'items'
         ]
         read_only_fields = ['id', 'prescription_id', 'doctor', 'created_at', 'updated_at']
+        # Left out of list responses unless asked for with ?expand=
+        heavy_fields = ['items', 'notes']
     
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
@@ -97,4 +100,21 @@ class PrescriptionCreateSerializer(serializers.ModelSerializer):
         for item_data in items_data:
             PrescriptionItem.objects.create(prescription=prescription, **item_data)
         
-        return prescription
\ No newline at end of file
+        return prescription
+
+class ArchivedPrescriptionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Read-only, in the shape of ``PrescriptionSerializer`` plus ``archived_at``"""
+    doctor = UserBasicSerializer(read_only=True)
+    patient = UserBasicSerializer(read_only=True)
+    filled_by = UserBasicSerializer(read_only=True)
+    diagnosis = serializers.CharField(source='data.diagnosis', default='', read_only=True)
+    notes = serializers.CharField(source='data.notes', default='', read_only=True)
+    items = serializers.ListField(source='data.items', default=list, read_only=True)
+    
+    class Meta:
+        model = ArchivedPrescription
+        fields = [
+            'id', 'prescription_id', 'doctor', 'patient', 'diagnosis', 'notes', 'status',
+            'created_at', 'updated_at', 'issued_date', 'filled_by', 'filled_date', 'items', 'archived_at'
+        ]
+        read_only_fields = fields
@@ -1,3 +1,357 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core import signing
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from mediauth.testing import IsolatedTestMixin
+from ocrservice.conversion import pending_uploads
+from ocrservice.models import PrescriptionUpload
+from users.models import User
+from .archive import archive_cutoff, archive_old, restore
+from .importer import import_records, read_records
+from .models import ArchivedPrescription, Prescription, PrescriptionItem, PrescriptionRevocation
+from .tokens import SALT, RevocationList, mint_token, prune_revocations, revocations, revoke, verify_token
 
-# Create your tests here.
+ITEM = {'medicine_name': 'Amoxicillin', 'dosage': '500mg', 'frequency': 'Twice daily', 'duration': '5 days',
+        'quantity': 10, 'instructions': 'After food'}
+
+
+def make_users():
+    return (User.objects.create_user('doc', password='pw', user_type='doctor'),
+            User.objects.create_user('pat', password='pw', user_type='patient'),
+            User.objects.create_user('pharm', password='pw', user_type='pharmacist'))
+
+
+def make_prescription(doctor, patient, status='draft', items=(ITEM,), **fields):
+    prescription = Prescription.objects.create(doctor=doctor, patient=patient, status=status,
+                                               diagnosis=fields.pop('diagnosis', 'Sinusitis'), **fields)
+    for item in items:
+        PrescriptionItem.objects.create(prescription=prescription, **item)
+    return prescription
+
+
+def ndjson(*records):
+    return read_records(io.BytesIO(''.join(json.dumps(record) + '\n' for record in records).encode()))
+
+
+class ImportTests(IsolatedTestMixin, TestCase):
+    def setUp(self):
+        self.doctor, self.patient, self.pharmacist = make_users()
+
+    def record(self, **fields):
+        return {'doctor': 'doc', 'patient': 'pat', 'diagnosis': 'Flu', 'status': 'draft', 'items': [ITEM], **fields}
+
+    def test_imports_valid_records_with_items(self):
+        report = import_records(ndjson(self.record(prescription_id='LEGACY1'),
+                                       self.record(prescription_id='LEGACY2', status='filled', filled_by='pharm')))
+        self.assertEqual((report['imported'], report['items'], report['rejected']), (2, 2, 0))
+        filled = Prescription.objects.get(prescription_id='LEGACY2')
+        self.assertEqual(filled.filled_by, self.pharmacist)
+        self.assertEqual(filled.items.get().medicine_name, 'Amoxicillin')
+
+    def test_rejects_invalid_records_with_reasons(self):
+        report = import_records(ndjson(
+            self.record(diagnosis=''),
+            self.record(doctor='pat'),
+            self.record(patient='nobody'),
+            self.record(items=[{**ITEM, 'quantity': 'ten'}]),
+            self.record(status='lost'),
+        ))
+        self.assertEqual((report['imported'], report['rejected']), (0, 5))
+        reasons = [error['errors'][0] for error in report['errors']]
+        self.assertEqual(reasons, [
+            'diagnosis: missing',
+            "doctor: 'pat' is not a doctor",
+            "patient: unknown user 'nobody'",
+            'items.0.quantity: not an integer',
+            'status: must be one of cancelled, draft, filled, issued',
+        ])
+        self.assertFalse(Prescription.objects.exists())
+
+    def test_skips_existing_archived_and_repeated_ids(self):
+        make_prescription(self.doctor, self.patient, prescription_id='LIVE1')
+        ArchivedPrescription.objects.create(id=999, prescription_id='COLD1', doctor=self.doctor, patient=self.patient,
+                                            status='filled', created_at='2024-01-01T00:00:00Z',
+                                            updated_at='2024-01-01T00:00:00Z', data={})
+        report = import_records(ndjson(self.record(prescription_id='LIVE1'), self.record(prescription_id='COLD1'),
+                                       self.record(prescription_id='NEW1'), self.record(prescription_id='NEW1')))
+        self.assertEqual((report['imported'], report['skipped']), (1, 3))
+
+    def test_keeps_legacy_ids_that_look_like_placeholders(self):
+        import_records(ndjson(self.record(prescription_id='TMP123'), self.record()))
+        self.assertTrue(Prescription.objects.filter(prescription_id='TMP123').exists())
+
+    def test_records_without_an_id_are_not_imported_twice(self):
+        records = [self.record(), self.record(diagnosis='Cold')]
+        first = import_records(ndjson(*records))
+        second = import_records(ndjson(*records))
+        self.assertEqual((first['imported'], second['imported'], second['skipped']), (2, 0, 2))
+        self.assertEqual(Prescription.objects.count(), 2)
+
+    def test_dry_run_writes_nothing(self):
+        report = import_records(ndjson(self.record(prescription_id='DRY1')), dry_run=True)
+        self.assertEqual(report['imported'], 1)
+        self.assertFalse(Prescription.objects.exists())
+
+
+class SparseFieldsTests(IsolatedTestMixin, APITestCase):
+    url = '/api/prescriptions/'
+
+    def setUp(self):
+        self.doctor, self.patient, _ = make_users()
+        self.prescription = make_prescription(self.doctor, self.patient, notes='Rest')
+        self.client.force_authenticate(self.doctor)
+
+    def test_list_leaves_out_heavy_fields(self):
+        row = self.client.get(self.url).data[0]
+        self.assertNotIn('items', row)
+        self.assertNotIn('notes', row)
+        self.assertEqual(row['doctor']['username'], 'doc')
+
+    def test_expand_brings_heavy_fields_back(self):
+        row = self.client.get(self.url, {'expand': 'items'}).data[0]
+        self.assertEqual(row['items'][0]['medicine_name'], 'Amoxicillin')
+        self.assertNotIn('notes', row)
+
+    def test_fields_keeps_only_the_named_fields(self):
+        rows = self.client.get(self.url, {'fields': 'prescription_id,status,notes'}).data
+        self.assertEqual(rows, [{'prescription_id': self.prescription.prescription_id, 'status': 'draft',
+                                 'notes': 'Rest'}])
+
+    def test_fields_applies_to_detail(self):
+        response = self.client.get(f"{self.url}{self.prescription.pk}/", {'fields': 'id,items'})
+        self.assertEqual(set(response.data), {'id', 'items'})
+
+    def test_detail_is_full_by_default(self):
+        response = self.client.get(f"{self.url}{self.prescription.pk}/")
+        self.assertIn('items', response.data)
+        self.assertIn('notes', response.data)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', str(response.data['fields']))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for _ in range(5):
+            make_prescription(self.doctor, self.patient)
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'fields': 'id,status'})
+        with self.assertNumQueries(2):
+            # The rows with their users, then every item in one prefetch
+            self.client.get(self.url, {'expand': 'items'})
+
+
+class PrescriptionTokenTests(IsolatedTestMixin, APITestCase):
+    def setUp(self):
+        revocations.reset()
+        self.doctor, self.patient, self.pharmacist = make_users()
+        self.prescription = make_prescription(self.doctor, self.patient)
+
+    def issue(self):
+        self.client.force_authenticate(self.doctor)
+        response = self.client.post(f"/api/prescriptions/{self.prescription.pk}/issue/")
+        self.assertEqual(response.status_code, 200)
+        return response.data['token']
+
+    def verify(self, token):
+        self.client.force_authenticate(None)
+        return self.client.post('/api/prescriptions/verify/', {'token': token}, format='json',
+                                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.pharmacist)}").data
+
+    def test_issued_token_verifies_until_filled(self):
+        token = self.issue()
+        result = self.verify(token)
+        self.assertTrue(result['valid'])
+        self.assertEqual((result['prescription_id'], result['patient_id']),
+                         (self.prescription.prescription_id, self.patient.id))
+
+        self.client.force_authenticate(self.pharmacist)
+        self.assertEqual(self.client.post(f"/api/prescriptions/{self.prescription.pk}/fill/").status_code, 200)
+        self.assertEqual(self.verify(token), {'valid': False, 'reason': 'revoked'})
+
+    def test_tampered_and_draft_tokens_are_rejected(self):
+        token = self.issue()
+        self.assertEqual(verify_token(token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')),
+                         (None, 'invalid signature'))
+        draft = make_prescription(self.doctor, self.patient)
+        self.assertEqual(verify_token(mint_token(draft)), (None, 'not issued'))
+
+    def test_old_tokens_expire(self):
+        token = self.issue()
+        with override_settings(PRESCRIPTION_TOKENS={**settings.PRESCRIPTION_TOKENS, 'MAX_AGE_SECONDS': -1}):
+            self.assertEqual(verify_token(token), (None, 'expired'))
+
+    def test_revocation_reaches_other_processes(self):
+        token = self.issue()
+        issued_ms = signing.loads(token, salt=SALT)['iat']
+        other = RevocationList()
+        self.assertFalse(other.revoked_after(self.prescription.prescription_id, issued_ms))
+        revoke(self.prescription, 'cancelled')
+        other.refresh(force=True)
+        self.assertTrue(other.revoked_after(self.prescription.prescription_id, issued_ms))
+
+    def test_refresh_picks_up_rows_committed_behind_the_cursor(self):
+        other = RevocationList()
+        PrescriptionRevocation.objects.create(prescription_id='RXNEW', reason='filled')
+        other.refresh(force=True)
+        # Another server's transaction commits a row stamped before the newest one already seen
+        late = PrescriptionRevocation.objects.create(prescription_id='RXLATE', reason='filled')
+        PrescriptionRevocation.objects.filter(pk=late.pk).update(revoked_at=other.cursor - timedelta(seconds=10))
+        other.refresh(force=True)
+        self.assertIn('RXLATE', other.revoked)
+
+    def test_revocations_older_than_any_valid_token_are_pruned(self):
+        old = PrescriptionRevocation.objects.create(prescription_id='RXOLD', reason='filled')
+        max_age = settings.PRESCRIPTION_TOKENS['MAX_AGE_SECONDS']
+        PrescriptionRevocation.objects.filter(pk=old.pk).update(
+            revoked_at=timezone.now() - timedelta(seconds=max_age + 60))
+        PrescriptionRevocation.objects.create(prescription_id='RXNEW', reason='filled')
+        other = RevocationList()
+        other.refresh(force=True)
+        self.assertEqual(set(other.revoked), {'RXNEW'})
+        self.assertEqual(prune_revocations(), 1)
+        self.assertFalse(PrescriptionRevocation.objects.filter(prescription_id='RXOLD').exists())
+
+
+class RevocationSyncTests(IsolatedTestMixin, APITestCase):
+    url = '/api/prescriptions/revocations/'
+
+    def setUp(self):
+        revocations.reset()
+        _, _, pharmacist = make_users()
+        self.client.force_authenticate(pharmacist)
+
+    def revoked(self, prescription_id, seconds_ago):
+        row = PrescriptionRevocation.objects.create(prescription_id=prescription_id, reason='filled')
+        PrescriptionRevocation.objects.filter(pk=row.pk).update(
+            revoked_at=timezone.now() - timedelta(seconds=seconds_ago))
+        return row
+
+    def sync(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rows_committed_behind_the_cursor_are_sent(self):
+        self.revoked('RX1', 30)
+        self.revoked('RX2', 20)
+        first = self.sync()
+        self.assertEqual([row['prescription_id'] for row in first['revocations']], ['RX1', 'RX2'])
+        self.assertTrue(first['complete'])
+        # Committed after the first sync, but stamped before its newest row
+        self.revoked('RX3', 25)
+        again = self.sync(since=first['next_since'].isoformat())
+        self.assertIn('RX3', [row['prescription_id'] for row in again['revocations']])
+        self.assertFalse(again['expired'])
+
+    @mock.patch('prescriptions.views.REVOCATION_PAGE_SIZE', 2)
+    def test_pages_follow_revoked_at(self):
+        for index in range(5):
+            self.revoked(f"RX{index}", 50 - index)
+        seen, params = [], {}
+        while True:
+            page = self.sync(**params)
+            seen += [row['prescription_id'] for row in page['revocations']]
+            if page['complete']:
+                break
+            params = {'since': page['next_since'].isoformat(), 'after': page['next_after']}
+        self.assertEqual(seen, ['RX0', 'RX1', 'RX2', 'RX3', 'RX4'])
+
+    def test_cursor_older_than_the_prune_horizon_is_expired(self):
+        self.revoked('RX1', 10)
+        max_age = settings.PRESCRIPTION_TOKENS['MAX_AGE_SECONDS']
+        page = self.sync(since=(timezone.now() - timedelta(seconds=max_age + 60)).isoformat())
+        self.assertTrue(page['expired'])
+        self.assertEqual([row['prescription_id'] for row in page['revocations']], ['RX1'])
+
+    def test_bad_cursors_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'since': '42'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'after': '3'}).status_code, 400)
+
+
+class ArchiveTests(IsolatedTestMixin, APITestCase):
+    def setUp(self):
+        self.doctor, self.patient, self.pharmacist = make_users()
+        self.long_ago = timezone.now() - timedelta(days=400)
+
+    def finished(self, status='filled', **fields):
+        prescription = make_prescription(self.doctor, self.patient, status=status, notes='Rest',
+                                         items=(ITEM, {**ITEM, 'medicine_name': 'Ibuprofen'}), **fields)
+        Prescription.objects.filter(pk=prescription.pk).update(created_at=self.long_ago, updated_at=self.long_ago)
+        prescription.refresh_from_db()
+        return prescription
+
+    def test_only_old_finished_prescriptions_move(self):
+        old = [self.finished(), self.finished('cancelled'), self.finished()]
+        recent = make_prescription(self.doctor, self.patient, status='filled')
+        in_play = self.finished('issued')
+        report = archive_old(archive_cutoff(180), batch_size=2)
+        self.assertEqual(report, {'batches': 2, 'archived': 3})
+        self.assertEqual(set(ArchivedPrescription.objects.values_list('pk', flat=True)), {p.pk for p in old})
+        self.assertEqual(set(Prescription.objects.values_list('pk', flat=True)), {recent.pk, in_play.pk})
+        self.assertFalse(PrescriptionItem.objects.filter(prescription__in=[p.pk for p in old]).exists())
+
+    def test_restore_round_trip(self):
+        prescription = self.finished(filled_by=self.pharmacist, filled_date=self.long_ago,
+                                     issued_date=self.long_ago)
+        upload = PrescriptionUpload.objects.create(patient=self.patient, image='uploads/x.jpg',
+                                                   original_filename='x.jpg', status='completed',
+                                                   prescription=prescription)
+        archive_old(archive_cutoff(180))
+        upload.refresh_from_db()
+        self.assertIsNone(upload.prescription_id)
+        # Still linked through the archive, so it is not converted again
+        self.assertFalse(pending_uploads().exists())
+
+        self.assertEqual(restore([prescription.pk]), 1)
+        restored = Prescription.objects.get(pk=prescription.pk)
+        for field in ('prescription_id', 'doctor_id', 'patient_id', 'filled_by_id', 'status', 'diagnosis',
+                      'notes', 'created_at', 'updated_at', 'issued_date', 'filled_date'):
+            self.assertEqual(getattr(restored, field), getattr(prescription, field), field)
+        self.assertEqual(sorted(restored.items.values_list('medicine_name', 'quantity')),
+                         [('Amoxicillin', 10), ('Ibuprofen', 10)])
+        upload.refresh_from_db()
+        self.assertEqual(upload.prescription_id, prescription.pk)
+        self.assertFalse(ArchivedPrescription.objects.exists())
+
+    def test_detail_falls_back_to_the_archive(self):
+        prescription = self.finished()
+        archive_old(archive_cutoff(180))
+        url = f"/api/prescriptions/{prescription.pk}/"
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['prescription_id'], prescription.prescription_id)
+        self.assertEqual(len(response.data['items']), 2)
+        # Scoped like the live detail view
+        self.client.force_authenticate(User.objects.create_user('other', user_type='patient'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+    def export(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/prescriptions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_streams_archived_prescriptions_flagged(self):
+        archived = self.finished()
+        archive_old(archive_cutoff(180))
+        hot = make_prescription(self.doctor, self.patient, status='issued', items=(ITEM,))
+        records = [json.loads(line) for line in self.export(self.doctor).splitlines()]
+        self.assertEqual([(record['id'], record['archived']) for record in records],
+                         [(hot.pk, False), (archived.pk, True)])
+        self.assertEqual((records[1]['notes'], [item['medicine_name'] for item in records[1]['items']]),
+                         ('Rest', ['Amoxicillin', 'Ibuprofen']))
+        self.assertEqual(len(self.export(self.doctor, include_archived='0').splitlines()), 1)
+        self.assertEqual(len(self.export(self.doctor, status='issued').splitlines()), 1)
+        self.assertEqual(len(self.export(self.pharmacist).splitlines()), 1)
+        rows = list(csv.DictReader(io.StringIO(self.export(self.doctor, output='csv'))))
+        self.assertEqual([row['archived'] for row in rows], ['False', 'True', 'True'])
@@ -0,0 +1,147 @@
+"""Signed prescription tokens that verify without touching the database.
+
+A token is a compact, URL-safe string (small enough for a QR code) made
+with ``django.core.signing``: HMAC-SHA256 over a JSON payload holding the
+prescription id, patient, status, a digest of the items and the issue time
+in milliseconds. Rotating ``SECRET_KEY`` through ``SECRET_KEY_FALLBACKS``
+keeps older tokens verifiable.
+
+Tokens are revoked per prescription: filling, cancelling, editing or
+deleting an issued prescription records a ``PrescriptionRevocation``, and
+any token issued before it is rejected. Each process keeps the revocation
+list in memory and, at most every ``PRESCRIPTION_TOKENS['REFRESH_SECONDS']``,
+pulls the rows revoked since the newest one it has seen, less
+``OVERLAP_SECONDS`` so rows committed late by another server are not
+skipped; verification cost does not depend on the database. Revocations
+older than ``MAX_AGE_SECONDS`` only concern tokens that fail as expired
+anyway, so they are never loaded and are pruned from memory and the table.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from .models import PrescriptionRevocation
+
+SALT = 'prescriptions.tokens'
+VERSION = 1
+
+
+def items_digest(items):
+    """Short digest of the medicine lines, independent of row order"""
+    lines = sorted(
+        [item.medicine_name, item.dosage, item.frequency, item.duration, item.quantity]
+        for item in items
+    )
+    digest = hashlib.sha256(json.dumps(lines, separators=(',', ':')).encode()).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def mint_token(prescription):
+    """Signed token for an issued prescription"""
+    payload = {
+        'v': VERSION,
+        'rx': prescription.prescription_id,
+        'pt': prescription.patient_id,
+        'dr': prescription.doctor_id,
+        's': prescription.status,
+        'd': items_digest(prescription.items.all()),
+        'iat': int(time.time() * 1000),
+    }
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def revocation_window(cursor=None):
+    """``(oldest, since)``: the prune horizon, and where a sync that has seen up to ``cursor`` resumes.
+
+    Resuming ``OVERLAP_SECONDS`` before the cursor picks up rows another
+    server committed late, stamped before rows already seen.
+    """
+    config = settings.PRESCRIPTION_TOKENS
+    oldest = timezone.now() - timedelta(seconds=config['MAX_AGE_SECONDS'])
+    if cursor is None:
+        return oldest, oldest
+    return oldest, max(oldest, cursor - timedelta(seconds=config['OVERLAP_SECONDS']))
+
+
+class RevocationList:
+    """In-memory ``prescription_id -> latest revoked_at (ms)``, refreshed incrementally"""
+
+    def __init__(self):
+        self.revoked = {}
+        self.cursor = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        config = settings.PRESCRIPTION_TOKENS
+        if not force and self.refreshed_at is not None and now - self.refreshed_at < config['REFRESH_SECONDS']:
+            return
+        if not self.lock.acquire(blocking=force or self.refreshed_at is None):
+            return  # another thread is refreshing; the current list is at most one interval old
+        try:
+            oldest, since = revocation_window(self.cursor)
+            rows = (PrescriptionRevocation.objects.filter(revoked_at__gte=since)
+                    .values_list('prescription_id', 'revoked_at'))
+            for prescription_id, revoked_at in rows.iterator(chunk_size=5000):
+                revoked_ms = int(revoked_at.timestamp() * 1000)
+                if revoked_ms > self.revoked.get(prescription_id, 0):
+                    self.revoked[prescription_id] = revoked_ms
+                if self.cursor is None or revoked_at > self.cursor:
+                    self.cursor = revoked_at
+            oldest_ms = int(oldest.timestamp() * 1000)
+            self.revoked = {key: value for key, value in self.revoked.items() if value >= oldest_ms}
+            self.refreshed_at = now
+        finally:
+            self.lock.release()
+
+    def revoked_after(self, prescription_id, issued_ms):
+        self.refresh()
+        return self.revoked.get(prescription_id, 0) >= issued_ms
+
+    def reset(self):
+        with self.lock:
+            self.revoked = {}
+            self.cursor = None
+            self.refreshed_at = None
+
+
+revocations = RevocationList()
+
+
+def verify_token(token):
+    """``(claims, None)`` for a valid token, or ``(None, reason)``"""
+    try:
+        claims = signing.loads(token, salt=SALT, max_age=settings.PRESCRIPTION_TOKENS['MAX_AGE_SECONDS'])
+    except signing.SignatureExpired:
+        return None, 'expired'
+    except signing.BadSignature:
+        return None, 'invalid signature'
+    if not isinstance(claims, dict) or claims.get('v') != VERSION:
+        return None, 'unsupported token'
+    if claims.get('s') != 'issued':
+        return None, 'not issued'
+    if revocations.revoked_after(claims['rx'], claims['iat']):
+        return None, 'revoked'
+    return claims, None
+
+
+def prune_revocations():
+    """Delete revocations older than any token that could still verify; returns how many"""
+    oldest, _ = revocation_window()
+    deleted, _ = PrescriptionRevocation.objects.filter(revoked_at__lt=oldest).delete()
+    return deleted
+
+
+def revoke(prescription, reason):
+    """Invalidate every token minted so far for ``prescription``"""
+    revocation = PrescriptionRevocation.objects.create(prescription_id=prescription.prescription_id, reason=reason)
+    prune_revocations()
+    # Make the revocation visible to this process straight away
+    revocations.refresh(force=True)
+    return revocation
@@ -4,7 +4,13 @@ from . import views
 urlpatterns = [
     path('', views.PrescriptionListCreateView.as_view(), name='prescription-list-create'),
     path('<int:pk>/', views.PrescriptionDetailView.as_view(), name='prescription-detail'),
+    path('export/', views.export_prescriptions, name='export-prescriptions'),
+    path('import/', views.import_prescriptions, name='import-prescriptions'),
     path('patients/', views.get_patients, name='get-patients'),
+    path('patients/search/', views.search_patient_list, name='search-patients'),
     path('<int:pk>/issue/', views.issue_prescription, name='issue-prescription'),
     path('<int:pk>/fill/', views.fill_prescription, name='fill-prescription'),
+    path('<int:pk>/token/', views.prescription_token, name='prescription-token'),
+    path('verify/', views.verify_prescription_token, name='verify-prescription-token'),
+    path('revocations/', views.revocation_list, name='prescription-revocations'),
 ]
\ No newline at end of file
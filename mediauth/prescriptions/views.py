@@ -1,27 +1,63 @@
+import logging
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Prescription, PrescriptionItem
-from .serializers import PrescriptionSerializer, PrescriptionCreateSerializer, UserBasicSerializer
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from analytics import aggregates
+from audit import log as audit_log
+from mediauth.sparse import SparseQuerysetMixin
+from users.search import search_patients
+from .archive import archived_prescriptions
+from .export import FORMATS, export_stream
+from .importer import detect_format, import_records, read_records
+from .models import ArchivedPrescription, Prescription, PrescriptionItem, PrescriptionRevocation
+from .serializers import (
+    ArchivedPrescriptionSerializer, PrescriptionSerializer, PrescriptionCreateSerializer, UserBasicSerializer,
+)
+from .tokens import mint_token, revocation_window, revoke, verify_token
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+REVOCATION_PAGE_SIZE = 5000
 
-class PrescriptionListCreateView(generics.ListCreateAPIView):
+def transition(prescription, from_status, **fields):
+    """Save ``fields`` only while the row is still ``from_status``; False if another request changed it first"""
+    fields['updated_at'] = timezone.now()
+    if not Prescription.objects.filter(pk=prescription.pk, status=from_status).update(**fields):
+        return False
+    for field, value in fields.items():
+        setattr(prescription, field, value)
+    return True
+
+def changed_meanwhile():
+    return Response({'error': 'The prescription was changed by another request; reload it'},
+                   status=status.HTTP_409_CONFLICT)
+
+def listed_prescriptions(user):
+    """Prescriptions a user sees in lists: own for doctors and patients, issued for pharmacists"""
+    if user.user_type == 'doctor':
+        return Prescription.objects.filter(doctor=user)
+    elif user.user_type == 'patient':
+        return Prescription.objects.filter(patient=user)
+    elif user.user_type == 'pharmacist':
+        return Prescription.objects.filter(status='issued')
+    return Prescription.objects.none()
+
+class PrescriptionListCreateView(SparseQuerysetMixin, generics.ListCreateAPIView):
     serializer_class = PrescriptionSerializer
     permission_classes = [IsAuthenticated]
+    compact_list = True
     
     def get_queryset(self):
-        user = self.request.user
-        if user.user_type == 'doctor':
-            return Prescription.objects.filter(doctor=user).order_by('-created_at')
-        elif user.user_type == 'patient':
-            return Prescription.objects.filter(patient=user).order_by('-created_at')
-        elif user.user_type == 'pharmacist':
-            return Prescription.objects.filter(status='issued').order_by('-created_at')
-        return Prescription.objects.none()
+        return listed_prescriptions(self.request.user).order_by('-created_at')
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -32,12 +68,15 @@ class PrescriptionListCreateView(generics.ListCreateAPIView):
         if self.request.user.user_type != 'doctor':
             raise PermissionError("Only doctors can create prescriptions")
         
-        # Debug: Print the data being validated
-        print("Request data:", self.request.data)
+        logger.debug("Creating prescription from %s", self.request.data)
         
-        serializer.save(doctor=self.request.user)
+        prescription = serializer.save(doctor=self.request.user)
+        items = list(prescription.items.all())
+        aggregates.apply(None, aggregates.snapshot(prescription, [item.medicine_name for item in items]))
+        audit_log.record(audit_log.event('created', prescription, self.request.user,
+                                         after=audit_log.prescription_state(prescription, items)))
 
-class PrescriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PrescriptionDetailView(SparseQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PrescriptionSerializer
     permission_classes = [IsAuthenticated]
     
@@ -51,22 +90,64 @@ class PrescriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
             return Prescription.objects.all()
         return Prescription.objects.none()
     
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Finished prescriptions may have moved to the archive; they are read-only there
+            archived = (archived_prescriptions(request.user).select_related('doctor', 'patient', 'filled_by')
+                        .filter(pk=kwargs['pk']).first())
+            if archived is None:
+                raise
+            return Response(ArchivedPrescriptionSerializer(archived, context=self.get_serializer_context()).data)
+    
     def perform_update(self, serializer):
-        prescription = self.get_object()
         user = self.request.user
-        
-        # Only doctors can edit their own prescriptions
-        if user.user_type == 'doctor' and prescription.doctor == user:
-            serializer.save()
-        # Only pharmacists can fill prescriptions
-        elif user.user_type == 'pharmacist' and 'status' in serializer.validated_data:
-            if serializer.validated_data['status'] == 'filled':
-                from django.utils import timezone
-                serializer.save(filled_by=user, filled_date=timezone.now())
+        with transaction.atomic():
+            # Locked (on SQLite the transaction holds the write lock), so concurrent
+            # changes are counted one after another rather than both from the same state
+            prescription = self.get_queryset().select_for_update().get(pk=serializer.instance.pk)
+            serializer.instance = prescription
+            was_status = prescription.status
+            items = list(prescription.items.all())
+            before = aggregates.snapshot(prescription, [item.medicine_name for item in items])
+            audited = audit_log.prescription_state(prescription, items)
+            
+            # Only doctors can edit their own prescriptions
+            if user.user_type == 'doctor' and prescription.doctor == user:
+                prescription = serializer.save()
+            # Only pharmacists can fill prescriptions
+            elif user.user_type == 'pharmacist' and 'status' in serializer.validated_data:
+                if serializer.validated_data['status'] == 'filled':
+                    prescription = serializer.save(filled_by=user, filled_date=timezone.now())
+                else:
+                    prescription = serializer.save()
             else:
-                serializer.save()
-        else:
-            raise PermissionError("Permission denied")
+                raise PermissionError("Permission denied")
+            
+            items = list(prescription.items.all())
+            aggregates.apply(before, aggregates.snapshot(prescription, [item.medicine_name for item in items]))
+        status_changed = prescription.status != was_status and prescription.status in ('issued', 'filled', 'cancelled')
+        audit_log.record(audit_log.event(prescription.status if status_changed else 'updated', prescription, user,
+                                         audited, audit_log.prescription_state(prescription, items)))
+        
+        # Tokens handed out for the issued version no longer describe it
+        if was_status == 'issued':
+            revoke(prescription, prescription.status if prescription.status in ('filled', 'cancelled') else 'updated')
+    
+    def perform_destroy(self, instance):
+        items = list(instance.items.all())
+        before = aggregates.snapshot(instance, [item.medicine_name for item in items])
+        # Built while the instance still has its primary key
+        event = audit_log.event('deleted', instance, self.request.user, audit_log.prescription_state(instance, items))
+        with transaction.atomic():
+            _, deleted = instance.delete()
+            if not deleted.get(Prescription._meta.label):
+                return  # Deleted by another request, which counted it
+            aggregates.apply(before, None)
+        audit_log.record(event)
+        if instance.status == 'issued':
+            revoke(instance, 'deleted')
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -80,6 +161,20 @@ def get_patients(request):
     serializer = UserBasicSerializer(patients, many=True)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_patient_list(request):
+    """Typeahead: top matches for ?q= by username, name or phone prefix"""
+    if request.user.user_type != 'doctor':
+        return Response({'error': 'Only doctors can search patients'},
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(search_patients(request.query_params.get('q', ''), limit))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def issue_prescription(request, pk):
@@ -94,13 +189,19 @@ def issue_prescription(request, pk):
         return Response({'error': 'Only draft prescriptions can be issued'}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    from django.utils import timezone
-    prescription.status = 'issued'
-    prescription.issued_date = timezone.now()
-    prescription.save()
+    before = aggregates.snapshot(prescription, with_items=False)
+    audited = audit_log.prescription_state(prescription, with_items=False)
+    with transaction.atomic():
+        if not transition(prescription, 'draft', status='issued', issued_date=timezone.now()):
+            return changed_meanwhile()
+        aggregates.apply(before, aggregates.snapshot(prescription, with_items=False))
+    audit_log.record(audit_log.event('issued', prescription, request.user, audited,
+                                     audit_log.prescription_state(prescription, with_items=False)))
     
     serializer = PrescriptionSerializer(prescription)
-    return Response(serializer.data)
+    data = dict(serializer.data)
+    data['token'] = mint_token(prescription)
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -112,11 +213,177 @@ def fill_prescription(request, pk):
     
     prescription = get_object_or_404(Prescription, pk=pk, status='issued')
     
-    from django.utils import timezone
-    prescription.status = 'filled'
-    prescription.filled_by = request.user
-    prescription.filled_date = timezone.now()
-    prescription.save()
+    before = aggregates.snapshot(prescription, with_items=False)
+    audited = audit_log.prescription_state(prescription, with_items=False)
+    with transaction.atomic():
+        # Only one of two pharmacists filling at once gets the row
+        if not transition(prescription, 'issued', status='filled', filled_by=request.user,
+                          filled_date=timezone.now()):
+            return changed_meanwhile()
+        aggregates.apply(before, aggregates.snapshot(prescription, with_items=False))
+    audit_log.record(audit_log.event('filled', prescription, request.user, audited,
+                                     audit_log.prescription_state(prescription, with_items=False)))
+    revoke(prescription, 'filled')
     
     serializer = PrescriptionSerializer(prescription)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def prescription_token(request, pk):
+    """Fresh signed token (QR payload) for an issued prescription"""
+    if request.user.user_type == 'doctor':
+        prescription = get_object_or_404(Prescription, pk=pk, doctor=request.user)
+    elif request.user.user_type == 'patient':
+        prescription = get_object_or_404(Prescription, pk=pk, patient=request.user)
+    else:
+        return Response({'error': 'Only the prescribing doctor or the patient can get a token'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    if prescription.status != 'issued':
+        return Response({'error': 'Only issued prescriptions have tokens'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'prescription_id': prescription.prescription_id, 'token': mint_token(prescription)})
+
+@api_view(['POST'])
+@authentication_classes([JWTStatelessUserAuthentication])
+@permission_classes([IsAuthenticated])
+def verify_prescription_token(request):
+    """Check a prescription token from the signature and cached revocations alone"""
+    token = request.data.get('token')
+    if not isinstance(token, str) or not token:
+        return Response({'error': 'token is required'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    claims, reason = verify_token(token)
+    if claims is None:
+        return Response({'valid': False, 'reason': reason})
+    return Response({
+        'valid': True,
+        'prescription_id': claims['rx'],
+        'patient_id': claims['pt'],
+        'doctor_id': claims['dr'],
+        'status': claims['s'],
+        'items_digest': claims['d'],
+        'issued_at_ms': claims['iat'],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def revocation_list(request):
+    """Revocations for verifiers that keep their own copy, paged by ``revoked_at``.
+
+    Pass the ``next_since`` of the last complete sync as ``?since=``; rows
+    from ``OVERLAP_SECONDS`` before it are sent again, so rows committed out
+    of order are not missed (apply them idempotently). While ``complete`` is
+    false, pass ``next_since`` and ``next_after`` back to get the next page.
+    ``expired`` means the cursor is older than the prune horizon: revocations
+    may have been pruned since, so drop the local copy and keep what is sent.
+    """
+    if request.user.user_type != 'pharmacist' and not request.user.is_staff:
+        return Response({'error': 'Only pharmacists can sync revocations'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    since = after = None
+    try:
+        if request.query_params.get('since'):
+            since = parse_datetime(request.query_params['since'])
+        if request.query_params.get('after'):
+            after = int(request.query_params['after'])
+    except ValueError:
+        since = None
+    if request.query_params.get('since') and since is None:
+        return Response({'error': 'since must be an ISO 8601 datetime'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    if after is not None and since is None:
+        return Response({'error': 'after must be an integer sent with since'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    
+    oldest, start = revocation_window(since)
+    expired = since is not None and since < oldest
+    rows = PrescriptionRevocation.objects.filter(revoked_at__gte=oldest)
+    if after is not None and not expired:
+        # Next page of one sync: strictly after the last row sent
+        rows = rows.filter(Q(revoked_at__gt=since) | Q(revoked_at=since, id__gt=after))
+    else:
+        rows = rows.filter(revoked_at__gte=start)
+    rows = list(rows.order_by('revoked_at', 'id').values('id', 'prescription_id', 'reason', 'revoked_at')[:REVOCATION_PAGE_SIZE])
+    complete = len(rows) < REVOCATION_PAGE_SIZE
+    data = {
+        'revocations': rows,
+        'next_since': rows[-1]['revoked_at'] if rows else (None if expired else since),
+        'complete': complete,
+        'expired': expired,
+        'horizon': oldest,
+    }
+    if not complete:
+        data['next_after'] = rows[-1]['id']
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_prescriptions(request):
+    """Stream prescriptions with their items as NDJSON or CSV.
+
+    Archived prescriptions the caller could list are included, flagged
+    ``archived``, unless ``?include_archived=0``.
+    """
+    output = request.query_params.get('output', 'ndjson')
+    if output not in FORMATS:
+        return Response({'error': f"output must be one of: {', '.join(FORMATS)}"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    if request.user.is_staff:
+        queryset, archived = Prescription.objects.all(), ArchivedPrescription.objects.all()
+    else:
+        queryset = listed_prescriptions(request.user)
+        # Pharmacists list issued prescriptions only, and those are never archived
+        archived = (ArchivedPrescription.objects.none() if request.user.user_type == 'pharmacist'
+                    else archived_prescriptions(request.user))
+    if request.query_params.get('include_archived') in ('0', 'false'):
+        archived = None
+    filters = {}
+    if request.query_params.get('status'):
+        filters['status'] = request.query_params['status']
+    if request.query_params.get('since'):
+        since = parse_datetime(request.query_params['since'])
+        if since is None:
+            return Response({'error': 'since must be an ISO 8601 datetime'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        filters['created_at__gte'] = since
+    queryset = queryset.filter(**filters)
+    if archived is not None:
+        archived = archived.filter(**filters)
+    
+    compress = request.query_params.get('gzip') in ('1', 'true')
+    response = StreamingHttpResponse(
+        export_stream(queryset, output, compress, archived=archived),
+        content_type='application/gzip' if compress else f"{FORMATS[output]}; charset=utf-8",
+    )
+    filename = f"prescriptions.{output}{'.gz' if compress else ''}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_prescriptions(request):
+    """Bulk import prescriptions from an uploaded NDJSON or CSV file (staff only)"""
+    if not request.user.is_staff:
+        return Response({'error': 'Only staff can import prescriptions'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    source = request.FILES.get('file')
+    if source is None:
+        return Response({'error': 'Upload the data as "file"'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    input_format = request.data.get('input_format') or detect_format(source.name)
+    if input_format not in ('ndjson', 'csv'):
+        return Response({'error': 'input_format must be ndjson or csv'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+    
+    report = import_records(read_records(source.file, input_format), dry_run=dry_run, max_errors=100)
+    report['dry_run'] = dry_run
+    return Response(report, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
@@ -1,6 +1,25 @@
+import os
+import sys
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def serving():
+    """True in processes that serve requests, not in migrate, test or other management commands"""
+    if os.environ.get('MEDIAUTH_SERVER') == '1':
+        return True
+    # runserver's autoreloader imports the project twice; only its child serves
+    return sys.argv[1:2] == ['runserver'] and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import search
+
+        options = settings.PATIENT_SEARCH
+        if options['IN_MEMORY'] and options['WARM_ON_START'] and serving():
+            search.warm_in_background()
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from analytics.aggregates import rebuild
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import generate_dataset
+from ocrservice.models import PrescriptionUpload
+from prescriptions.models import Prescription
+
+# What the frontend fetched after login, per role
+MULTI_CALL = {
+    'doctor': ['/api/users/profile/', '/api/prescriptions/', '/api/prescriptions/patients/'],
+    'patient': ['/api/users/profile/', '/api/prescriptions/', '/api/ocr/upload/'],
+    'pharmacist': ['/api/users/profile/', '/api/prescriptions/'],
+}
+DASHBOARD = ['/api/dashboard/']
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the role dashboard against the separate profile, prescription, upload "
+            "and patient calls it replaces: latency, queries and bytes per page load.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--prescriptions', type=int, default=20000)
+        parser.add_argument('--uploads', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def page_load(self, client, urls):
+        """Fetch ``urls`` one after another, as the browser would; returns (ms, queries, bytes)"""
+        size = 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for url in urls:
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+                size += len(response.content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, len(queries.captured_queries), size
+
+    def measure(self, client, urls, iterations):
+        self.page_load(client, urls)  # warm-up
+        samples, queries, size = [], 0, 0
+        for _ in range(iterations):
+            elapsed, queries, size = self.page_load(client, urls)
+            samples.append(elapsed)
+        return {'requests': len(urls), 'latency_ms': summarize(samples), 'queries': queries, 'bytes': size}
+
+    def handle(self, *args, **options):
+        with isolated_environment():
+            dataset = generate_dataset(doctors=5, patients=options['patients'], pharmacists=3,
+                                       prescriptions=options['prescriptions'], uploads=options['uploads'],
+                                       seed=options['seed'])
+            # Give the measured users realistic amounts of their own data
+            patient, doctor = dataset['patient'][0], dataset['doctor'][0]
+            sample = list(Prescription.objects.values_list('pk', flat=True)[:50])
+            Prescription.objects.filter(pk__in=sample).update(patient=patient)
+            sample = list(PrescriptionUpload.objects.values_list('pk', flat=True)[:40])
+            PrescriptionUpload.objects.filter(pk__in=sample).update(patient=patient)
+            PrescriptionUpload.objects.filter(pk__in=sample[:5]).update(status='processing')
+            rebuild()
+
+            roles = {}
+            for role, user in (('doctor', doctor), ('patient', patient), ('pharmacist', dataset['pharmacist'][0])):
+                client = APIClient()
+                # Real bearer tokens, so every call pays for authentication as in production
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+                multi = self.measure(client, MULTI_CALL[role], options['iterations'])
+                single = self.measure(client, DASHBOARD, options['iterations'])
+                roles[role] = {
+                    'multi_call': multi,
+                    'dashboard': single,
+                    'speedup_p50': round(multi['latency_ms']['p50'] / single['latency_ms']['p50'], 1),
+                }
+
+        write_report({
+            'benchmark': 'dashboard',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('patients', 'prescriptions', 'uploads', 'iterations', 'seed')},
+            'roles': roles,
+        }, options['output'], self.stdout)
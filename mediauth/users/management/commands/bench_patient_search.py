@@ -0,0 +1,90 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from mediauth.bench import describe_environment, isolated_environment, summarize, write_report
+from mediauth.synthetic import FIRST_NAMES, LAST_NAMES, generate_dataset
+from users.models import User
+from users.search import patient_index, search_database
+
+
+class Command(BaseCommand):
+    help = ("Benchmark patient typeahead: index warm-up, then per-query latency of the in-memory "
+            "prefix index against the database fallback and the full patient dump it replaces.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def sample_queries(self, rng, patients):
+        """Prefixes of usernames, names, phones and two-term name queries"""
+        queries = []
+        for _ in range(self.options['queries']):
+            patient = rng.choice(patients)
+            kind = rng.randrange(4)
+            if kind == 0:
+                queries.append(patient.username[:rng.randint(3, len(patient.username))])
+            elif kind == 1:
+                queries.append(rng.choice(FIRST_NAMES + LAST_NAMES)[:rng.randint(1, 4)])
+            elif kind == 2:
+                queries.append(patient.phone_number[:rng.randint(3, 8)])
+            else:
+                queries.append(f"{patient.first_name[:3]} {patient.last_name[:2]}")
+        return queries
+
+    def time_queries(self, search, queries):
+        samples, hits = [], 0
+        with CaptureQueriesContext(connection) as captured:
+            for query in queries:
+                started = time.perf_counter()
+                hits += len(search(query, self.options['limit']))
+                samples.append((time.perf_counter() - started) * 1000)
+        return {'latency_ms': summarize(samples), 'results': hits, 'queries': len(captured.captured_queries)}
+
+    def handle(self, *args, **options):
+        self.options = options
+        rng = random.Random(options['seed'])
+        with isolated_environment(), override_settings(PATIENT_SEARCH={
+            'IN_MEMORY': True, 'REFRESH_SECONDS': 3600, 'SCAN_LIMIT': 5000, 'OVERLAP_SECONDS': 60,
+        }):
+            dataset = generate_dataset(doctors=1, patients=options['patients'], pharmacists=0, prescriptions=0,
+                                       uploads=0, seed=options['seed'])
+            queries = self.sample_queries(rng, dataset['patient'])
+
+            patient_index.reset()
+            started = time.perf_counter()
+            patient_index.ensure_loaded()
+            warm_ms = (time.perf_counter() - started) * 1000
+            entries = len(patient_index.keys)
+            in_memory = self.time_queries(patient_index.search, queries)
+            database = self.time_queries(search_database, queries[:max(1, len(queries) // 10)])
+
+            patient = dataset['patient'][0]
+            started = time.perf_counter()
+            patient.first_name = 'Zephyr'
+            patient_index.update(patient)
+            update_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            dump = list(User.objects.filter(user_type='patient')
+                        .values('id', 'username', 'first_name', 'last_name', 'user_type'))
+            dump_ms = (time.perf_counter() - started) * 1000
+            patient_index.reset()
+
+        write_report({
+            'benchmark': 'patient_search',
+            'environment': describe_environment(),
+            'config': {key: options[key] for key in ('patients', 'queries', 'limit', 'seed')},
+            'index_entries': entries,
+            'warm_ms': round(warm_ms, 1),
+            'incremental_update_ms': round(update_ms, 3),
+            'in_memory': in_memory,
+            'database': database,
+            'full_dump': {'ms': round(dump_ms, 1), 'rows': len(dump)},
+        }, options['output'], self.stdout)
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:21
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_phone_digits(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    batch = []
+    for user in User.objects.exclude(phone_number='').only('id', 'phone_number').iterator(chunk_size=2000):
+        user.phone_digits = re.sub(r'[^0-9]', '', user.phone_number)
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    User.objects.bulk_update(batch, ['phone_digits'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_phone_idx',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, max_length=15),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['phone_digits'], name='users_phone_digits_idx'),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+    ]
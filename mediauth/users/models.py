@@ -1,6 +1,11 @@
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+from .search import phone_key
+
+# Saving any of these changes what patient search finds
+SEARCH_FIELDS = {'username', 'first_name', 'last_name', 'phone_number', 'user_type'}
 
 class User(AbstractUser):
     USER_TYPES = (
@@ -12,6 +17,26 @@ class User(AbstractUser):
     user_type = models.CharField(max_length=20, choices=USER_TYPES, default='patient')
     phone_number = models.CharField(max_length=15, blank=True)
     license_number = models.CharField(max_length=50, blank=True, null=True)
+    # Digits of phone_number, so formatted numbers match digit queries
+    phone_digits = models.CharField(max_length=15, blank=True, editable=False)
+    # Lets other processes' patient indexes pick up changes (users.search)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta(AbstractUser.Meta):
+        # Prefix ranges for patient search (users.search.search_database)
+        indexes = [
+            models.Index(Lower('username'), name='users_username_lower_idx'),
+            models.Index(Lower('first_name'), name='users_first_name_lower_idx'),
+            models.Index(Lower('last_name'), name='users_last_name_lower_idx'),
+            models.Index(fields=['phone_digits'], name='users_phone_digits_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.phone_digits = phone_key(self.phone_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and SEARCH_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'phone_digits', 'updated_at'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.username} ({self.user_type})"
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""Patient typeahead over username, first/last name and phone number.
+
+Each process keeps a sorted list of lower-cased search keys (one per
+non-empty username, first name, last name and phone digits) next to the
+patient ids they belong to. A prefix query is a binary search followed by
+a short forward scan, so lookups stay in the low milliseconds at hundreds
+of thousands of patients and never touch the database.
+
+Server processes load the index on a background thread as they start
+(``PATIENT_SEARCH['WARM_ON_START']``, see ``UsersConfig.ready``); elsewhere
+it loads on first use. It follows saves and deletes in this process
+through signals. Changes made by other processes are picked up at
+most every ``PATIENT_SEARCH['REFRESH_SECONDS']``: users whose ``updated_at``
+is newer than the last look (less ``OVERLAP_SECONDS``, for transactions
+that commit late) are re-indexed, or dropped if they are no longer
+patients. Deleted patients are only noticed by their absence, so whenever
+the patient count disagrees with the index, patient ids are compared in
+full. With ``PATIENT_SEARCH['IN_MEMORY']`` off, ``search_database`` answers
+the same queries from the indexes on ``users_user``.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+NON_DIGITS = re.compile(r'[^0-9]')
+PHONE_QUERY = re.compile(r'^\+?[0-9][0-9 ()-]*$')
+MAX_LIMIT = 50
+
+logger = logging.getLogger(__name__)
+
+
+def phone_key(value):
+    return NON_DIGITS.sub('', value or '')
+
+
+def search_keys(username, first_name, last_name, phone_number):
+    """Distinct lower-cased keys a patient can be found by"""
+    keys = {(username or '').lower(), (first_name or '').lower(), (last_name or '').lower(),
+            phone_key(phone_number)}
+    keys.discard('')
+    # Names repeat a lot across patients; share one string per distinct key
+    return tuple(sys.intern(key) for key in keys)
+
+
+def query_terms(query):
+    """Lower-cased terms of a query; phone-looking terms are reduced to digits"""
+    terms = []
+    for term in (query or '').lower().split():
+        term = phone_key(term) if PHONE_QUERY.match(term) else term
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _result(user_id, username, first_name, last_name):
+    return {'id': user_id, 'username': username, 'first_name': first_name,
+            'last_name': last_name, 'user_type': 'patient'}
+
+
+class PatientIndex:
+    """Sorted ``keys`` with the patient id of each key at the same position in ``ids``"""
+
+    FIELDS = ('id', 'username', 'first_name', 'last_name', 'phone_number')
+
+    def __init__(self):
+        self.keys = []
+        self.ids = []
+        self.patients = {}
+        self.changed_since = None
+        self.loaded = False
+        self.refreshed_at = None
+        self.lock = threading.RLock()
+
+    def _queryset(self):
+        from .models import User
+
+        return User.objects.filter(user_type='patient').order_by('id').values_list(*self.FIELDS)
+
+    def ensure_loaded(self):
+        if self.loaded:
+            self.refresh()
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            self.changed_since = timezone.now()
+            pairs = []
+            for user_id, username, first_name, last_name, phone in self._queryset().iterator(chunk_size=10000):
+                keys = search_keys(username, first_name, last_name, phone)
+                self.patients[user_id] = (username, first_name, last_name, keys)
+                pairs.extend((key, user_id) for key in keys)
+            pairs.sort()
+            self.keys = [key for key, _ in pairs]
+            self.ids = [user_id for _, user_id in pairs]
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Apply changes other processes made since the last look, at most once per interval"""
+        from .models import User
+
+        now = time.monotonic()
+        if now - self.refreshed_at < settings.PATIENT_SEARCH['REFRESH_SECONDS']:
+            return
+        if not self.lock.acquire(blocking=False):
+            return  # another thread is refreshing
+        try:
+            started = timezone.now()
+            since = self.changed_since - timedelta(seconds=settings.PATIENT_SEARCH['OVERLAP_SECONDS'])
+            changed = (User.objects.filter(updated_at__gte=since).order_by('id')
+                       .values_list('user_type', *self.FIELDS))
+            for user_type, user_id, username, first_name, last_name, phone in changed:
+                self._discard(user_id)
+                if user_type == 'patient':
+                    self._add(user_id, username, first_name, last_name, phone)
+            patients = User.objects.filter(user_type='patient')
+            if patients.count() != len(self.patients):
+                live = set(patients.values_list('id', flat=True))
+                for user_id in set(self.patients) - live:
+                    self._discard(user_id)
+                for row in self._queryset().filter(id__in=live - set(self.patients)):
+                    self._add(*row)
+            self.changed_since = started
+            self.refreshed_at = now
+        finally:
+            self.lock.release()
+
+    def _add(self, user_id, username, first_name, last_name, phone):
+        keys = search_keys(username, first_name, last_name, phone)
+        self.patients[user_id] = (username, first_name, last_name, keys)
+        for key in keys:
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, user_id)
+
+    def _discard(self, user_id):
+        patient = self.patients.pop(user_id, None)
+        if patient is None:
+            return
+        for key in patient[3]:
+            start, end = bisect_left(self.keys, key), bisect_right(self.keys, key)
+            for position in range(start, end):
+                if self.ids[position] == user_id:
+                    del self.keys[position]
+                    del self.ids[position]
+                    break
+
+    def update(self, user):
+        """Reflect a saved user: (re)index patients, drop anyone who is not one"""
+        if not self.loaded:
+            return  # picked up by the initial load
+        with self.lock:
+            self._discard(user.id)
+            if user.user_type == 'patient':
+                self._add(user.id, user.username, user.first_name, user.last_name, user.phone_number)
+
+    def discard(self, user_id):
+        if self.loaded:
+            with self.lock:
+                self._discard(user_id)
+
+    def _matches(self, user_id, terms):
+        keys = self.patients[user_id][3]
+        return all(any(key.startswith(term) for key in keys) for term in terms)
+
+    def search(self, query, limit=10):
+        """Up to ``limit`` patients matching every term of ``query``, ordered by matched key"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        self.ensure_loaded()
+        # Scan on the most selective (longest) term, check the rest per patient
+        lead = max(terms, key=len)
+        others = [term for term in terms if term != lead]
+        scan_limit = settings.PATIENT_SEARCH['SCAN_LIMIT']
+        results, seen = [], set()
+        with self.lock:
+            position = bisect_left(self.keys, lead)
+            end = min(len(self.keys), position + scan_limit)
+            while position < end and len(results) < limit and self.keys[position].startswith(lead):
+                user_id = self.ids[position]
+                position += 1
+                if user_id in seen or (others and not self._matches(user_id, others)):
+                    continue
+                seen.add(user_id)
+                username, first_name, last_name, _ = self.patients[user_id]
+                results.append(_result(user_id, username, first_name, last_name))
+        return results
+
+    def reset(self):
+        with self.lock:
+            self.keys = []
+            self.ids = []
+            self.patients = {}
+            self.changed_since = None
+            self.loaded = False
+            self.refreshed_at = None
+
+
+patient_index = PatientIndex()
+
+
+def warm_in_background():
+    """Load ``patient_index`` on a daemon thread; returns the thread"""
+    def load():
+        from django.db import connection
+
+        try:
+            patient_index.ensure_loaded()
+        except Exception:
+            logger.exception("Could not preload the patient index; it will load on first search")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=load, name='patient-index-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def search_database(query, limit=10):
+    """Same matching as ``PatientIndex.search``, answered by the database.
+
+    Each term becomes a range condition on the lower-cased columns and
+    phone digits, which the indexes on ``users_user`` serve.
+    """
+    from .models import User
+
+    terms = query_terms(query)
+    if not terms:
+        return []
+    queryset = User.objects.filter(user_type='patient').annotate(
+        username_key=Lower('username'), first_name_key=Lower('first_name'), last_name_key=Lower('last_name'),
+    )
+    for term in terms:
+        upper = term + '\uffff'
+        condition = Q()
+        for field in ('username_key', 'first_name_key', 'last_name_key'):
+            condition |= Q(**{f"{field}__gte": term, f"{field}__lt": upper})
+        if term.isdigit():
+            condition |= Q(phone_digits__gte=term, phone_digits__lt=upper)
+        queryset = queryset.filter(condition)
+    rows = queryset.order_by('username_key').values_list('id', 'username', 'first_name', 'last_name')[:limit]
+    return [_result(*row) for row in rows]
+
+
+def search_patients(query, limit=10):
+    limit = max(1, min(limit, MAX_LIMIT))
+    if settings.PATIENT_SEARCH['IN_MEMORY']:
+        return patient_index.search(query, limit)
+    return search_database(query, limit)
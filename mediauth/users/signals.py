@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import User
+from .search import patient_index
+
+
+@receiver(post_save, sender=User)
+def index_patient(sender, instance, **kwargs):
+    patient_index.update(instance)
+
+
+@receiver(post_delete, sender=User)
+def unindex_patient(sender, instance, **kwargs):
+    patient_index.discard(instance.id)
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import os
+from unittest import mock
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APITestCase
+from mediauth.throttling import consume, get_store, parse_rate
+from .models import User
+from . import search
+from .apps import serving
+from .search import PatientIndex, search_database
 
-# Create your tests here.
+SEARCH = {'IN_MEMORY': True, 'REFRESH_SECONDS': 0, 'SCAN_LIMIT': 5000, 'OVERLAP_SECONDS': 60}
+
+
+def ids(results):
+    return sorted(result['id'] for result in results)
+
+
+@override_settings(PATIENT_SEARCH=SEARCH)
+class PatientIndexTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', first_name='Alice', last_name='Moreno',
+                                              phone_number='(555) 010-2030', user_type='patient')
+        self.bob = User.objects.create_user('bob', first_name='Bob', last_name='Morales',
+                                            phone_number='5550104444', user_type='patient')
+        User.objects.create_user('doc', first_name='Morgan', user_type='doctor')
+        # Stands in for another process's index: it only learns about changes from the database
+        self.index = PatientIndex()
+
+    def test_prefix_search_over_names_and_phone(self):
+        self.assertEqual(ids(self.index.search('mor')), [self.alice.id, self.bob.id])
+        self.assertEqual(ids(self.index.search('mor ali')), [self.alice.id])
+        self.assertEqual(ids(self.index.search('555-0102')), [self.alice.id])
+        self.assertEqual(ids(self.index.search('555')), [self.alice.id, self.bob.id])
+        self.assertEqual(self.index.search('   '), [])
+
+    def test_refresh_follows_renames(self):
+        self.index.ensure_loaded()
+        self.alice.last_name = 'Quinn'
+        self.alice.save()
+        self.assertEqual(ids(self.index.search('mor')), [self.bob.id])
+        self.assertEqual(ids(self.index.search('quinn')), [self.alice.id])
+
+    def test_refresh_follows_type_changes_and_deletions(self):
+        self.index.ensure_loaded()
+        self.bob.user_type = 'pharmacist'
+        self.bob.save(update_fields=['user_type'])
+        self.assertEqual(ids(self.index.search('mor')), [self.alice.id])
+        self.alice.delete()
+        self.assertEqual(self.index.search('mor'), [])
+
+    def test_refresh_adds_new_patients(self):
+        self.index.ensure_loaded()
+        carol = User.objects.create_user('carol', last_name='Moreau', user_type='patient')
+        self.assertEqual(ids(self.index.search('mor')), sorted([self.alice.id, self.bob.id, carol.id]))
+
+    def test_database_search_matches_the_index(self):
+        for query in ('mor', 'MOR ali', '555', '555-0104', 'bob 555', 'morgan', 'zz'):
+            with self.subTest(query=query):
+                self.assertEqual(ids(search_database(query)), ids(self.index.search(query)))
+
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_only_processes_that_serve_requests_warm_up(self):
+        unset = {name: value for name, value in os.environ.items() if name not in ('MEDIAUTH_SERVER', 'RUN_MAIN')}
+        cases = [
+            (['manage.py', 'migrate'], {}, False),
+            (['manage.py', 'test'], {}, False),
+            (['manage.py', 'runserver'], {}, False),
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+            (['manage.py', 'runserver', '--noreload'], {}, True),
+            (['gunicorn', 'mediauth.wsgi'], {'MEDIAUTH_SERVER': '1'}, True),
+        ]
+        for argv, environ, expected in cases:
+            with self.subTest(argv=argv, environ=environ), mock.patch('sys.argv', argv), \
+                    mock.patch.dict(os.environ, {**unset, **environ}, clear=True):
+                self.assertEqual(serving(), expected)
+
+    @mock.patch('users.apps.serving', return_value=True)
+    def test_ready_warms_the_index_when_serving(self, serving):
+        with mock.patch.object(search, 'warm_in_background') as warm:
+            apps.get_app_config('users').ready()
+            with override_settings(PATIENT_SEARCH={**SEARCH, 'WARM_ON_START': False}):
+                apps.get_app_config('users').ready()
+        warm.assert_called_once_with()
+
+    def test_warm_up_loads_off_the_calling_thread(self):
+        with mock.patch.object(search.patient_index, 'ensure_loaded') as load:
+            search.warm_in_background().join()
+        load.assert_called_once_with()
+        with mock.patch.object(search.patient_index, 'ensure_loaded', side_effect=DatabaseError('gone')):
+            with self.assertLogs('users.search', 'ERROR'):
+                search.warm_in_background().join()
+
+class TokenBucketTests(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/min'), (5, 12.0))
+        self.assertEqual(parse_rate('20/hour'), (20, 180.0))
+        self.assertIsNone(parse_rate(''))
+
+    def test_burst_then_even_refill(self):
+        capacity, interval = 3, 10.0
+        full_at = None
+        for _ in range(capacity):
+            full_at, wait = consume(full_at, 100.0, capacity, interval)
+            self.assertEqual(wait, 0.0)
+        refused, wait = consume(full_at, 100.0, capacity, interval)
+        self.assertIsNone(refused)
+        self.assertEqual(wait, 10.0)
+        # One token is back after one interval, and only one
+        full_at, wait = consume(full_at, 110.0, capacity, interval)
+        self.assertEqual(wait, 0.0)
+        self.assertIsNone(consume(full_at, 110.0, capacity, interval)[0])
+
+    def test_idle_bucket_does_not_bank_more_than_capacity(self):
+        full_at, _ = consume(None, 0.0, 2, 1.0)
+        full_at, _ = consume(full_at, 1000.0, 2, 1.0)
+        full_at, _ = consume(full_at, 1000.0, 2, 1.0)
+        self.assertIsNone(consume(full_at, 1000.0, 2, 1.0)[0])
+
+
+def throttling(**rates):
+    return {**settings.THROTTLING, 'ENABLED': True,
+            'RATES': {**settings.THROTTLING['RATES'], 'login': '100/min', 'login_username': '100/min', **rates}}
+
+
+class LoginThrottleTests(APITestCase):
+    url = '/api/users/login/'
+
+    def setUp(self):
+        get_store().clear()
+        User.objects.create_user('alice', password='correct-horse', user_type='patient')
+
+    def login(self, username='alice', password='wrong', address='10.0.0.1', **headers):
+        return self.client.post(self.url, {'username': username, 'password': password}, format='json',
+                                REMOTE_ADDR=address, **headers)
+
+    @override_settings(THROTTLING=throttling(login_username='2/min'))
+    def test_username_bucket_spans_addresses_and_sets_retry_after(self):
+        self.assertEqual(self.login(address='10.0.0.1').status_code, 401)
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 401)
+        response = self.login(username='ALICE', address='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), 30)
+        # Other accounts keep their own bucket
+        self.assertEqual(self.login(username='bob').status_code, 401)
+
+    @override_settings(THROTTLING=throttling(login='2/min'))
+    def test_forwarded_for_does_not_pick_the_ip_bucket(self):
+        for index in range(2):
+            self.assertEqual(self.login(username=f"user{index}", HTTP_X_FORWARDED_FOR=f"1.2.3.{index}").status_code, 401)
+        response = self.login(username='user9', HTTP_X_FORWARDED_FOR='1.2.3.9')
+        self.assertEqual(response.status_code, 429)
+        # A different client address still has its tokens
+        self.assertEqual(self.login(username='user9', address='10.0.0.2').status_code, 401)
+
+    @override_settings(THROTTLING=throttling(login_username='1/min'))
+    def test_non_string_usernames_are_not_throttled_by_name(self):
+        for _ in range(3):
+            response = self.client.post(self.url, {'username': ['alice'], 'password': 'x'}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(THROTTLING={**throttling(login_username='1/min'), 'ENABLED': False})
+    def test_disabled(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login(password='correct-horse').status_code, 200)
@@ -2,7 +2,9 @@ from rest_framework import generics
 from rest_framework.decorators import api_view
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.contrib.auth import get_user_model
+from mediauth.throttling import LoginThrottle, LoginUsernameThrottle, RegisterThrottle, TokenRefreshThrottle
 from .serializers import UserRegistrationSerializer, UserSerializer
 
 User = get_user_model()
@@ -11,6 +13,14 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = UserRegistrationSerializer
+    throttle_classes = (RegisterThrottle,)
+
+class LoginView(TokenObtainPairView):
+    # Each attempt costs a password hash
+    throttle_classes = (LoginThrottle, LoginUsernameThrottle)
+
+class RefreshView(TokenRefreshView):
+    throttle_classes = (TokenRefreshThrottle,)
 
 class ProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer